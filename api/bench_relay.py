@@ -0,0 +1,293 @@
+# bench_relay.py
+#
+# Micro-benchmarks and load tests for the relay. Run from the repo root:
+#   python -m api.bench_relay [routing|head_of_line|tv_fanout|wire ...]
+
+import asyncio
+import json
+import socket
+import statistics
+import sys
+import threading
+import time
+
+from .mailbox import LatestValueMailbox
+from .registry import RobotRegistry
+from . import wire
+
+ROBOT_COUNTS = [1, 2, 4, 8, 16, 32]
+ROUTES_PER_RUN = 200_000
+
+
+class FakeWebSocket:
+    def __init__(self, send_delay_s=0.0):
+        self.send_delay_s = send_delay_s
+        self.latencies_ms = []
+
+    async def send_text(self, text):
+        if self.send_delay_s:
+            await asyncio.sleep(self.send_delay_s)
+        self.latencies_ms.append((time.perf_counter() - float(text)) * 1000.0)
+
+
+def time_per_op_ns(fn, n):
+    start = time.perf_counter_ns()
+    fn(n)
+    return (time.perf_counter_ns() - start) / n
+
+
+def bench_routing(robot_counts=ROBOT_COUNTS, routes=ROUTES_PER_RUN):
+    print("Routing cost per message (ns), looking up the last-registered robot")
+    print(f"{'robots':>8} {'list scan':>12} {'registry':>12}")
+    for count in robot_counts:
+        # legacy layout: list of dicts, linear scan per message
+        connected_robots = [{"websocket": FakeWebSocket(), "robot_number": i} for i in range(1, count + 1)]
+        target = count
+
+        def linear(n):
+            for _ in range(n):
+                for robot in connected_robots:
+                    if robot["robot_number"] == target:
+                        break
+
+        registry = RobotRegistry(max_robots=count)
+        for _ in range(count):
+            registry.register(FakeWebSocket())
+
+        def indexed(n):
+            get = registry.get
+            for _ in range(n):
+                get(target)
+
+        print(f"{count:>8} {time_per_op_ns(linear, routes):>12.1f} {time_per_op_ns(indexed, routes):>12.1f}")
+
+
+async def _joystick_stream(send, robots, rate_hz, duration_s):
+    # phones emit a frame per robot every 1/rate_hz; each frame is stamped with
+    # the time it was emitted, so time spent waiting behind the reader counts
+    period = 1.0 / rate_hz
+    start = time.perf_counter()
+    for tick in range(int(duration_s * rate_hz)):
+        emitted_at = start + tick * period
+        delay = emitted_at - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        for robot in robots:
+            await send(robot, repr(emitted_at))
+
+
+async def _run_head_of_line(use_mailbox, slow_delay_s, rate_hz, duration_s):
+    from .main import robot_sender, send_to_robot
+    from . import main as relay
+
+    registry = RobotRegistry()
+    relay.robot_registry = registry
+    slow = registry.register(FakeWebSocket(send_delay_s=slow_delay_s))
+    fast = [registry.register(FakeWebSocket()) for _ in range(3)]
+    robots = [slow] + fast
+
+    if use_mailbox:
+        for robot in robots:
+            robot.sender_task = asyncio.create_task(robot_sender(robot))
+
+        async def send(robot, text):
+            send_to_robot(robot, text)
+    else:
+        async def send(robot, text):
+            await robot.websocket.send_text(text)
+
+    await _joystick_stream(send, robots, rate_hz, duration_s)
+    await asyncio.sleep(slow_delay_s * 2)
+    for robot in robots:
+        if robot.sender_task:
+            robot.sender_task.cancel()
+
+    fast_latencies = sorted(l for robot in fast for l in robot.websocket.latencies_ms)
+    return fast_latencies, slow.mailbox.stats()
+
+
+def bench_head_of_line(slow_delay_s=0.05, rate_hz=60, duration_s=2.0):
+    print(f"\nFast-robot command latency with one robot taking {slow_delay_s * 1000:.0f} ms per send ({rate_hz} Hz stream)")
+    print(f"{'mode':>10} {'sent':>6} {'p50 ms':>8} {'p99 ms':>8}  slow robot mailbox")
+    for use_mailbox in (False, True):
+        latencies, slow_stats = asyncio.run(_run_head_of_line(use_mailbox, slow_delay_s, rate_hz, duration_s))
+        p50 = statistics.median(latencies)
+        p99 = percentile(latencies, 99)
+        mode = "mailbox" if use_mailbox else "inline"
+        stats = slow_stats if use_mailbox else "-"
+        print(f"{mode:>10} {len(latencies):>6} {p50:>8.2f} {p99:>8.2f}  {stats}")
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return float("nan")
+    index = min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _start_relay_server():
+    # real uvicorn server on its own thread + loop, so clients measure the wire
+    import uvicorn
+    from .main import app
+
+    port = _free_port()
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning"))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server, thread, f"ws://127.0.0.1:{port}"
+
+
+async def _drain(ws):
+    async for _ in ws:
+        pass
+
+
+async def _run_tv_fanout(base_uri, tv_clients, cycles):
+    import websockets
+
+    arrivals = [[] for _ in range(tv_clients)]
+
+    async def tv_client(index, ready):
+        async with websockets.connect(base_uri + "/ws/tv/onloading") as ws:
+            ready.set()
+            async for message in ws:
+                arrivals[index].append((time.perf_counter(), message))
+
+    readies = [asyncio.Event() for _ in range(tv_clients)]
+    tv_tasks = [asyncio.create_task(tv_client(i, readies[i])) for i in range(tv_clients)]
+    await asyncio.gather(*(r.wait() for r in readies))
+
+    async def wait_for_all(expected, since):
+        deadline = time.perf_counter() + 5.0
+        while time.perf_counter() < deadline:
+            if all(any(t >= since and m == expected for t, m in a) for a in arrivals):
+                return
+            await asyncio.sleep(0.001)
+
+    first_mobile = await websockets.connect(base_uri + "/ws/mobile")
+    drains = [asyncio.create_task(_drain(first_mobile))]
+    await wait_for_all("1", 0.0)
+
+    latencies_ms = []
+    for _ in range(cycles):
+        for expected in ("2", "1"):
+            changed_at = time.perf_counter()
+            if expected == "2":
+                second_mobile = await websockets.connect(base_uri + "/ws/mobile")
+                drains.append(asyncio.create_task(_drain(second_mobile)))
+            else:
+                await second_mobile.close()
+            await wait_for_all(expected, changed_at)
+            for a in arrivals:
+                hits = [t for t, m in a if t >= changed_at and m == expected]
+                if hits:
+                    latencies_ms.append((hits[0] - changed_at) * 1000.0)
+
+    await first_mobile.close()
+    for task in tv_tasks + drains:
+        task.cancel()
+    await asyncio.gather(*tv_tasks, *drains, return_exceptions=True)
+    return sorted(latencies_ms)
+
+
+def bench_tv_fanout(tv_clients=48, cycles=20):
+    server, thread, base_uri = _start_relay_server()
+    try:
+        latencies = asyncio.run(_run_tv_fanout(base_uri, tv_clients, cycles))
+    finally:
+        server.should_exit = True
+        thread.join(timeout=5.0)
+    expected = tv_clients * cycles * 2
+    print(f"\nTV status latency, {tv_clients} TVs + 2 phones joining/leaving ({cycles} cycles)")
+    print(f"  delivered {len(latencies)}/{expected} updates")
+    print(f"  p50 {percentile(latencies, 50):.2f} ms  p95 {percentile(latencies, 95):.2f} ms  "
+          f"p99 {percentile(latencies, 99):.2f} ms  max {latencies[-1] if latencies else float('nan'):.2f} ms")
+
+
+def bench_wire(commands=200_000):
+    payload = {"type": "joystick", "userid": 3, "joystick": {"x": -0.73, "y": 0.41}, "ts_ms": 123456789}
+    json_text = json.dumps(payload)
+    json_robot_text = json.dumps(payload["joystick"])
+    frame = wire.encode_joystick(3, 4242, -0.73, 0.41, 123456789)
+
+    def json_encode(n):
+        for _ in range(n):
+            json.dumps(payload)
+
+    def json_relay(n):
+        # what mobile_control does per text message
+        for _ in range(n):
+            msg = json.loads(json_text)
+            if msg.get("type") == "joystick" and "joystick" in msg:
+                json.dumps(msg.get("joystick"))
+
+    def json_decode(n):
+        for _ in range(n):
+            doc = json.loads(json_robot_text)
+            doc["x"], doc["y"]
+
+    def binary_encode(n):
+        for _ in range(n):
+            wire.encode_joystick(3, 4242, -0.73, 0.41, 123456789)
+
+    def binary_relay(n):
+        for _ in range(n):
+            wire.peek_header(frame)
+
+    def binary_decode(n):
+        unpack = wire.JOYSTICK_FRAME.unpack_from
+        for _ in range(n):
+            unpack(frame)
+
+    print("\nJoystick wire format cost per command (ns) and size")
+    print(f"{'format':>8} {'encode':>9} {'relay':>9} {'decode':>9} {'sim->relay B':>13} {'relay->robot B':>15}")
+    print(f"{'json':>8} {time_per_op_ns(json_encode, commands):>9.1f} {time_per_op_ns(json_relay, commands):>9.1f} "
+          f"{time_per_op_ns(json_decode, commands):>9.1f} {len(json_text):>13} {len(json_robot_text):>15}")
+    print(f"{'binary':>8} {time_per_op_ns(binary_encode, commands):>9.1f} {time_per_op_ns(binary_relay, commands):>9.1f} "
+          f"{time_per_op_ns(binary_decode, commands):>9.1f} {len(frame):>13} {len(frame):>15}")
+
+    # one sim tick for both AI robots: two single frames vs one batch. Both paths do what route_binary_frame
+    # does per message: read the header, split a batch into per-robot frames, and hand each frame to its
+    # robot's mailbox
+    batch = wire.encode_joystick_batch([(3, -0.73, 0.41), (4, 0.2, 0.9)], 4242, 123456789)
+    frames = [frame, wire.encode_joystick(4, 4242, 0.2, 0.9, 123456789)]
+    mailboxes = {3: LatestValueMailbox(), 4: LatestValueMailbox()}
+
+    def singles_relay(n):
+        for _ in range(n):
+            for single in frames:
+                msg_type, robot_id = wire.peek_header(single)
+                if msg_type == wire.MSG_JOYSTICK:
+                    mailboxes[robot_id].put(single)
+
+    def batch_relay(n):
+        for _ in range(n):
+            msg_type, _ = wire.peek_header(batch)
+            if msg_type == wire.MSG_JOYSTICK_BATCH:
+                for robot_id, robot_frame in wire.split_joystick_batch(batch):
+                    mailboxes[robot_id].put(robot_frame)
+
+    print("\nOne tick for 2 AI robots, sim->relay (relay = route both commands into the robot mailboxes)")
+    print(f"{'mode':>8} {'messages':>9} {'bytes':>6} {'relay ns':>9}")
+    print(f"{'singles':>8} {2:>9} {2 * len(frame):>6} {time_per_op_ns(singles_relay, commands):>9.1f}")
+    print(f"{'batch':>8} {1:>9} {len(batch):>6} {time_per_op_ns(batch_relay, commands):>9.1f}")
+
+BENCHMARKS = {
+    "routing": bench_routing,
+    "head_of_line": bench_head_of_line,
+    "tv_fanout": bench_tv_fanout,
+    "wire": bench_wire,
+}
+
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
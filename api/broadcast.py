@@ -0,0 +1,79 @@
+# broadcast.py
+
+import asyncio
+import json
+
+DEFAULT_SEND_TIMEOUT_S = 1.0
+
+
+def serialize(payload):
+    return payload if isinstance(payload, str) else json.dumps(payload)
+
+
+async def send_all(targets, text, timeout_s=DEFAULT_SEND_TIMEOUT_S):
+    # anything with an awaitable send_text() works as a target.
+    # returns the targets whose send raised or timed out
+    targets = list(targets)
+    if not targets:
+        return []
+    results = await asyncio.gather(
+        *(asyncio.wait_for(target.send_text(text), timeout_s) for target in targets),
+        return_exceptions=True,
+    )
+    return [target for target, result in zip(targets, results) if isinstance(result, BaseException)]
+
+
+class Broadcaster:
+    """A set of websockets that all receive the same payload.
+
+    The payload is serialized once and sent to every socket concurrently
+    with a per-send timeout. A socket that fails or times out is evicted and
+    closed in the background, so it can't hold up the next broadcast.
+    """
+
+    def __init__(self, name, send_timeout_s=DEFAULT_SEND_TIMEOUT_S, on_evict=None):
+        self.name = name
+        self.send_timeout_s = send_timeout_s
+        self.on_evict = on_evict
+        self._sockets = set()
+        self.broadcasts = 0
+        self.evicted = 0
+
+    def add(self, websocket):
+        self._sockets.add(websocket)
+
+    def remove(self, websocket):
+        self._sockets.discard(websocket)
+
+    def __contains__(self, websocket):
+        return websocket in self._sockets
+
+    def __len__(self):
+        return len(self._sockets)
+
+    async def broadcast(self, payload) -> int:
+        text = serialize(payload)
+        targets = list(self._sockets)
+        failed = await send_all(targets, text, self.send_timeout_s)
+        self.broadcasts += 1
+        for websocket in failed:
+            self._evict(websocket)
+        return len(targets) - len(failed)
+
+    def _evict(self, websocket):
+        if websocket not in self._sockets:
+            return
+        self._sockets.discard(websocket)
+        self.evicted += 1
+        if self.on_evict is not None:
+            self.on_evict(self, websocket)
+        asyncio.create_task(self._close_quietly(websocket))
+
+    async def _close_quietly(self, websocket):
+        try:
+            await asyncio.wait_for(websocket.close(), self.send_timeout_s)
+        except Exception:
+            pass
+
+    def stats(self):
+        return {"subscribers": len(self._sockets), "broadcasts": self.broadcasts, "evicted": self.evicted}
@@ -0,0 +1,125 @@
+# eventlog.py
+
+import asyncio
+import collections
+import itertools
+import json
+import time
+
+LEVELS = {"debug": 10, "info": 20, "warning": 30, "error": 40}
+
+
+def check_level(name):
+    # raises ValueError for a level name that isn't in LEVELS
+    if name not in LEVELS:
+        raise ValueError(f"unknown event log level {name!r}, expected one of {', '.join(LEVELS)}")
+    return name
+
+
+class EventLog:
+    """Structured event log that never blocks the event loop.
+
+    log() only appends a dict to an in-memory ring and a pending buffer. A
+    background task turns the pending buffer into JSON lines and writes them
+    from a worker thread. Hot message types can be sampled so that only one
+    in N events is kept.
+    """
+
+    def __init__(self, path=None, capacity=2000, level="info", sample_rates=None,
+                 flush_interval_s=1.0, max_pending=10000):
+        self.path = path
+        self.level = level
+        self.sample_rates = dict(sample_rates or {})
+        self.flush_interval_s = flush_interval_s
+        self._ring = collections.deque(maxlen=capacity)
+        self._pending = collections.deque(maxlen=max_pending)
+        self._seq = itertools.count(1)
+        self._seen = collections.Counter()
+        self._sampled_out = collections.Counter()
+        self._pending_dropped = 0
+        self._written = 0
+        self._flusher_task = None
+
+    @property
+    def level(self):
+        return self._level_name
+
+    @level.setter
+    def level(self, name):
+        self._min_level = LEVELS[check_level(name)]
+        self._level_name = name
+
+    def log(self, event_type, level="info", **fields):
+        if LEVELS[level] < self._min_level:
+            return
+        self._seen[event_type] += 1
+        rate = self.sample_rates.get(event_type, 1)
+        if rate > 1 and (self._seen[event_type] - 1) % rate:
+            self._sampled_out[event_type] += 1
+            return
+        event = {"seq": next(self._seq), "ts": time.time(), "level": level, "type": event_type}
+        event.update(fields)
+        self._ring.append(event)
+        if self.path:
+            if len(self._pending) == self._pending.maxlen:
+                self._pending_dropped += 1
+            self._pending.append(event)
+
+    def recent(self, limit=100, event_type=None, min_level=None):
+        # filters a copy, so events logged meanwhile can't change the ring under the loop
+        events = list(self._ring)
+        if event_type is not None:
+            events = [e for e in events if e["type"] == event_type]
+        if min_level is not None:
+            threshold = LEVELS[check_level(min_level)]
+            events = [e for e in events if LEVELS[e["level"]] >= threshold]
+        return events[-limit:] if limit else events
+
+    def stats(self):
+        return {
+            "level": self.level,
+            "path": self.path,
+            "buffered": len(self._ring),
+            "pending": len(self._pending),
+            "pending_dropped": self._pending_dropped,
+            "written": self._written,
+            "seen": dict(self._seen),
+            "sampled_out": dict(self._sampled_out),
+        }
+
+    def _write_lines(self, lines):
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(lines)
+
+    async def flush(self):
+        if not self.path or not self._pending:
+            return
+        batch = []
+        while self._pending:
+            batch.append(self._pending.popleft())
+        lines = "".join(json.dumps(e, default=str) + "\n" for e in batch)
+        try:
+            await asyncio.to_thread(self._write_lines, lines)
+            self._written += len(batch)
+        except OSError as e:
+            self._ring.append({"seq": next(self._seq), "ts": time.time(), "level": "error",
+                               "type": "event_log_write_failed", "error": str(e), "lost": len(batch)})
+
+    async def _run_flusher(self):
+        while True:
+            await asyncio.sleep(self.flush_interval_s)
+            await self.flush()
+
+    def start(self):
+        if self._flusher_task is None:
+            self._flusher_task = asyncio.create_task(self._run_flusher())
+
+    async def stop(self):
+        if self._flusher_task is not None:
+            self._flusher_task.cancel()
+            try:
+                await self._flusher_task
+            except asyncio.CancelledError:
+                pass
+            self._flusher_task = None
+        await self.flush()
@@ -0,0 +1,86 @@
+# gamestate.py
+
+from .mailbox import LatestValueMailbox
+
+
+class GameStateSubscription:
+    __slots__ = ("store", "mailbox")
+
+    def __init__(self, store):
+        self.store = store
+        self.mailbox = LatestValueMailbox()
+
+    async def next_state(self):
+        # raises MailboxClosed once unsubscribed
+        return await self.mailbox.get()
+
+    def close(self):
+        self.store.unsubscribe(self)
+
+
+class GameStateStore:
+    """Lobby state shared by the TV and phone endpoints.
+
+    Every mutation publishes a snapshot to all subscribers straight away.
+    Each subscriber has a single-slot mailbox, so a slow TV only ever skips
+    to the newest snapshot instead of building a backlog.
+    """
+
+    def __init__(self, max_connected_users=2):
+        self._state = {
+            "connectedUsers": 0,
+            "maxConnectedUsers": max_connected_users,
+            "difficulty": "",
+        }
+        self._version = 0
+        self._subscribers = set()
+
+    def __getitem__(self, key):
+        return self._state[key]
+
+    @property
+    def version(self):
+        return self._version
+
+    def snapshot(self):
+        return dict(self._state, version=self._version)
+
+    def update(self, **changes):
+        changed = {k: v for k, v in changes.items() if self._state[k] != v}
+        if not changed:
+            return False
+        self._state.update(changed)
+        self._version += 1
+        snapshot = self.snapshot()
+        for subscription in self._subscribers:
+            subscription.mailbox.put(snapshot)
+        return True
+
+    def try_join(self):
+        # returns the new user id, or None if the lobby is full
+        if self._state["connectedUsers"] >= self._state["maxConnectedUsers"]:
+            return None
+        self.update(connectedUsers=self._state["connectedUsers"] + 1)
+        return self._state["connectedUsers"]
+
+    def leave(self):
+        self.update(connectedUsers=max(0, self._state["connectedUsers"] - 1))
+
+    def set_difficulty(self, difficulty):
+        self.update(difficulty=difficulty)
+
+    def subscribe(self):
+        subscription = GameStateSubscription(self)
+        self._subscribers.add(subscription)
+        subscription.mailbox.put(self.snapshot())
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self._subscribers.discard(subscription)
+        subscription.mailbox.close()
+
+    def subscriber_stats(self):
+        return [s.mailbox.stats() for s in self._subscribers]
+
+    def __len__(self):
+        return len(self._subscribers)
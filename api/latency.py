@@ -0,0 +1,39 @@
+# latency.py
+
+import collections
+import time
+
+SAMPLES = 2000
+
+
+class LatencyStats:
+    """Recent latency samples per stage, in ms, with p50/p95/p99.
+
+    Only touched from the event loop, so there's no locking: record() runs in
+    the robot senders and stats() in the async /debug endpoint and at
+    shutdown. Don't read it from a sync (threadpool) endpoint. The relay can't
+    read the simulation's clock, so everything here is relay-local time:
+    perf_counter() when a frame arrived vs when its robot send completed.
+    """
+
+    def __init__(self, samples=SAMPLES):
+        self._samples = collections.defaultdict(lambda: collections.deque(maxlen=samples))
+        self._counts = collections.Counter()
+
+    def record(self, stage, started_at, now=None):
+        if started_at is None:
+            return
+        now = time.perf_counter() if now is None else now
+        self._samples[stage].append((now - started_at) * 1000.0)
+        self._counts[stage] += 1
+
+    def stats(self):
+        stats = {}
+        for stage, samples in self._samples.items():
+            if not samples:
+                continue
+            values = sorted(samples)
+            pick = lambda q: round(values[min(len(values) - 1, int(q * len(values)))], 3)
+            stats[stage] = {"n": self._counts[stage], "p50": pick(0.50), "p95": pick(0.95),
+                            "p99": pick(0.99), "max": round(values[-1], 3)}
+        return stats
@@ -0,0 +1,77 @@
+# mailbox.py
+
+import asyncio
+import time
+
+
+class MailboxClosed(Exception):
+    pass
+
+
+class LatestValueMailbox:
+    """Single-slot mailbox where the newest value always wins.
+
+    A put() on a full slot replaces the pending value instead of queueing it,
+    so a reader that falls behind only ever sees the latest command.
+    delivered_put_at is the put time (perf_counter, or the caller's put_at)
+    of the value get() returned last.
+    """
+
+    def __init__(self):
+        self._value = None
+        self._has_value = False
+        self._put_at = None
+        self.delivered_put_at = None
+        self._closed = False
+        self._event = asyncio.Event()
+        self.puts = 0
+        self.delivered = 0
+        self.overwrites = 0
+        self.drops = 0
+
+    def put(self, value, put_at=None) -> bool:
+        if self._closed:
+            self.drops += 1
+            return False
+        self.puts += 1
+        if self._has_value:
+            self.overwrites += 1
+        self._value = value
+        self._put_at = time.perf_counter() if put_at is None else put_at
+        self._has_value = True
+        self._event.set()
+        return True
+
+    async def get(self):
+        while not self._has_value:
+            if self._closed:
+                raise MailboxClosed()
+            self._event.clear()
+            await self._event.wait()
+        value = self._value
+        self.delivered_put_at = self._put_at
+        self._value = None
+        self._has_value = False
+        self.delivered += 1
+        return value
+
+    def close(self):
+        # a value still sitting in the slot will never be sent
+        if self._has_value:
+            self.drops += 1
+            self._value = None
+            self._has_value = False
+        self._closed = True
+        self._event.set()
+
+    @property
+    def closed(self):
+        return self._closed
+
+    def stats(self):
+        return {
+            "puts": self.puts,
+            "delivered": self.delivered,
+            "overwrites": self.overwrites,
+            "drops": self.drops,
+        }
@@ -1,22 +1,98 @@
 # main.py
 
 import asyncio
-from fastapi import FastAPI, WebSocket, WebSocketDisconnect
+from fastapi import FastAPI, HTTPException, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
 import re
 import json
+import os
+import time
+
+from .broadcast import Broadcaster
+from .eventlog import LEVELS, EventLog, check_level
+from .gamestate import GameStateStore
+from .latency import LatencyStats
+from .mailbox import MailboxClosed
+from .registry import RobotRegistry
+from . import wire
 
 app = FastAPI()
 
-connectedUsers = 0
+# hot message types are sampled, 1 in N kept
+EVENT_LOG_SAMPLE_RATES = {
+    "mobile_message": 60,
+    "robot_command": 60,
+    "robot_message": 20,
+}
+
+try:
+    EVENT_LOG_LEVEL = check_level(os.environ.get("RELAY_EVENT_LOG_LEVEL", "debug"))
+except ValueError as e:
+    raise SystemExit(f"RELAY_EVENT_LOG_LEVEL: {e}") from None
+
+event_log = EventLog(
+    path=os.environ.get("RELAY_EVENT_LOG_PATH", "relay_events.jsonl"),
+    level=EVENT_LOG_LEVEL,
+    sample_rates=EVENT_LOG_SAMPLE_RATES,
+)
+
 maxConnectedUsers = 2
 
-gameState = {
-    "connectedUsers": connectedUsers,
-    "maxConnectedUsers": maxConnectedUsers,
-    "connections": [],
-    "difficulty": ""
-}
+gameState = GameStateStore(max_connected_users=maxConnectedUsers)
+
+# a socket that can't take a broadcast within this long is evicted
+TV_SEND_TIMEOUT_S = 2.0
+MOBILE_SEND_TIMEOUT_S = 2.0
+# how long a robot whose send failed gets to acknowledge the close
+ROBOT_CLOSE_TIMEOUT_S = 2.0
+
+
+def log_eviction(broadcaster, websocket):
+    event_log.log("broadcast_evicted", "warning", channel=broadcaster.name, remaining=len(broadcaster))
+
+
+mobile_broadcaster = Broadcaster("mobile", send_timeout_s=MOBILE_SEND_TIMEOUT_S, on_evict=log_eviction)
+# each TV has its own game state subscription and sender task, see tv_sender; the TVs are
+# gameState's only subscribers, so the store's subscriber set doubles as the list of TVs
+tv_stats = {"evicted": 0}
+
+# relay-local latency per robot command: frame received -> picked up by the robot's sender, and -> send done
+relay_latency = LatencyStats()
+
+
+async def tv_sender(websocket, subscription):
+    # one sender per TV, so a half-dead TV only ever delays its own updates.
+    # snapshots coalesce in the subscription's mailbox while a send is in flight
+    previous_connected_users = None
+    while True:
+        try:
+            state = await subscription.next_state()
+        except MailboxClosed:
+            return
+        if state["connectedUsers"] == previous_connected_users:
+            continue
+        previous_connected_users = state["connectedUsers"]
+        try:
+            await asyncio.wait_for(websocket.send_text(str(previous_connected_users)), TV_SEND_TIMEOUT_S)
+        except Exception as e:
+            tv_stats["evicted"] += 1
+            event_log.log("broadcast_evicted", "warning", channel="tv", remaining=len(gameState) - 1, error=repr(e))
+            try:
+                await asyncio.wait_for(websocket.close(), TV_SEND_TIMEOUT_S)
+            except Exception:
+                pass
+            return
+
+
+@app.on_event("startup")
+async def start_background_tasks():
+    event_log.start()
+
+
+@app.on_event("shutdown")
+async def stop_background_tasks():
+    event_log.log("relay_latency", latency_ms=relay_latency.stats())
+    await event_log.stop()
 
 
 @app.get("/")
@@ -27,142 +103,236 @@ def read_root():
 @app.websocket("/ws/tv/onloading")
 async def websocket_tv_onloading(websocket: WebSocket):
     await websocket.accept()
-    previous_connected_users = None
+    # the subscription starts with the current snapshot, so the sender's first send is the current count
+    subscription = gameState.subscribe()
+    sender = asyncio.create_task(tv_sender(websocket, subscription))
+    event_log.log("tv_connected", subscribers=len(gameState))
     try:
+        # the TV never sends anything, this just waits for it to leave
         while True:
-            if gameState["connectedUsers"] != previous_connected_users:
-                await websocket.send_text(str(gameState["connectedUsers"]))
-                previous_connected_users = gameState["connectedUsers"]
-            await asyncio.sleep(1)  # Adjust the interval as needed
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+        event_log.log("tv_disconnected", subscribers=len(gameState) - 1)
     except Exception as e:
-        print(f"Error: {e}")
+        event_log.log("tv_error", "warning", error=repr(e))
     finally:
-        await websocket.close()
+        subscription.close()
+        sender.cancel()
 
 
 @app.websocket("/ws/mobile")
 async def websocket_mobile(websocket: WebSocket):
-    if gameState["connectedUsers"] >= gameState["maxConnectedUsers"]:
+    user_id = gameState.try_join()
+    if user_id is None:
         await websocket.close()
         return
     else:
-        gameState["connectedUsers"] += 1
-        user_id = gameState["connectedUsers"]
         await websocket.accept()
 
         async def broadcast():
-            for connection in gameState["connections"]:
-                await connection.send_json({'userid': user_id, 'connectedUsers': gameState["connectedUsers"], 'difficulty': gameState["difficulty"]})
+            await mobile_broadcaster.broadcast({'userid': user_id, 'connectedUsers': gameState["connectedUsers"], 'difficulty': gameState["difficulty"]})
 
-        gameState["connections"].append(websocket)
+        mobile_broadcaster.add(websocket)
         await broadcast()
 
         try:
             while True:
                 data = await websocket.receive_json()
                 if data.get("type") == "difficulty":
-                    gameState["difficulty"] = data["difficulty"]
+                    gameState.set_difficulty(data["difficulty"])
                 await broadcast()
+        except WebSocketDisconnect:
+            event_log.log("mobile_disconnected", userid=user_id)
         except Exception as e:
-            print(f"Error: {e}")
+            event_log.log("mobile_lobby_error", "warning", userid=user_id, error=str(e))
         finally:
-            gameState["connectedUsers"] -= 1
-            gameState["connections"].remove(websocket)
+            gameState.leave()
+            mobile_broadcaster.remove(websocket)
             await broadcast()
 
 
-connected_robots = []
+robot_registry = RobotRegistry()
 connected_users = []
 
 
 @app.get("/debug")
-def debug():
-    print("connected-robots:" + str(connected_robots))
-    print("connected-users:" + str(connected_users))
-
-    return "check da log !"
+async def debug(limit: int = 100, event_type: str = None, level: str = None):
+    # async so it runs on the event loop: the event log, mailboxes and latency stats are only ever touched from there
+    if level is not None and level not in LEVELS:
+        raise HTTPException(status_code=400, detail=f"unknown level {level!r}, expected one of {', '.join(LEVELS)}")
+    return {
+        "robots": {robot.robot_number: robot.mailbox.stats() for robot in robot_registry.connections()},
+        "free_robot_numbers": robot_registry.free_slots(),
+        "connected_users": len(connected_users),
+        "game_state": gameState.snapshot(),
+        "tv": {
+            "subscribers": len(gameState),
+            "evicted": tv_stats["evicted"],
+            "mailboxes": gameState.subscriber_stats(),
+        },
+        "mobile": mobile_broadcaster.stats(),
+        "latency_ms": relay_latency.stats(),
+        "event_log": event_log.stats(),
+        "events": event_log.recent(limit, event_type=event_type, min_level=level),
+    }
 
 
 @app.websocket("/ws/robotcontrol")
 async def robot_control(websocket: WebSocket):
     await websocket.accept()
 
-    # go through the connected_robots list. they are numbered with robot_number
-    # find the smallest number and assign it to the new robot
-    # if all numbers 1-4 are taken, reject the connection
-
-    solved = False
-    for i in range(1, 5):
-        if (i not in [robot["robot_number"] for robot in connected_robots]):
-            solved = True
-            robot_number = i
-            break
+    # the registry hands out the smallest free robot number (1-4)
+    # if all numbers are taken, reject the connection
+    robot = robot_registry.register(websocket)
+    if robot is None:
+        event_log.log("robot_rejected", "warning", reason="all robot numbers taken")
+        await websocket.close()
+        return
 
-    connected_robots.append({
-        "websocket": websocket,
-        "robot_number": robot_number
-    })
-    print("ESP32 connected, allocated robot number" + str(len(connected_robots)))
+    event_log.log("robot_connected", robot=robot.robot_number)
+    robot.sender_task = asyncio.create_task(robot_sender(robot))
 
     try:
         while True:
             data = await websocket.receive_text()
-            print(f"Received from ESP32: {data}")
+            event_log.log("robot_message", "debug", robot=robot.robot_number, data=data)
+            if data.lstrip().startswith("{"):
+                handle_robot_hello(robot, data)
 
     except WebSocketDisconnect:
-        # Remove the robot dict associated with this websocket
-        for robot in connected_robots:
-            if robot["websocket"] == websocket:
-                connected_robots.remove(robot)
-                break
-        print("ESP32 disconnected")
+        event_log.log("robot_disconnected", robot=robot.robot_number)
+    finally:
+        robot_registry.unregister(robot)
+        robot.sender_task.cancel()
+
+
+def handle_robot_hello(robot, data):
+    # any JSON object with "type": "hello", whatever its spacing or key order
+    try:
+        hello = json.loads(data)
+    except ValueError:
+        return
+    if not isinstance(hello, dict) or hello.get("type") != "hello":
+        return
+    robot.binary = hello.get("wire") == wire.ROBOT_WIRE_BINARY
+    event_log.log("robot_hello", robot=robot.robot_number, binary=robot.binary)
+
+
+async def robot_sender(robot):
+    # one sender per robot, so a slow ESP32 only ever delays its own commands
+    while True:
+        try:
+            payload = await robot.mailbox.get()
+        except MailboxClosed:
+            return
+        relay_latency.record("mailbox", robot.mailbox.delivered_put_at)
+        try:
+            if isinstance(payload, bytes):
+                await robot.websocket.send_bytes(payload)
+            else:
+                await robot.websocket.send_text(payload)
+            relay_latency.record("received_to_sent", robot.mailbox.delivered_put_at)
+        except Exception as e:
+            robot.mailbox.drops += 1
+            event_log.log("robot_send_failed", "warning", robot=robot.robot_number, error=str(e))
+            robot_registry.unregister(robot)
+            # its number is free again, so end the connection too: robot_control stops waiting on it,
+            # and the ESP32 sees the close and reconnects instead of idling on a socket nobody sends to
+            try:
+                await asyncio.wait_for(robot.websocket.close(), ROBOT_CLOSE_TIMEOUT_S)
+            except Exception:
+                pass
+            return
+
+
+def send_to_robot(robot, payload, received_at=None):
+    # never blocks: a newer command replaces one the sender hasn't picked up yet.
+    # received_at (perf_counter when the frame came in) is what relay_latency measures from
+    robot.mailbox.put(payload, received_at)
+
+
+def route_joystick_frame(robot_id, frame, received_at=None):
+    robot = robot_registry.get(robot_id)
+    if robot is None:
+        return
+    event_log.log("robot_command", "debug", robot=robot_id, binary=robot.binary)
+    send_to_robot(robot, frame if robot.binary else wire.joystick_frame_to_json(frame), received_at)
+
+
+def route_binary_frame(frame, received_at=None):
+    # single frames are forwarded untouched; only the header is read to pick the robot
+    msg_type, robot_id = wire.peek_header(frame)
+    if msg_type == wire.MSG_JOYSTICK:
+        if len(frame) != wire.JOYSTICK_FRAME.size:
+            event_log.log("mobile_parse_error", "warning", error="bad joystick frame size", size=len(frame))
+            return
+        route_joystick_frame(robot_id, frame, received_at)
+    elif msg_type == wire.MSG_JOYSTICK_BATCH:
+        for robot_id, robot_frame in wire.split_joystick_batch(frame):
+            route_joystick_frame(robot_id, robot_frame, received_at)
+    else:
+        event_log.log("mobile_parse_error", "warning", error="unknown binary frame", size=len(frame))
+
+
+def route_joystick_batch(msg, received_at=None):
+    # JSON fallback of the binary batch frame
+    for command in msg.get("commands", []):
+        robot = robot_registry.get(command.get("userid"))
+        if robot is not None and "joystick" in command:
+            event_log.log("robot_command", "debug", robot=robot.robot_number, joystick=command["joystick"])
+            send_to_robot(robot, json.dumps(command["joystick"]), received_at)
 
 
 @app.websocket("/ws/mobilecontrol")
 async def mobile_control(websocket: WebSocket):
-    await websocket.accept()
-    print("Mobile connected")
+    # clients offering the binary subprotocol may send packed joystick frames,
+    # everyone else (the Vue phones) keeps talking JSON
+    binary = wire.JOYSTICK_SUBPROTOCOL in websocket.scope.get("subprotocols", [])
+    await websocket.accept(subprotocol=wire.JOYSTICK_SUBPROTOCOL if binary else None)
+    event_log.log("mobile_connected", binary=binary)
 
     try:
         while True:
-            data = await websocket.receive_text()
-            print(f"Received from mobile: {data}")
-            print(f"Current connected robots: {connected_robots}")
-            print(f"Current connected users: {connected_users}")
+            message = await websocket.receive()
+            received_at = time.perf_counter()
+            if message["type"] == "websocket.disconnect":
+                raise WebSocketDisconnect(message.get("code", 1000))
+            if message.get("bytes") is not None:
+                try:
+                    route_binary_frame(message["bytes"], received_at)
+                except Exception as e:
+                    event_log.log("mobile_parse_error", "warning", error=str(e), size=len(message["bytes"]))
+                continue
+            data = message["text"]
+            event_log.log("mobile_message", "debug", data=data)
 
             try:
                 msg = json.loads(data)
                 if msg.get("type") == "buttons" and "buttons" in msg:
-                    # Extract x and y from string like "x: -0.91, y: 0.09"
                     if (msg.get("buttons") == "ACW"):
                         message = {'x': -99, 'y': -99}
                     elif (msg.get("buttons") == "CW"):
                         message = {'x': 99, 'y': 99}
+                    else:
+                        continue
+
+                    robot = robot_registry.get(msg.get("userid"))
+                    if robot is not None:
+                        event_log.log("robot_command", "debug", robot=robot.robot_number, buttons=msg.get("buttons"))
+                        send_to_robot(robot, json.dumps(message))
 
-                    for robot in connected_robots:
-                        if (robot["robot_number"] == msg.get("userid")):
-                            try:
-                                print(
-                                    f"Sending command to robot {robot['robot_number']}: {msg.get('buttons')} from user {msg['userid']}")
-                                await robot["websocket"].send_text(json.dumps(message))
-                            except:
-                                connected_robots.remove(
-                                    robot)
+                if msg.get("type") == "joystick_batch":
+                    route_joystick_batch(msg, received_at)
 
                 if msg.get("type") == "joystick" and "joystick" in msg:
                     # Extract x and y from string like "x: -0.91, y: 0.09"
-                    for robot in connected_robots:
-                        if (robot["robot_number"] == msg.get("userid")):
-
-                            try:
-                                print(
-                                    f"Sending command to robot {robot['robot_number']}: {msg.get('joystick')} from user {msg['userid']}")
-                                await robot["websocket"].send_text(json.dumps(msg.get("joystick")))
-                            except:
-                                connected_robots.remove(
-                                    robot)
+                    robot = robot_registry.get(msg.get("userid"))
+                    if robot is not None:
+                        event_log.log("robot_command", "debug", robot=robot.robot_number, joystick=msg.get("joystick"))
+                        send_to_robot(robot, json.dumps(msg.get("joystick")), received_at)
             except Exception as e:
-                print(f"Error parsing joystick data: {e}")
+                event_log.log("mobile_parse_error", "warning", error=str(e), data=data)
 
             # Optionally, parse and respond to mobile status
             # await websocket.send_text("Command received")  # Acknowledge
@@ -175,14 +345,15 @@ async def mobile_control(websocket: WebSocket):
                 connected_users.remove(user)
                 break
 
-        print("Mobile disconnected")
+        event_log.log("mobile_disconnected")
 
 
 @app.post("/send_command/{cmd}")
 async def send_command(cmd: str):
-    for robot_ws in list(connected_robots):
-        try:
-            await robot_ws.send_text(cmd)
-        except:
-            connected_robots.discard(robot_ws)
-    return {"status": "sent", "command": cmd}
+    # robots don't go through a Broadcaster: the command is queued in each robot's mailbox like any other,
+    # and a robot whose send fails is dropped by its own robot_sender
+    robots = robot_registry.connections()
+    for robot in robots:
+        send_to_robot(robot, cmd)
+    event_log.log("broadcast_command", command=cmd, robots=len(robots))
+    return {"status": "sent", "command": cmd, "robots": len(robots)}
@@ -0,0 +1,82 @@
+# registry.py
+
+import heapq
+
+from fastapi import WebSocket
+
+from .mailbox import LatestValueMailbox
+
+MAX_ROBOTS = 4
+
+
+class RobotConnection:
+    __slots__ = ("websocket", "robot_number", "mailbox", "sender_task", "binary")
+
+    def __init__(self, websocket: WebSocket, robot_number: int):
+        self.websocket = websocket
+        self.robot_number = robot_number
+        self.mailbox = LatestValueMailbox()
+        self.sender_task = None
+        # set once the robot says it can parse binary joystick frames
+        self.binary = False
+
+    def __repr__(self):
+        return f"RobotConnection(robot_number={self.robot_number})"
+
+
+class RobotRegistry:
+    """Routing table for connected ESP32 robots.
+
+    Robots are indexed by robot number so routing a command is a single dict
+    lookup. Free numbers live in a min-heap, so a new robot always gets the
+    smallest free slot. register/unregister never await, which makes them
+    atomic with respect to other tasks on the event loop.
+    """
+
+    def __init__(self, max_robots: int = MAX_ROBOTS):
+        self.max_robots = max_robots
+        self._by_number = {}
+        self._by_websocket = {}
+        self._free_numbers = list(range(1, max_robots + 1))
+        heapq.heapify(self._free_numbers)
+
+    def register(self, websocket: WebSocket):
+        # returns None when every slot is taken
+        if websocket in self._by_websocket:
+            return self._by_websocket[websocket]
+        if not self._free_numbers:
+            return None
+        robot_number = heapq.heappop(self._free_numbers)
+        connection = RobotConnection(websocket, robot_number)
+        self._by_number[robot_number] = connection
+        self._by_websocket[websocket] = connection
+        return connection
+
+    def unregister(self, connection: RobotConnection) -> bool:
+        # only the connection currently holding the slot may release it
+        if self._by_number.get(connection.robot_number) is not connection:
+            return False
+        del self._by_number[connection.robot_number]
+        del self._by_websocket[connection.websocket]
+        connection.mailbox.close()
+        heapq.heappush(self._free_numbers, connection.robot_number)
+        return True
+
+    def get(self, robot_number):
+        return self._by_number.get(robot_number)
+
+    def connections(self):
+        # snapshot, safe to iterate while connections come and go
+        return list(self._by_number.values())
+
+    def free_slots(self):
+        return sorted(self._free_numbers)
+
+    def __len__(self):
+        return len(self._by_number)
+
+    def __contains__(self, robot_number):
+        return robot_number in self._by_number
+
+    def __repr__(self):
+        return f"RobotRegistry(robots={sorted(self._by_number)}, free={self.free_slots()})"
@@ -0,0 +1,94 @@
+# wire.py
+#
+# Fixed-layout binary joystick frame. The same layout is packed by
+# simulation/ws_client.py and parsed by the ESP32 firmware, keep all three in sync.
+#
+#   offset  size  field
+#   0       1     message type (MSG_JOYSTICK)
+#   1       1     robot id
+#   2       2     sequence number (uint16, wraps)
+#   4       2     x * AXIS_SCALE (int16)
+#   6       2     y * AXIS_SCALE (int16)
+#   8       4     sender timestamp in ms (uint32, wraps)
+#
+# All fields little-endian, 12 bytes per command.
+#
+# A batch frame carries one tick of commands for several robots with a shared
+# sequence number and timestamp. The relay splits it into joystick frames:
+#
+#   0       1     message type (MSG_JOYSTICK_BATCH)
+#   1       1     command count N
+#   2       2     sequence number
+#   4       4     sender timestamp in ms
+#   8       5*N   N x (robot id u8, x int16, y int16)
+
+import json
+import struct
+
+# offered by clients in the websocket handshake; phones don't offer it and stay on JSON
+JOYSTICK_SUBPROTOCOL = "foai.joystick.v1"
+# robots that can parse binary frames announce it with {"type": "hello", "wire": ROBOT_WIRE_BINARY}
+ROBOT_WIRE_BINARY = "bin1"
+
+MSG_JOYSTICK = 0x01
+MSG_JOYSTICK_BATCH = 0x02
+
+AXIS_SCALE = 100
+JOYSTICK_FRAME = struct.Struct("<BBHhhI")
+BATCH_HEADER = struct.Struct("<BBHI")
+BATCH_ENTRY = struct.Struct("<Bhh")
+MAX_BATCH_COMMANDS = 255
+
+
+def _to_axis(value):
+    return max(-32768, min(32767, int(round(value * AXIS_SCALE))))
+
+
+def encode_joystick(robot_id, seq, x, y, timestamp_ms):
+    return JOYSTICK_FRAME.pack(MSG_JOYSTICK, robot_id, seq & 0xFFFF, _to_axis(x), _to_axis(y),
+                               int(timestamp_ms) & 0xFFFFFFFF)
+
+
+def decode_joystick(frame):
+    msg_type, robot_id, seq, x, y, timestamp_ms = JOYSTICK_FRAME.unpack_from(frame)
+    return {
+        "type": msg_type,
+        "robot_id": robot_id,
+        "seq": seq,
+        "x": x / AXIS_SCALE,
+        "y": y / AXIS_SCALE,
+        "timestamp_ms": timestamp_ms,
+    }
+
+
+def encode_joystick_batch(commands, seq, timestamp_ms):
+    # commands: iterable of (robot_id, x, y)
+    commands = list(commands)[:MAX_BATCH_COMMANDS]
+    parts = [BATCH_HEADER.pack(MSG_JOYSTICK_BATCH, len(commands), seq & 0xFFFF, int(timestamp_ms) & 0xFFFFFFFF)]
+    parts.extend(BATCH_ENTRY.pack(robot_id, _to_axis(x), _to_axis(y)) for robot_id, x, y in commands)
+    return b"".join(parts)
+
+
+def split_joystick_batch(frame):
+    # yields (robot_id, joystick frame) pairs; x/y stay in wire units, no rescaling
+    msg_type, count, seq, timestamp_ms = BATCH_HEADER.unpack_from(frame)
+    if len(frame) < BATCH_HEADER.size + count * BATCH_ENTRY.size:
+        raise ValueError("truncated joystick batch")
+    offset = BATCH_HEADER.size
+    for _ in range(count):
+        robot_id, x, y = BATCH_ENTRY.unpack_from(frame, offset)
+        offset += BATCH_ENTRY.size
+        yield robot_id, JOYSTICK_FRAME.pack(MSG_JOYSTICK, robot_id, seq, x, y, timestamp_ms)
+
+
+def peek_header(frame):
+    # (message type, robot id) without unpacking the rest of the frame
+    if len(frame) < 2:
+        return None, None
+    return frame[0], frame[1]
+
+
+def joystick_frame_to_json(frame):
+    # fallback for robots that only understand {"x": .., "y": ..}
+    decoded = decode_joystick(frame)
+    return json.dumps({"x": decoded["x"], "y": decoded["y"]})
@@ -59,26 +59,19 @@ void rotateCounterClockwise() {
   setMotor(M3_FORWARD_PIN, M3_BACKWARD_PIN, -speed);
 }
 
-// --- WebSocket event handlers ---
-void onMessageCallback(WebsocketsMessage message) {
-  String data = message.data();
-  data.trim();
-  Serial.print("Received command: ");
-  Serial.println(data);
-
-  JsonDocument doc;
-  DeserializationError error = deserializeJson(doc, data);
-
-  // Test if parsing succeeds.
-  if (error) {
-    Serial.print(F("deserializeJson() failed: "));
-    Serial.println(error.f_str());
-    return;
-  }
-
-  float x = doc["x"];
-  float y = doc["y"];
-
+// Binary joystick frame, must match api/wire.py:
+// type u8 | robot id u8 | seq u16 | x*100 i16 | y*100 i16 | timestamp ms u32, little-endian
+#define MSG_JOYSTICK 0x01
+#define JOYSTICK_FRAME_SIZE 12
+#define JOYSTICK_AXIS_SCALE 100.0f
+// a gap this long without joystick frames ends the sequence; the next frame is taken whatever its seq
+#define JOYSTICK_SEQ_RESET_MS 300
+
+uint16_t lastJoystickSeq = 0;
+bool haveJoystickSeq = false;
+unsigned long lastJoystickFrameMs = 0;
+
+void handleCommand(float x, float y) {
   // if x=99, y=99, then rotate clockwise
   if (x == 99 && y == 99) {
     Serial.println("Rotating clockwise");
@@ -100,7 +93,63 @@ void onMessageCallback(WebsocketsMessage message) {
   }
 
   moveXY(x, y);
-  return;
+}
+
+void onBinaryMessage(const uint8_t *frame, size_t length) {
+  if (length < JOYSTICK_FRAME_SIZE || frame[0] != MSG_JOYSTICK) {
+    return;
+  }
+  uint16_t seq = frame[2] | (frame[3] << 8);
+  int16_t rawX = (int16_t)(frame[4] | (frame[5] << 8));
+  int16_t rawY = (int16_t)(frame[6] | (frame[7] << 8));
+
+  // a restarted simulation starts again at seq 1, usually well below the last seq
+  // seen; it goes quiet while restarting, so a gap resets the sequence
+  unsigned long now = millis();
+  if (now - lastJoystickFrameMs > JOYSTICK_SEQ_RESET_MS) {
+    haveJoystickSeq = false;
+  }
+  lastJoystickFrameMs = now;
+
+  // drop frames that arrive out of order (seq wraps at 65536); a big jump
+  // backwards also means the sender restarted, so take it
+  int16_t seqDelta = (int16_t)(seq - lastJoystickSeq);
+  if (haveJoystickSeq && seqDelta <= 0 && seqDelta > -1000) {
+    return;
+  }
+  lastJoystickSeq = seq;
+  haveJoystickSeq = true;
+
+  handleCommand(rawX / JOYSTICK_AXIS_SCALE, rawY / JOYSTICK_AXIS_SCALE);
+}
+
+// --- WebSocket event handlers ---
+void onMessageCallback(WebsocketsMessage message) {
+  if (message.isBinary()) {
+    const auto &raw = message.rawData();
+    onBinaryMessage((const uint8_t *)raw.c_str(), raw.length());
+    return;
+  }
+
+  String data = message.data();
+  data.trim();
+  Serial.print("Received command: ");
+  Serial.println(data);
+
+  JsonDocument doc;
+  DeserializationError error = deserializeJson(doc, data);
+
+  // Test if parsing succeeds.
+  if (error) {
+    Serial.print(F("deserializeJson() failed: "));
+    Serial.println(error.f_str());
+    return;
+  }
+
+  float x = doc["x"];
+  float y = doc["y"];
+
+  handleCommand(x, y);
 }
 
 void connectWebSocket() {
@@ -114,6 +163,9 @@ void connectWebSocket() {
   }
   Serial.println("WebSocket connected!");
   client.onMessage(onMessageCallback);
+  // tell the relay we can take binary joystick frames
+  client.send("{\"type\":\"hello\",\"wire\":\"bin1\"}");
+  haveJoystickSeq = false;
 }
 
 // --- Arduino setup/loop ---
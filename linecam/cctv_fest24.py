@@ -1,9 +1,16 @@
 import cv2
 import datetime
+import os
+import sys
+
+# frame sources (camera / record / replay) live with the rest of the vision code
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "simulation"))
+import frame_source
 
 def main():
 
-    cap = cv2.VideoCapture(0)
+    # camera 0, or a recorded session if FOAI_REPLAY_DIR is set; FOAI_RECORD_DIR records it
+    cap = frame_source.open_frame_source(0, 640, 480)
 
     if not cap.isOpened():
         print("Error: Could not open camera.")
@@ -11,9 +18,6 @@ def main():
     else:
         print("Working")
 
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, 640)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, 480)
-
     cv2.namedWindow('USB Camera - CCTV Mode', cv2.WINDOW_NORMAL)
 
     cv2.setWindowProperty('USB Camera - CCTV Mode', cv2.WND_PROP_FULLSCREEN, cv2.WINDOW_FULLSCREEN)
@@ -0,0 +1,323 @@
+# Copyright (c) 2025 Oguzhan Cagirir (OguzhanCOG), KCL Electronics Society
+#
+# Project: KCL FoAI RoboFootball System
+# File: bench_arena.py
+# Description: Vision pipeline throughput and accuracy on rendered overhead views of the arena, against metric ground truth.
+#
+# Author: Oguzhan Cagirir (OguzhanCOG)
+# Date: May 24, 2025
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the MIT License as published by
+# the Open Source Initiative.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# MIT License for more details.
+#
+# You should have received a copy of the MIT License
+# along with this program. If not, see <https://opensource.org/licenses/MIT>.
+#
+# --- Version: 1.0.0 ---
+#
+# Run from inside simulation/:
+#   python bench_arena.py [clean|noise|blur|motion_blur|dim|uneven|harsh ...]
+# Every condition replays the same robot/ball trajectories through process_vision_frame() (the body of
+# apriltag_processing_loop) with main.py's vision settings as they are, so a change there shows up as a change here.
+#
+# The scene is built in sim metres: a camera ARENA_CAMERA_HEIGHT_M straight above the pitch centre, corner tags
+# 0-3 on the floor at setup.CORNER_TAG_DEFINITIONS, robot tags 4-7 on top of the robots and the ball on the floor.
+# It is projected through the camera matrix, bent by the lens distortion, and then the lighting / blur / noise of
+# the condition are applied. The perspective matrices are calibrated from the corner tags the way setup.py does it.
+
+import os
+import sys
+import time
+
+import cv2
+import numpy as np
+
+import setup
+import undistort_maps
+from bench_vision import (BENCH_BALL_BGR, BENCH_CAMERA_MATRIX, BENCH_DIST_COEFFS, BENCH_FRAME_H, BENCH_FRAME_W,
+                          _angle_diff_deg, _marker_image, _percentile, build_distort_maps, setup_vision_globals)
+
+ARENA_FRAMES = 90
+ARENA_FPS = 30.0
+ARENA_CAMERA_HEIGHT_M = 2.5
+ARENA_ROBOT_TAG_HEIGHT_M = 0.10
+ARENA_ROBOT_BODY_RADIUS_M = 0.10
+ARENA_BALL_RADIUS_M = 0.025
+ARENA_TAG_IDS = (4, 5, 6, 7)
+# each robot drives an ellipse in its own quarter of the pitch, so tags never overlap and recall is down to the image
+ARENA_ROBOT_PATH_RADII_M = (0.35, 0.28)
+ARENA_ROBOT_PATH_RAD_S = 3.0  # ~1 m/s along the path
+ARENA_BALL_SPEED_M_S = 2.0
+ARENA_FLOOR_BGR = (60, 120, 50)
+ARENA_SURROUND_BGR = (110, 110, 110)
+ARENA_LINE_BGR = (215, 215, 215)
+ARENA_ROBOT_BGR = (45, 45, 45)
+ARENA_SEED = 3
+
+# image conditions, applied to the raw (distorted) frame in this order: lighting gain / gradient / vignette,
+# optical blur (gaussian sigma px), camera-shake motion blur (horizontal kernel px), sensor noise (sigma, 8-bit levels)
+ARENA_CONDITIONS = {
+    "clean": {},
+    "noise": {'noise_sigma': 8.0},
+    "blur": {'blur_sigma': 1.5},
+    "motion_blur": {'motion_blur_px': 9},
+    "dim": {'gain': 0.45, 'noise_sigma': 3.0},
+    "uneven": {'gradient': (0.55, 1.25), 'vignette': 0.4},
+    "harsh": {'gain': 0.7, 'gradient': (0.6, 1.2), 'vignette': 0.3, 'blur_sigma': 1.0, 'motion_blur_px': 5, 'noise_sigma': 6.0},
+}
+
+def load_sample_calibration(width=BENCH_FRAME_W, height=BENCH_FRAME_H):
+    # the camera's real calibration if this machine has one, otherwise bench_vision's wide-angle webcam
+    calib_file = os.path.join(setup.CALIBRATION_DATA_FOLDER, setup.CALIBRATION_FILE_NAME_TEMPLATE.format(width=width, height=height))
+    if os.path.exists(calib_file):
+        data = np.load(calib_file)
+        return data['camera_matrix'], data['dist_coeffs'], calib_file
+    return BENCH_CAMERA_MATRIX, BENCH_DIST_COEFFS, "bench_vision sample webcam"
+
+class ArenaCamera:
+    """Pinhole camera looking straight down at the pitch centre: sim metres at a given height -> ideal image pixels."""
+    def __init__(self, camera_matrix, height_m=ARENA_CAMERA_HEIGHT_M):
+        self.camera_matrix = np.asarray(camera_matrix, dtype=np.float64)
+        self.height_m = height_m
+        self.centre = np.array([setup.SIM_ARENA_WIDTH_M / 2.0, setup.SIM_ARENA_HEIGHT_M / 2.0])
+
+    def project(self, points_xy, z=0.0):
+        # sim x/y run along image u/v, so no mirroring: tags stay decodable
+        depth = self.height_m - z
+        fx, fy = self.camera_matrix[0, 0], self.camera_matrix[1, 1]
+        cx, cy = self.camera_matrix[0, 2], self.camera_matrix[1, 2]
+        offset = (np.asarray(points_xy, dtype=np.float64) - self.centre) / depth
+        return np.stack([fx * offset[..., 0] + cx, fy * offset[..., 1] + cy], axis=-1)
+
+    def scale(self, z=0.0):
+        return self.camera_matrix[0, 0] / (self.height_m - z)
+
+def _fill_poly(frame, points_px, colour):
+    cv2.fillConvexPoly(frame, np.round(np.asarray(points_px) * 16).astype(np.int32), colour, cv2.LINE_AA, 4)
+
+def _circle(frame, centre_px, radius_px, colour, thickness=-1):
+    cv2.circle(frame, tuple(np.round(np.asarray(centre_px) * 16).astype(int)), int(round(radius_px * 16)), colour, thickness, cv2.LINE_AA, 4)
+
+def tag_world_corners(centre, heading_rad, size_m):
+    # marker TL, TR, BR, BL on the pitch for a tag whose top edge faces heading_rad (sim angle, y down).
+    # pupil_apriltags lists an upright marker as TR, TL, BL, BR, so its front (0, 1) / back (3, 2) edges are
+    # the top / bottom edge and calculate_orientations_from_sim_corners() gives heading_rad back
+    up = np.array([np.cos(heading_rad), np.sin(heading_rad)])
+    right = np.array([-np.sin(heading_rad), np.cos(heading_rad)])
+    half = size_m / 2.0
+    centre = np.asarray(centre, dtype=np.float64)
+    return np.array([centre + half * (up - right), centre + half * (up + right), centre + half * (right - up), centre - half * (up + right)])
+
+def draw_tag_quad(frame, tag_id, corners_px, quiet_zone=1.5):
+    # tag36h11 marker warped onto the image quad TL, TR, BR, BL, on a white label quiet_zone times its size
+    centre = corners_px.mean(axis=0)
+    _fill_poly(frame, centre + (corners_px - centre) * quiet_zone, (255, 255, 255))
+    s = max(8, int(round(np.linalg.norm(corners_px[1] - corners_px[0]))))
+    marker = _marker_image(tag_id, s)
+    # only warp inside the quad's bounding box, a full-frame warp per tag dominates the render otherwise
+    x0, y0 = np.maximum(np.floor(corners_px.min(axis=0)).astype(int) - 1, 0)
+    x1, y1 = np.minimum(np.ceil(corners_px.max(axis=0)).astype(int) + 2, (frame.shape[1], frame.shape[0]))
+    if x1 <= x0 or y1 <= y0:
+        return
+    src = np.float32([[-0.5, -0.5], [s - 0.5, -0.5], [s - 0.5, s - 0.5], [-0.5, s - 0.5]])
+    warp = cv2.getPerspectiveTransform(src, (corners_px - (x0, y0)).astype(np.float32))
+    size = (x1 - x0, y1 - y0)
+    warped = cv2.warpPerspective(marker, warp, size, flags=cv2.INTER_LINEAR, borderValue=255)
+    mask = cv2.warpPerspective(np.full_like(marker, 255), warp, size, flags=cv2.INTER_LINEAR) > 127
+    roi = frame[y0:y1, x0:x1]
+    roi[mask] = cv2.cvtColor(warped, cv2.COLOR_GRAY2BGR)[mask]
+
+def render_pitch(camera, width=BENCH_FRAME_W, height=BENCH_FRAME_H, seed=ARENA_SEED):
+    # static part of the ideal image: floor, markings and corner tags
+    rng = np.random.default_rng(seed)
+    frame = np.full((height, width, 3), ARENA_SURROUND_BGR, np.uint8)
+    arena_w, arena_h = setup.SIM_ARENA_WIDTH_M, setup.SIM_ARENA_HEIGHT_M
+    _fill_poly(frame, camera.project([[0, 0], [arena_w, 0], [arena_w, arena_h], [0, arena_h]]), ARENA_FLOOR_BGR)
+    frame = cv2.add(frame, rng.integers(0, 25, (height, width, 3), dtype=np.uint8))
+    line_px = max(1, int(round(0.02 * camera.scale())))
+    outline = np.round(camera.project([[0, 0], [arena_w, 0], [arena_w, arena_h], [0, arena_h]])).astype(np.int32)
+    cv2.polylines(frame, [outline], True, ARENA_LINE_BGR, line_px, cv2.LINE_AA)
+    top, bottom = np.round(camera.project([[arena_w / 2, 0], [arena_w / 2, arena_h]])).astype(int)
+    cv2.line(frame, tuple(top), tuple(bottom), ARENA_LINE_BGR, line_px, cv2.LINE_AA)
+    _circle(frame, camera.project([arena_w / 2, arena_h / 2]), 0.3 * camera.scale(), ARENA_LINE_BGR, line_px)
+    for x, w in ((0.0, 0.3), (arena_w - 0.3, 0.3)):
+        box = np.round(camera.project([[x, arena_h / 2 - 0.4], [x + w, arena_h / 2 - 0.4], [x + w, arena_h / 2 + 0.4], [x, arena_h / 2 + 0.4]]))
+        cv2.polylines(frame, [box.astype(np.int32)], True, ARENA_LINE_BGR, line_px, cv2.LINE_AA)
+    for tag_id, (_, sim_xy) in setup.CORNER_TAG_DEFINITIONS.items():
+        draw_tag_quad(frame, tag_id, camera.project(tag_world_corners(sim_xy, -np.pi / 2, setup.TAG_SIZE_METERS)))
+    return frame
+
+def arena_trajectories(frames, fps=ARENA_FPS, seed=ARENA_SEED):
+    """Ground truth per frame: [(capture_ts, {tag_id: (x, y, heading_deg)}, ball (x, y) or None, ball drawn at)] in sim metres.
+
+    The expected ball is None while it is under a robot; it is still drawn there, partly covered, but not scored.
+    """
+    rng = np.random.default_rng(seed)
+    arena_w, arena_h = setup.SIM_ARENA_WIDTH_M, setup.SIM_ARENA_HEIGHT_M
+    quarters = [(arena_w * 0.25, arena_h * 0.25), (arena_w * 0.75, arena_h * 0.25), (arena_w * 0.25, arena_h * 0.75), (arena_w * 0.75, arena_h * 0.75)]
+    phases = rng.uniform(0, 2 * np.pi, len(ARENA_TAG_IDS))
+    directions = rng.choice((-1.0, 1.0), len(ARENA_TAG_IDS))
+    margin = ARENA_BALL_RADIUS_M * 2
+    ball = rng.uniform((margin, margin), (arena_w - margin, arena_h - margin))
+    ball_heading = rng.uniform(-np.pi, np.pi)
+    ball_vel = ARENA_BALL_SPEED_M_S * np.array([np.cos(ball_heading), np.sin(ball_heading)])
+    rx, ry = ARENA_ROBOT_PATH_RADII_M
+    dt = 1.0 / fps
+    truth = []
+    for i in range(frames):
+        t = i * dt
+        robots = {}
+        for tag_id, (qx, qy), phase, direction in zip(ARENA_TAG_IDS, quarters, phases, directions):
+            a = phase + direction * ARENA_ROBOT_PATH_RAD_S * t
+            # heading along the direction of travel
+            heading = np.degrees(np.arctan2(direction * ry * np.cos(a), -direction * rx * np.sin(a)))
+            robots[tag_id] = (qx + rx * np.cos(a), qy + ry * np.sin(a), heading)
+        hidden = any(np.hypot(ball[0] - x, ball[1] - y) < ARENA_ROBOT_BODY_RADIUS_M + ARENA_BALL_RADIUS_M for x, y, _ in robots.values())
+        truth.append((t, robots, (None if hidden else (ball[0], ball[1])), ball.copy()))
+        ball += ball_vel * dt
+        for axis, limit in ((0, arena_w), (1, arena_h)):
+            if not margin <= ball[axis] <= limit - margin:
+                ball_vel[axis] *= -1.0
+                ball[axis] = min(max(ball[axis], margin), limit - margin)
+    return truth
+
+def render_ideal(pitch, camera, robots, ball_xy):
+    frame = pitch.copy()
+    _circle(frame, camera.project(ball_xy, ARENA_BALL_RADIUS_M), ARENA_BALL_RADIUS_M * camera.scale(ARENA_BALL_RADIUS_M), BENCH_BALL_BGR)
+    for tag_id, (x, y, heading_deg) in robots.items():
+        z = ARENA_ROBOT_TAG_HEIGHT_M
+        _circle(frame, camera.project((x, y), z), ARENA_ROBOT_BODY_RADIUS_M * camera.scale(z), ARENA_ROBOT_BGR)
+        draw_tag_quad(frame, tag_id, camera.project(tag_world_corners((x, y), np.radians(heading_deg), setup.TAG_SIZE_METERS), z))
+    return frame
+
+def apply_condition(raw, condition, rng):
+    image = raw.astype(np.float32)
+    height, width = raw.shape[:2]
+    light = np.full((height, width), condition.get('gain', 1.0), np.float32)
+    if 'gradient' in condition:
+        lo, hi = condition['gradient']
+        light *= np.linspace(lo, hi, width, dtype=np.float32)[None, :]
+    if 'vignette' in condition:
+        yy, xx = np.mgrid[0:height, 0:width].astype(np.float32)
+        r2 = ((xx - width / 2) / (width / 2)) ** 2 + ((yy - height / 2) / (height / 2)) ** 2
+        light *= 1.0 - condition['vignette'] * np.clip(r2 / 2.0, 0.0, 1.0)
+    image *= light[..., None]
+    if condition.get('blur_sigma'):
+        image = cv2.GaussianBlur(image, (0, 0), condition['blur_sigma'])
+    if condition.get('motion_blur_px'):
+        kernel = np.full((1, condition['motion_blur_px']), 1.0 / condition['motion_blur_px'], np.float32)
+        image = cv2.filter2D(image, -1, kernel)
+    if condition.get('noise_sigma'):
+        image += rng.normal(0.0, condition['noise_sigma'], image.shape).astype(np.float32)
+    return np.clip(image, 0, 255).astype(np.uint8)
+
+def calibrate_perspective(raw, camera_matrix, dist_coeffs, detector):
+    # setup.calculate_and_save_all_perspective_transforms() without the UI: corner tags on the undistorted frame ->
+    # (M_metric_to_sim from their pose x/y, M_pixel_to_sim from their centres)
+    height, width = raw.shape[:2]
+    frame = undistort_maps.undistort_frame(raw, undistort_maps.build_undistort_maps(camera_matrix, dist_coeffs, width, height))
+    cam_params = (camera_matrix[0, 0], camera_matrix[1, 1], camera_matrix[0, 2], camera_matrix[1, 2])
+    tags = {tag.tag_id: tag for tag in detector.detect(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY), True, cam_params, setup.TAG_SIZE_METERS)}
+    missing = [tag_id for tag_id in setup.REQUIRED_CORNER_TAG_IDS if tag_id not in tags]
+    if missing:
+        raise RuntimeError(f"corner tags {missing} not found in the rendered calibration frame")
+    dst = np.float32([setup.CORNER_TAG_DEFINITIONS[tag_id][1] for tag_id in setup.REQUIRED_CORNER_TAG_IDS])
+    metric = np.float32([tags[tag_id].pose_t.flatten()[:2] for tag_id in setup.REQUIRED_CORNER_TAG_IDS])
+    pixel = np.float32([tags[tag_id].center for tag_id in setup.REQUIRED_CORNER_TAG_IDS])
+    return cv2.getPerspectiveTransform(metric, dst), cv2.getPerspectiveTransform(pixel, dst)
+
+def run_condition(vision_main, condition, scene, frames):
+    camera, pitch, distort_maps, truth, M_metric, M_pixel = scene
+    camera_matrix, dist_coeffs = vision_main.camera_matrix_at, vision_main.dist_coeffs_at
+    # fresh detector / trackers / controller per condition, so they all start from the same state
+    ball_morph_kernel, cam_params = setup_vision_globals(vision_main, camera_matrix, dist_coeffs)
+    vision_main.detector_controller_at = None
+    vision_main.perspective_matrix_metric_to_sim_at = M_metric
+    vision_main.perspective_matrix_pixel_to_sim_at = M_pixel
+    vision_main.vision_stage_timings.clear()
+    rng = np.random.default_rng(ARENA_SEED)
+    pos_err, heading_err, ball_err = [], [], []
+    tags_found = tags_expected = balls_found = balls_expected = extra_tags = 0
+    process_s = 0.0
+    for capture_ts, robots, ball_truth, ball_drawn in truth[:frames]:
+        ideal = render_ideal(pitch, camera, robots, ball_drawn)
+        raw = cv2.remap(ideal, distort_maps[0], distort_maps[1], cv2.INTER_LINEAR, borderValue=ARENA_SURROUND_BGR)
+        raw = apply_condition(raw, condition, rng)
+        start = time.perf_counter()
+        payload = vision_main.process_vision_frame(raw, ball_morph_kernel, cam_params, capture_ts)
+        process_s += time.perf_counter() - start
+
+        tags_expected += len(robots)
+        extra_tags += len(set(payload['robot_positions']) - set(robots))
+        for tag_id, (x, y, heading_deg) in robots.items():
+            pos = payload['robot_positions'].get(tag_id)
+            if pos is None: continue
+            tags_found += 1
+            pos_err.append(np.hypot(pos[0] - x, pos[1] - y) * 1000.0)
+            if tag_id in payload['robot_orientations']:
+                heading_err.append(_angle_diff_deg(payload['robot_orientations'][tag_id], heading_deg))
+        if ball_truth is not None:
+            balls_expected += 1
+            if payload['ball_sim_pos'] is not None:
+                balls_found += 1
+                ball_err.append(np.hypot(payload['ball_sim_pos'][0] - ball_truth[0], payload['ball_sim_pos'][1] - ball_truth[1]) * 1000.0)
+    pos_err.sort(); heading_err.sort(); ball_err.sort()
+    return {
+        'frames': frames, 'fps': frames / process_s if process_s > 0 else float('nan'),
+        'stages': vision_main.get_vision_stage_stats(),
+        'tags_found': tags_found, 'tags_expected': tags_expected, 'extra_tags': extra_tags,
+        'balls_found': balls_found, 'balls_expected': balls_expected,
+        'pos_err_mm': pos_err, 'heading_err_deg': heading_err, 'ball_err_mm': ball_err,
+    }
+
+def bench_arena(conditions=None, frames=ARENA_FRAMES, width=BENCH_FRAME_W, height=BENCH_FRAME_H):
+    import main as vision_main
+
+    conditions = conditions or list(ARENA_CONDITIONS)
+    camera_matrix, dist_coeffs, calib_source = load_sample_calibration(width, height)
+    camera = ArenaCamera(camera_matrix)
+    pitch = render_pitch(camera, width, height)
+    distort_maps = build_distort_maps(camera_matrix, dist_coeffs, width, height)
+    setup_vision_globals(vision_main, camera_matrix, dist_coeffs, width, height)
+    calib_raw = cv2.remap(pitch, distort_maps[0], distort_maps[1], cv2.INTER_LINEAR, borderValue=ARENA_SURROUND_BGR)
+    M_metric, M_pixel = calibrate_perspective(calib_raw, camera_matrix, dist_coeffs, vision_main.apriltag_detector_at)
+    scene = (camera, pitch, distort_maps, arena_trajectories(frames), M_metric, M_pixel)
+
+    print(f"Synthetic arena {setup.SIM_ARENA_WIDTH_M} x {setup.SIM_ARENA_HEIGHT_M} m, {width}x{height} camera {ARENA_CAMERA_HEIGHT_M} m up "
+          f"({calib_source}), {frames} frames at {ARENA_FPS:.0f} fps, robot tags {list(ARENA_TAG_IDS)} of "
+          f"{setup.TAG_SIZE_METERS * camera.scale(ARENA_ROBOT_TAG_HEIGHT_M):.0f} px")
+    print(f"main.py: undistort '{vision_main.VISION_UNDISTORT_MODE}', parallel stages {vision_main.VISION_PARALLEL_STAGES}, "
+          f"tag ROI {vision_main.TAG_ROI_TRACKING}, ball ROI {vision_main.BALL_ROI_TRACKING}, adaptive detector {vision_main.VISION_ADAPTIVE_DETECTOR}")
+    results = {name: run_condition(vision_main, ARENA_CONDITIONS[name], scene, frames) for name in conditions}
+
+    print(f"\nThroughput: frames/s of process_vision_frame, per-stage p50 ms (total also p95)")
+    print(f"{'condition':>12} {'fps':>7} {'undistort':>10} {'ball':>7} {'tags':>7} {'map':>7} {'total':>7} {'p95':>7}")
+    for name, r in results.items():
+        s = r['stages']
+        print(f"{name:>12} {r['fps']:>7.1f} {s['undistort']['p50']:>10.2f} {s['ball']['p50']:>7.2f} {s['tags']['p50']:>7.2f} "
+              f"{s['map']['p50']:>7.2f} {s['total']['p50']:>7.2f} {s['total']['p95']:>7.2f}")
+
+    print(f"\nAccuracy vs ground truth, sim coordinates: mean / p95")
+    print(f"{'condition':>12} {'tag recall':>11} {'extra':>6} {'pos err mm':>14} {'heading err deg':>16} {'ball recall':>12} {'ball err mm':>14}")
+    mean_p95 = lambda v, fmt: f"{np.mean(v):{fmt}} / {_percentile(v, 95):{fmt}}" if v else "-"
+    for name, r in results.items():
+        tag_recall = r['tags_found'] / max(1, r['tags_expected'])
+        ball_recall = r['balls_found'] / max(1, r['balls_expected'])
+        print(f"{name:>12} {tag_recall:>11.1%} {r['extra_tags']:>6} {mean_p95(r['pos_err_mm'], '.1f'):>14} "
+              f"{mean_p95(r['heading_err_deg'], '.2f'):>16} {ball_recall:>12.1%} {mean_p95(r['ball_err_mm'], '.1f'):>14}")
+    print(f"  ball err includes the parallax of the ball centre sitting {ARENA_BALL_RADIUS_M * 1000:.0f} mm above the floor "
+          f"M_pixel_to_sim was calibrated on; robot positions come from the tag pose, which has no such offset")
+    return results
+
+if __name__ == "__main__":
+    unknown = [name for name in sys.argv[1:] if name not in ARENA_CONDITIONS]
+    if unknown:
+        print(f"Unknown condition(s) {unknown}, choose from {list(ARENA_CONDITIONS)}")
+        sys.exit(1)
+    bench_arena(sys.argv[1:] or None)
@@ -0,0 +1,542 @@
+# Copyright (c) 2025 Oguzhan Cagirir (OguzhanCOG), KCL Electronics Society
+#
+# Project: KCL FoAI RoboFootball System
+# File: bench_vision.py
+# Description: Per-frame timing benchmarks for the vision pipeline stages, on synthetic frames (no camera needed).
+#
+# Author: Oguzhan Cagirir (OguzhanCOG)
+# Date: May 24, 2025
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the MIT License as published by
+# the Open Source Initiative.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# MIT License for more details.
+#
+# You should have received a copy of the MIT License
+# along with this program. If not, see <https://opensource.org/licenses/MIT>.
+#
+# --- Version: 1.0.0 ---
+#
+# Run from inside simulation/:
+#   python bench_vision.py [undistort|undistort_mode|parallel_stages|tag_tracking|adaptive_detector|ball_tracking|ball_lut|map_detections|replay ...]
+# replay runs on a recorded session instead of synthetic frames if FOAI_REPLAY_DIR is set (frame_source.py).
+
+import glob
+import os
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+import undistort_maps
+
+BENCH_FRAME_W = 1280
+BENCH_FRAME_H = 960
+BENCH_FRAMES = 100
+# Typical wide-angle webcam at 1280x960; only used when no real calibration is passed in.
+BENCH_CAMERA_MATRIX = np.array([[1050.0, 0.0, 640.0], [0.0, 1050.0, 480.0], [0.0, 0.0, 1.0]])
+BENCH_DIST_COEFFS = np.array([[-0.32, 0.12, 0.0005, -0.0003, -0.02]])
+
+def _percentile(sorted_values, pct):
+    if not sorted_values: return float('nan')
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values))) - 1))]
+
+def time_per_frame_ms(fn, frames=BENCH_FRAMES):
+    fn()  # warm-up
+    samples = []
+    for _ in range(frames):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1000.0)
+    return sorted(samples)
+
+def synthetic_frame(width=BENCH_FRAME_W, height=BENCH_FRAME_H, seed=0):
+    # textured pitch so remap does real interpolation work, not a flat colour
+    rng = np.random.default_rng(seed)
+    frame = np.full((height, width, 3), (40, 110, 40), np.uint8)
+    frame = cv2.add(frame, rng.integers(0, 30, (height, width, 3), dtype=np.uint8))
+    for x in range(0, width, 80): cv2.line(frame, (x, 0), (x, height - 1), (200, 200, 200), 2)
+    for y in range(0, height, 80): cv2.line(frame, (0, y), (width - 1, y), (200, 200, 200), 2)
+    return frame
+
+def _print_row(name, samples):
+    print(f"{name:>24} {_percentile(samples, 50):>8.2f} {_percentile(samples, 95):>8.2f} {samples[-1]:>8.2f}")
+
+def bench_undistort(camera_matrix=BENCH_CAMERA_MATRIX, dist_coeffs=BENCH_DIST_COEFFS, frames=BENCH_FRAMES):
+    frame = synthetic_frame()
+    h, w = frame.shape[:2]
+    build_start = time.perf_counter()
+    fixed_maps = undistort_maps.build_undistort_maps(camera_matrix, dist_coeffs, w, h)
+    build_ms = (time.perf_counter() - build_start) * 1000.0
+    float_maps = cv2.initUndistortRectifyMap(camera_matrix, dist_coeffs, None, camera_matrix, (w, h), cv2.CV_32FC1)
+
+    print(f"Full-frame undistortion per {w}x{h} frame ({frames} frames), ms")
+    print(f"{'method':>24} {'p50':>8} {'p95':>8} {'max':>8}")
+    _print_row("cv2.undistort", time_per_frame_ms(lambda: cv2.undistort(frame, camera_matrix, dist_coeffs, None, camera_matrix), frames))
+    _print_row("remap, float maps", time_per_frame_ms(lambda: cv2.remap(frame, float_maps[0], float_maps[1], cv2.INTER_LINEAR), frames))
+    _print_row("remap, fixed-point maps", time_per_frame_ms(lambda: undistort_maps.undistort_frame(frame, fixed_maps), frames))
+    print(f"  one-off map build: {build_ms:.1f} ms")
+
+    reference = cv2.undistort(frame, camera_matrix, dist_coeffs, None, camera_matrix).astype(np.int16)
+    diff = np.abs(undistort_maps.undistort_frame(frame, fixed_maps).astype(np.int16) - reference)
+    print(f"  fixed-point remap vs cv2.undistort: mean |diff| {diff.mean():.3f}, max |diff| {diff.max()} (8-bit levels)")
+
+# Synthetic arena: robot tags and a ball drawn at known positions in the ideal (undistorted) image, then
+# warped through the lens model to produce what the camera would actually deliver.
+BENCH_TAG_IDS = (4, 5, 6, 7)
+BENCH_TAG_SIZE_PX = 44
+BENCH_BALL_RADIUS_PX = 12
+BENCH_BALL_BGR = (0, 215, 235)
+BENCH_LAYOUTS = 20
+
+_marker_dictionary = None
+def _marker_image(tag_id, size_px):
+    global _marker_dictionary
+    if _marker_dictionary is None:
+        _marker_dictionary = cv2.aruco.getPredefinedDictionary(cv2.aruco.DICT_APRILTAG_36h11)
+    return cv2.aruco.generateImageMarker(_marker_dictionary, tag_id, size_px)
+
+def draw_tag(frame, tag_id, centre, angle, s=BENCH_TAG_SIZE_PX):
+    # draws a robot tag with its white quiet zone, returns its 4x2 corners in pupil_apriltags' corner order
+    height, width = frame.shape[:2]
+    rot = np.array([[np.cos(angle), -np.sin(angle)], [np.sin(angle), np.cos(angle)]])
+    # white quiet zone around the tag, like the printed labels on the robots
+    quiet = (np.array([[-1, -1], [1, -1], [1, 1], [-1, 1]]) * (s * 0.75)) @ rot.T + centre
+    cv2.fillConvexPoly(frame, np.round(quiet * 16).astype(np.int32), (255, 255, 255), cv2.LINE_AA, 4)
+    marker = _marker_image(tag_id, s)
+    # marker image corners TL, TR, BR, BL (outer edge, pixel-centre convention) -> rotated square on the pitch
+    src = np.float32([[-0.5, -0.5], [s - 0.5, -0.5], [s - 0.5, s - 0.5], [-0.5, s - 0.5]])
+    dst = ((src - (s - 1) / 2.0) @ rot.T + centre).astype(np.float32)
+    warp = cv2.getPerspectiveTransform(src, dst)
+    warped = cv2.warpPerspective(marker, warp, (width, height), flags=cv2.INTER_LINEAR, borderValue=255)
+    mask = cv2.warpPerspective(np.full_like(marker, 255), warp, (width, height), flags=cv2.INTER_LINEAR) > 127
+    frame[mask] = cv2.cvtColor(warped, cv2.COLOR_GRAY2BGR)[mask]
+    # pupil_apriltags reports an upright marker's corners as TR, TL, BL, BR
+    return dst[[1, 0, 3, 2]].astype(np.float64)
+
+def render_arena(rng, width=BENCH_FRAME_W, height=BENCH_FRAME_H, tag_ids=BENCH_TAG_IDS, margin=0.12):
+    """Ideal (distortion-free) frame plus ground truth in its pixel coordinates.
+
+    Truth: {'ball': (x, y), 'tags': {tag_id: 4x2 corners in pupil_apriltags' corner order}}.
+    """
+    frame = synthetic_frame(width, height, seed=int(rng.integers(1 << 30)))
+    lo_x, hi_x = width * margin, width * (1 - margin)
+    lo_y, hi_y = height * margin, height * (1 - margin)
+    placed = []
+    def free_spot(clearance):
+        for _ in range(200):
+            p = np.array([rng.uniform(lo_x, hi_x), rng.uniform(lo_y, hi_y)])
+            if all(np.linalg.norm(p - q) > clearance + r for q, r in placed):
+                placed.append((p, clearance)); return p
+        raise RuntimeError("could not place synthetic object")
+
+    tags = {}
+    for tag_id in tag_ids:
+        tags[tag_id] = draw_tag(frame, tag_id, free_spot(BENCH_TAG_SIZE_PX), rng.uniform(-np.pi, np.pi))
+
+    ball = free_spot(BENCH_BALL_RADIUS_PX * 2)
+    cv2.circle(frame, tuple(np.round(ball * 16).astype(int)), BENCH_BALL_RADIUS_PX * 16, BENCH_BALL_BGR, -1, cv2.LINE_AA, 4)
+    return frame, {'ball': tuple(ball), 'tags': tags}
+
+def build_distort_maps(camera_matrix, dist_coeffs, width=BENCH_FRAME_W, height=BENCH_FRAME_H):
+    # for every raw camera pixel, where it lands in the ideal image (the inverse of undistort_frame's maps)
+    grid = np.stack(np.meshgrid(np.arange(width, dtype=np.float32), np.arange(height, dtype=np.float32)), axis=-1)
+    ideal = undistort_maps.undistort_points(grid.reshape(-1, 1, 2), camera_matrix, dist_coeffs).reshape(height, width, 2)
+    return ideal[..., 0], ideal[..., 1]
+
+def setup_vision_globals(vision_main, camera_matrix, dist_coeffs, width=BENCH_FRAME_W, height=BENCH_FRAME_H):
+    # identity perspective matrices: "sim" coordinates are then ideal-image pixels, and pose x/y stay in metres
+    vision_main.camera_matrix_at = camera_matrix
+    vision_main.dist_coeffs_at = dist_coeffs
+    vision_main.undistort_maps_at = undistort_maps.build_undistort_maps(camera_matrix, dist_coeffs, width, height)
+    vision_main.perspective_matrix_pixel_to_sim_at = np.eye(3)
+    vision_main.perspective_matrix_metric_to_sim_at = np.eye(3)
+    vision_main.apriltag_detector_at = vision_main.detector_config.create_detector()
+    vision_main.tag_tracker_at = None
+    vision_main.ball_tracker_at = None
+    ball_morph_kernel = np.ones((vision_main.BALL_MORPH_KERNEL_SIZE, vision_main.BALL_MORPH_KERNEL_SIZE), np.uint8)
+    cam_params = (camera_matrix[0, 0], camera_matrix[1, 1], camera_matrix[0, 2], camera_matrix[1, 2])
+    return ball_morph_kernel, cam_params
+
+def distorted_scenes(camera_matrix, dist_coeffs, layouts, seed=1):
+    # [(raw camera frame, truth)] for `layouts` random arenas
+    distort_maps = build_distort_maps(camera_matrix, dist_coeffs)
+    rng = np.random.default_rng(seed)
+    scenes = []
+    for _ in range(layouts):
+        ideal, truth = render_arena(rng)
+        raw = cv2.remap(ideal, distort_maps[0], distort_maps[1], cv2.INTER_LINEAR, borderValue=(40, 110, 40))
+        scenes.append((raw, truth))
+    return scenes
+
+# moving robots for the tracking benchmark: ~1.5 m/s on a ~2.4 m pitch that spans most of the frame
+BENCH_TRACK_FPS = 30.0
+BENCH_TRACK_SPEED_PX_S = 600.0
+BENCH_TRACK_TURN_RAD_S = 3.0
+BENCH_TRACK_OCCLUDED = (7, 40, 52)  # (tag_id, first frame, last frame) the tag is covered, e.g. by another robot
+BENCH_TRACK_BALL_SPEED_PX_S = 900.0
+BENCH_TRACK_BALL_HIDDEN = (60, 66)  # frames the ball is hidden, e.g. under a robot
+
+def moving_scenes(camera_matrix, dist_coeffs, frames, seed=2, width=BENCH_FRAME_W, height=BENCH_FRAME_H, margin=0.12):
+    # [(raw camera frame, capture timestamp, truth)] for robots and the ball bouncing around the pitch at BENCH_TRACK_FPS.
+    # truth['ball'] is None while the ball is hidden.
+    distort_maps = build_distort_maps(camera_matrix, dist_coeffs, width, height)
+    rng = np.random.default_rng(seed)
+    background = synthetic_frame(width, height, seed=seed)
+    lo = np.array([width * margin, height * margin])
+    hi = np.array([width * (1 - margin), height * (1 - margin)])
+    state = {}
+    for tag_id in BENCH_TAG_IDS:
+        heading = rng.uniform(-np.pi, np.pi)
+        state[tag_id] = [rng.uniform(lo, hi), BENCH_TRACK_SPEED_PX_S * np.array([np.cos(heading), np.sin(heading)]), rng.uniform(-np.pi, np.pi)]
+    heading = rng.uniform(-np.pi, np.pi)
+    ball = [rng.uniform(lo, hi), BENCH_TRACK_BALL_SPEED_PX_S * np.array([np.cos(heading), np.sin(heading)])]
+    occluded_id, occluded_from, occluded_to = BENCH_TRACK_OCCLUDED
+    dt = 1.0 / BENCH_TRACK_FPS
+    scenes = []
+    for i in range(frames):
+        ideal = background.copy()
+        tags = {}
+        for tag_id, (pos, vel, angle) in state.items():
+            if tag_id == occluded_id and occluded_from <= i <= occluded_to: continue
+            tags[tag_id] = draw_tag(ideal, tag_id, pos, angle)
+        ball_truth = None
+        if not BENCH_TRACK_BALL_HIDDEN[0] <= i <= BENCH_TRACK_BALL_HIDDEN[1]:
+            ball_truth = tuple(ball[0])
+            cv2.circle(ideal, tuple(np.round(ball[0] * 16).astype(int)), BENCH_BALL_RADIUS_PX * 16, BENCH_BALL_BGR, -1, cv2.LINE_AA, 4)
+        raw = cv2.remap(ideal, distort_maps[0], distort_maps[1], cv2.INTER_LINEAR, borderValue=(40, 110, 40))
+        scenes.append((raw, i * dt, {'tags': tags, 'ball': ball_truth}))
+        for pos, vel in (ball,):
+            pos += vel * dt
+            vel[(pos < lo) | (pos > hi)] *= -1.0
+        for tag_state in state.values():
+            pos, vel, _ = tag_state
+            pos += vel * dt
+            bounce = (pos < lo) | (pos > hi)
+            vel[bounce] *= -1.0
+            tag_state[2] += BENCH_TRACK_TURN_RAD_S * dt
+    return scenes
+
+NO_TAGS = ([], np.empty((0, 4, 2), np.float32), None)
+
+def _angle_diff_deg(a, b):
+    return abs((a - b + 180.0) % 360.0 - 180.0)
+
+def bench_undistort_mode(camera_matrix=BENCH_CAMERA_MATRIX, dist_coeffs=BENCH_DIST_COEFFS, layouts=BENCH_LAYOUTS, frames=BENCH_FRAMES):
+    import main as vision_main
+    import xform_sandbox
+
+    ball_morph_kernel, cam_params = setup_vision_globals(vision_main, camera_matrix, dist_coeffs)
+    # every layout is unrelated to the previous one, nothing for the ROI trackers to follow
+    vision_main.TAG_ROI_TRACKING = False
+    vision_main.BALL_ROI_TRACKING = False
+    # fixed detector settings, so both modes are timed on the same work
+    vision_main.VISION_ADAPTIVE_DETECTOR = False
+    tag_size_px = BENCH_TAG_SIZE_PX
+    # metric truth: a tag seen with zero distortion and exact corners
+    object_points = vision_main.TAG_OBJECT_POINTS
+    scenes = distorted_scenes(camera_matrix, dist_coeffs, layouts)
+
+    print(f"\nUndistortion mode: full frame vs detected points only ({layouts} synthetic {BENCH_FRAME_W}x{BENCH_FRAME_H} layouts, "
+          f"{len(BENCH_TAG_IDS)} tags of {tag_size_px} px + ball)")
+    print(f"{'mode':>8} {'p50 ms':>8} {'p95 ms':>8} {'tags':>6} {'ball':>6} {'ball err px':>12} {'tag err px':>11} {'pos err mm':>11} {'yaw err deg':>12}")
+    for mode in ("frame", "points"):
+        vision_main.VISION_UNDISTORT_MODE = mode
+        ball_err, corner_err, pos_err, yaw_err = [], [], [], []
+        found_tags = found_balls = 0
+        for raw, truth in scenes:
+            payload = vision_main.process_vision_frame(raw, ball_morph_kernel, cam_params)
+            if payload['ball_sim_pos'] is not None:
+                found_balls += 1
+                ball_err.append(np.hypot(payload['ball_sim_pos'][0] - truth['ball'][0], payload['ball_sim_pos'][1] - truth['ball'][1]))
+            for tag_id, corners in truth['tags'].items():
+                if tag_id not in payload['robot_positions']: continue
+                found_tags += 1
+                ok, _, tvec = cv2.solvePnP(object_points, corners, camera_matrix, None, flags=cv2.SOLVEPNP_IPPE_SQUARE)
+                pos = payload['robot_positions'][tag_id]
+                pos_err.append(np.hypot(pos[0] - tvec[0][0], pos[1] - tvec[1][0]) * 1000.0)
+                true_yaw = xform_sandbox.calculate_orientation_from_sim_corners(corners.reshape(-1, 1, 2),
+                                                                                vision_main.SIM_ORIENT_FRONT_INDICES, vision_main.SIM_ORIENT_BACK_INDICES)
+                if tag_id in payload['robot_orientations']:
+                    yaw_err.append(_angle_diff_deg(payload['robot_orientations'][tag_id], true_yaw))
+            # corner accuracy straight from the detector, mapped the way each mode maps them
+            frame = raw if mode == "points" else undistort_maps.undistort_frame(raw, vision_main.undistort_maps_at)
+            for tag in vision_main.apriltag_detector_at.detect(cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)):
+                if tag.tag_id not in truth['tags']: continue
+                corners = tag.corners.reshape(-1, 1, 2).astype(np.float32)
+                if mode == "points": corners = undistort_maps.undistort_points(corners, camera_matrix, dist_coeffs)
+                corner_err.append(np.abs(corners.reshape(-1, 2) - truth['tags'][tag.tag_id]).max())
+
+        timings = time_per_frame_ms(lambda: vision_main.process_vision_frame(scenes[0][0], ball_morph_kernel, cam_params), frames)
+        mean = lambda v: float(np.mean(v)) if v else float('nan')
+        print(f"{mode:>8} {_percentile(timings, 50):>8.2f} {_percentile(timings, 95):>8.2f} "
+              f"{found_tags:>3}/{layouts * len(BENCH_TAG_IDS):<3}{found_balls:>3}/{layouts:<3}"
+              f"{mean(ball_err):>12.3f} {mean(corner_err):>11.3f} {mean(pos_err):>11.2f} {mean(yaw_err):>12.2f}")
+    print("  errors are means against the drawn ground truth; tag err = worst corner per tag, pos err = camera-frame x/y")
+
+def bench_parallel_stages(camera_matrix=BENCH_CAMERA_MATRIX, dist_coeffs=BENCH_DIST_COEFFS, frames=BENCH_FRAMES):
+    import main as vision_main
+
+    ball_morph_kernel, cam_params = setup_vision_globals(vision_main, camera_matrix, dist_coeffs)
+    scenes = distorted_scenes(camera_matrix, dist_coeffs, 4)
+    vision_main.TAG_ROI_TRACKING = False
+    vision_main.BALL_ROI_TRACKING = False
+    vision_main.VISION_ADAPTIVE_DETECTOR = False
+    print(f"\nBall + tag stages, serial vs concurrent ({frames} frames, undistort mode '{vision_main.VISION_UNDISTORT_MODE}'), p50 ms")
+    print(f"{'stages':>10} {'undistort':>10} {'ball':>8} {'tags':>8} {'total':>8}")
+    for parallel in (False, True):
+        vision_main.VISION_PARALLEL_STAGES = parallel
+        vision_main.vision_stage_timings.clear()
+        for i in range(frames):
+            vision_main.process_vision_frame(scenes[i % len(scenes)][0], ball_morph_kernel, cam_params)
+        stats = vision_main.get_vision_stage_stats()
+        print(f"{'parallel' if parallel else 'serial':>10} {stats['undistort']['p50']:>10.2f} {stats['ball']['p50']:>8.2f} "
+              f"{stats['tags']['p50']:>8.2f} {stats['total']['p50']:>8.2f}")
+
+def bench_tag_tracking(camera_matrix=BENCH_CAMERA_MATRIX, dist_coeffs=BENCH_DIST_COEFFS, frames=BENCH_FRAMES):
+    import main as vision_main
+    import roi_tracking
+
+    setup_vision_globals(vision_main, camera_matrix, dist_coeffs)
+    cam_params = (camera_matrix[0, 0], camera_matrix[1, 1], camera_matrix[0, 2], camera_matrix[1, 2])
+    scenes = moving_scenes(camera_matrix, dist_coeffs, frames)
+    visible = sum(len(truth['tags']) for _, _, truth in scenes)
+    points_mode = vision_main.VISION_UNDISTORT_MODE == "points"
+    print(f"\nRobot tag detection on {frames} frames of moving robots ({BENCH_TRACK_SPEED_PX_S:.0f} px/s at {BENCH_TRACK_FPS:.0f} fps, "
+          f"tag {BENCH_TRACK_OCCLUDED[0]} covered for frames {BENCH_TRACK_OCCLUDED[1]}-{BENCH_TRACK_OCCLUDED[2]}), tag stage + mapping")
+    print(f"{'detector':>10} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'hits':>10}")
+    vision_main.VISION_ADAPTIVE_DETECTOR = False
+    for tracking in (False, True):
+        vision_main.TAG_ROI_TRACKING = tracking
+        vision_main.tag_tracker_at = None
+        samples, hits = [], 0
+        for raw, ts, truth in scenes:
+            start = time.perf_counter()
+            _, positions, _ = vision_main.map_detections_to_sim(None, vision_main.tag_stage(raw, cam_params, points_mode, ts), points_mode)
+            samples.append((time.perf_counter() - start) * 1000.0)
+            hits += sum(1 for tag_id in truth['tags'] if tag_id in positions)
+        samples.sort()
+        print(f"{'roi' if tracking else 'full':>10} {_percentile(samples, 50):>8.2f} {_percentile(samples, 95):>8.2f} {samples[-1]:>8.2f} "
+              f"{hits:>5}/{visible:<4}")
+    print(f"  tracker: {vision_main.tag_tracker_at.stats()}, full scans decimated x{vision_main.TAG_FULL_SCAN_QUAD_DECIMATE}, "
+          f"every {roi_tracking.TAG_FULL_SCAN_INTERVAL_FRAMES} frames or on a lost tag")
+
+def bench_adaptive_detector(camera_matrix=BENCH_CAMERA_MATRIX, dist_coeffs=BENCH_DIST_COEFFS, frames=BENCH_FRAMES * 2):
+    import main as vision_main
+
+    setup_vision_globals(vision_main, camera_matrix, dist_coeffs)
+    cam_params = (camera_matrix[0, 0], camera_matrix[1, 1], camera_matrix[0, 2], camera_matrix[1, 2])
+    scenes = moving_scenes(camera_matrix, dist_coeffs, frames)
+    visible = sum(len(truth['tags']) for _, _, truth in scenes)
+    points_mode = vision_main.VISION_UNDISTORT_MODE == "points"
+    print(f"\nFull-frame tag detection, fixed vs adaptive detector settings (target {vision_main.VISION_DETECTOR_TARGET_MS:.0f} ms, {frames} frames)")
+    print(f"{'settings':>10} {'p50 ms':>8} {'p95 ms':>8} {'hits':>10}  final detector state")
+    vision_main.TAG_ROI_TRACKING = False
+    for adaptive in (False, True):
+        vision_main.VISION_ADAPTIVE_DETECTOR = adaptive
+        setup_vision_globals(vision_main, camera_matrix, dist_coeffs)
+        vision_main.detector_controller_at = None
+        samples, hits = [], 0
+        for raw, ts, truth in scenes:
+            start = time.perf_counter()
+            _, positions, _ = vision_main.map_detections_to_sim(None, vision_main.tag_stage(raw, cam_params, points_mode, ts), points_mode)
+            samples.append((time.perf_counter() - start) * 1000.0)
+            hits += sum(1 for tag_id in truth['tags'] if tag_id in positions)
+        # settle time included: the controller starts from DETECTOR_KWARGS
+        settled = sorted(samples[frames // 2:])
+        state = vision_main.detector_controller_at.state() if adaptive else vision_main.DETECTOR_KWARGS
+        print(f"{'adaptive' if adaptive else 'fixed':>10} {_percentile(settled, 50):>8.2f} {_percentile(settled, 95):>8.2f} "
+              f"{hits:>5}/{visible:<4}  {state if adaptive else {k: state[k] for k in ('quad_decimate', 'nthreads')}}")
+    print("  p50/p95 over the second half of the run, after the controller has settled")
+
+def bench_ball_tracking(camera_matrix=BENCH_CAMERA_MATRIX, dist_coeffs=BENCH_DIST_COEFFS, frames=BENCH_FRAMES):
+    import main as vision_main
+
+    ball_morph_kernel, _ = setup_vision_globals(vision_main, camera_matrix, dist_coeffs)
+    scenes = moving_scenes(camera_matrix, dist_coeffs, frames)
+    visible = sum(1 for _, _, truth in scenes if truth['ball'] is not None)
+    points_mode = vision_main.VISION_UNDISTORT_MODE == "points"
+    print(f"\nBall detection on {frames} frames, ball moving at {BENCH_TRACK_BALL_SPEED_PX_S:.0f} px/s, hidden for frames "
+          f"{BENCH_TRACK_BALL_HIDDEN[0]}-{BENCH_TRACK_BALL_HIDDEN[1]}; ball stage + mapping")
+    print(f"{'search':>8} {'p50 ms':>8} {'p95 ms':>8} {'max ms':>8} {'found':>9} {'false':>6} {'err px':>7}")
+    for tracking in (False, True):
+        vision_main.BALL_ROI_TRACKING = tracking
+        vision_main.ball_tracker_at = None
+        samples, found, false_hits, errors = [], 0, 0, []
+        for raw, ts, truth in scenes:
+            start = time.perf_counter()
+            ball = vision_main.map_detections_to_sim(vision_main.ball_stage(raw, ball_morph_kernel, ts), NO_TAGS, points_mode)[0]
+            samples.append((time.perf_counter() - start) * 1000.0)
+            if ball is None: continue
+            if truth['ball'] is None:
+                false_hits += 1; continue
+            found += 1
+            errors.append(np.hypot(ball[0] - truth['ball'][0], ball[1] - truth['ball'][1]))
+        samples.sort()
+        print(f"{'roi' if tracking else 'full':>8} {_percentile(samples, 50):>8.2f} {_percentile(samples, 95):>8.2f} {samples[-1]:>8.2f} "
+              f"{found:>4}/{visible:<4} {false_hits:>6} {float(np.mean(errors)):>7.3f}")
+    print(f"  tracker: {vision_main.ball_tracker_at.stats()}")
+
+def bench_ball_lut(camera_matrix=BENCH_CAMERA_MATRIX, dist_coeffs=BENCH_DIST_COEFFS, layouts=BENCH_LAYOUTS, frames=BENCH_FRAMES):
+    import main as vision_main
+
+    ball_morph_kernel, _ = setup_vision_globals(vision_main, camera_matrix, dist_coeffs)
+    # every layout also dimmed, so ball edge pixels sit close to the S/V bounds where LUT bins and inRange can differ
+    scenes = [raw for raw, _ in distorted_scenes(camera_matrix, dist_coeffs, layouts)]
+    scenes += [cv2.convertScaleAbs(raw, alpha=0.6) for raw in scenes]
+    reference = [cv2.inRange(cv2.cvtColor(raw, cv2.COLOR_BGR2HSV), vision_main.LOWER_YELLOW_HSV, vision_main.UPPER_YELLOW_HSV) for raw in scenes]
+    reference_balls = [vision_main.detect_ball_pixel(raw, ball_morph_kernel) for raw in scenes]
+    print(f"\nBall colour segmentation, full {BENCH_FRAME_W}x{BENCH_FRAME_H} frame ({layouts} layouts, each also at 60% brightness), "
+          f"agreement vs cvtColor + inRange")
+    print(f"{'segmenter':>10} {'mask p50':>9} {'mask p95':>9} {'detect p50':>11} {'pixels agree':>13} {'mask IoU':>9} {'ball':>9} {'max d px':>9}")
+    for segmenter, half in (("hsv", False), ("lut", False), ("lut", True)):
+        vision_main.BALL_SEGMENTER = segmenter
+        vision_main.BALL_LUT_HALF_RESOLUTION = half
+        agree, ious, found, centre_diff = [], [], 0, [0.0]
+        for raw, ref, ref_ball in zip(scenes, reference, reference_balls):
+            mask = vision_main.ball_colour_mask(raw)
+            agree.append(float(np.mean(mask == ref)))
+            ious.append(np.count_nonzero(mask & ref) / max(1, np.count_nonzero(mask | ref)))
+            ball = vision_main.detect_ball_pixel(raw, ball_morph_kernel)
+            if ball is None or ref_ball is None: continue
+            found += 1
+            centre_diff.append(float(np.hypot(ball[0] - ref_ball[0], ball[1] - ref_ball[1])))
+        mask_ms = time_per_frame_ms(lambda: vision_main.ball_colour_mask(scenes[0]), frames)
+        detect_ms = time_per_frame_ms(lambda: vision_main.detect_ball_pixel(scenes[0], ball_morph_kernel), frames)
+        name = segmenter + (" 1/2" if half else "")
+        print(f"{name:>10} {_percentile(mask_ms, 50):>9.2f} {_percentile(mask_ms, 95):>9.2f} {_percentile(detect_ms, 50):>11.2f} "
+              f"{np.mean(agree):>13.5%} {np.mean(ious):>9.4f} {found:>4}/{sum(b is not None for b in reference_balls):<4} {max(centre_diff):>9.2f}")
+    lut = vision_main.ball_colour_lut_at
+    rebuilds = []
+    for i in range(20):
+        start = time.perf_counter()
+        lut.set_bounds(vision_main.LOWER_YELLOW_HSV + (i % 2), vision_main.UPPER_YELLOW_HSV)
+        rebuilds.append((time.perf_counter() - start) * 1000.0)
+    rebuilds.sort()
+    print(f"  LUT: {lut.stats()['bits']} bits per channel, table rebuild on a bounds change p50 {_percentile(rebuilds, 50):.2f} ms, "
+          f"max {rebuilds[-1]:.2f} ms; ball = frames where both paths found one, max d = worst centre difference")
+
+def _map_detections_per_tag(vision_main, ball_px, tag_detections, points_mode):
+    # the previous mapping: tiny arrays and separate cv2 calls per tag and for the ball, orientation in Python
+    import xform_sandbox
+    tag_ids, pixel_corners, cam_xy = tag_detections
+    ball_sim = None
+    if ball_px is not None:
+        pt = np.array([[ball_px]], dtype=np.float32)
+        if points_mode: pt = undistort_maps.undistort_points(pt, vision_main.camera_matrix_at, vision_main.dist_coeffs_at)
+        pt = cv2.perspectiveTransform(pt, vision_main.perspective_matrix_pixel_to_sim_at)
+        ball_sim = (pt[0][0][0], pt[0][0][1])
+    positions, orientations = {}, {}
+    for i, tag_id in enumerate(tag_ids):
+        corners = pixel_corners[i].reshape(-1, 1, 2)
+        if points_mode:
+            corners = undistort_maps.undistort_points(corners, vision_main.camera_matrix_at, vision_main.dist_coeffs_at)
+            xy = vision_main.tag_cam_xy_from_undistorted_corners(corners)
+        else:
+            xy = cam_xy[i]
+        pt = cv2.perspectiveTransform(np.array([[xy]], dtype=np.float32), vision_main.perspective_matrix_metric_to_sim_at)
+        positions[tag_id] = (pt[0][0][0], pt[0][0][1])
+        sim_corners = cv2.perspectiveTransform(corners, vision_main.perspective_matrix_pixel_to_sim_at)
+        orientations[tag_id] = xform_sandbox.calculate_orientation_from_sim_corners(
+            sim_corners, vision_main.SIM_ORIENT_FRONT_INDICES, vision_main.SIM_ORIENT_BACK_INDICES)
+    return ball_sim, positions, orientations
+
+def bench_map_detections(camera_matrix=BENCH_CAMERA_MATRIX, dist_coeffs=BENCH_DIST_COEFFS, frames=BENCH_FRAMES * 10):
+    import main as vision_main
+
+    ball_morph_kernel, cam_params = setup_vision_globals(vision_main, camera_matrix, dist_coeffs)
+    # a real-looking perspective so the homography isn't trivially the identity
+    vision_main.perspective_matrix_pixel_to_sim_at = np.array([[0.0021, 0.0001, -0.3], [-0.00005, 0.0022, -0.2], [0.00001, 0.00002, 1.0]])
+    vision_main.perspective_matrix_metric_to_sim_at = np.array([[1.02, 0.01, 1.2], [-0.01, 1.01, 1.0], [0.0, 0.0, 1.0]])
+    vision_main.TAG_ROI_TRACKING = False
+    vision_main.VISION_ADAPTIVE_DETECTOR = False
+    raw, _ = distorted_scenes(camera_matrix, dist_coeffs, 1)[0]
+    print(f"\nDetections -> sim coordinates, per frame ({len(BENCH_TAG_IDS)} tags + ball, {frames} runs), ms")
+    print(f"{'mode':>8} {'per tag p50':>12} {'batched p50':>12} {'max |diff|':>11}")
+    for mode in ("frame", "points"):
+        points_mode = mode == "points"
+        frame = raw if points_mode else undistort_maps.undistort_frame(raw, vision_main.undistort_maps_at)
+        ball_px = vision_main.ball_stage(frame, ball_morph_kernel)
+        tags = vision_main.tag_stage(frame, cam_params, points_mode)
+        per_tag = time_per_frame_ms(lambda: _map_detections_per_tag(vision_main, ball_px, tags, points_mode), frames)
+        batched = time_per_frame_ms(lambda: vision_main.map_detections_to_sim(ball_px, tags, points_mode), frames)
+        old, new = _map_detections_per_tag(vision_main, ball_px, tags, points_mode), vision_main.map_detections_to_sim(ball_px, tags, points_mode)
+        diff = max([abs(a - b) for a, b in zip(old[0], new[0])] +
+                   [abs(old[1][t][k] - new[1][t][k]) for t in old[1] for k in (0, 1)] +
+                   [_angle_diff_deg(old[2][t], new[2][t]) for t in old[2]])
+        print(f"{mode:>8} {_percentile(per_tag, 50):>12.3f} {_percentile(batched, 50):>12.3f} {diff:>11.2e}")
+
+def _record_session(session_dir, scenes):
+    import frame_source
+    recorder = frame_source.FrameRecorder(session_dir, BENCH_FRAME_W, BENCH_FRAME_H, BENCH_TRACK_FPS, codec="lossless", source_name="bench_vision")
+    start = time.perf_counter()
+    for raw, ts, _ in scenes:
+        recorder.write(raw, start + ts, block=True)
+    recorder.close()
+
+def bench_replay(session_dir=None, camera_matrix=BENCH_CAMERA_MATRIX, dist_coeffs=BENCH_DIST_COEFFS, frames=BENCH_FRAMES):
+    # whole-frame throughput from a recording: decode + process_vision_frame, frames replayed as fast as they decode
+    import frame_source
+    import main as vision_main
+
+    session_dir = session_dir or frame_source.REPLAY_DIR
+    scenes, tmp = None, None
+    if session_dir is None:
+        tmp = tempfile.TemporaryDirectory()
+        session_dir = os.path.join(tmp.name, "session")
+        scenes = moving_scenes(camera_matrix, dist_coeffs, frames)
+        _record_session(session_dir, scenes)
+    else:
+        recorded = glob.glob(os.path.join(session_dir, frame_source.CALIBRATION_SUBDIR, "camera_calibration_*.npz"))
+        if recorded:
+            calibration = np.load(recorded[0])
+            camera_matrix, dist_coeffs = calibration['camera_matrix'], calibration['dist_coeffs']
+    source = frame_source.ReplaySource(session_dir, mode="max")
+    width, height = int(source.get(cv2.CAP_PROP_FRAME_WIDTH)), int(source.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    ball_morph_kernel, cam_params = setup_vision_globals(vision_main, camera_matrix, dist_coeffs, width, height)
+    decode_ms, process_ms, tags_found, balls_found, mismatched = [], [], 0, 0, 0
+    start = time.perf_counter()
+    while True:
+        t0 = time.perf_counter()
+        ok, frame = source.read()
+        if not ok: break
+        t1 = time.perf_counter()
+        payload = vision_main.process_vision_frame(frame, ball_morph_kernel, cam_params, source.last_recorded_ts)
+        t2 = time.perf_counter()
+        decode_ms.append((t1 - t0) * 1000.0); process_ms.append((t2 - t1) * 1000.0)
+        tags_found += len(payload['robot_positions']); balls_found += payload['ball_sim_pos'] is not None
+        if scenes is not None and not np.array_equal(frame, scenes[source.frames_read - 1][0]):
+            mismatched += 1
+    elapsed = time.perf_counter() - start
+    source.release()
+    n = len(process_ms)
+    decode_ms.sort(); process_ms.sort()
+    print(f"\nReplay of {session_dir if tmp is None else f'{n} synthetic moving-robot frames'} ({width}x{height}), max speed")
+    print(f"{'frames':>7} {'fps':>7} {'decode p50':>11} {'process p50':>12} {'process p95':>12} {'tags/frame':>11} {'ball':>9}")
+    print(f"{n:>7} {n / elapsed:>7.1f} {_percentile(decode_ms, 50):>11.2f} {_percentile(process_ms, 50):>12.2f} "
+          f"{_percentile(process_ms, 95):>12.2f} {tags_found / max(1, n):>11.2f} {balls_found:>4}/{n:<4}")
+    if scenes is not None:
+        print(f"  lossless round trip: {n - mismatched}/{len(scenes)} replayed frames identical to the rendered ones")
+        tmp.cleanup()
+
+BENCHMARKS = {
+    "undistort": bench_undistort,
+    "undistort_mode": bench_undistort_mode,
+    "parallel_stages": bench_parallel_stages,
+    "tag_tracking": bench_tag_tracking,
+    "adaptive_detector": bench_adaptive_detector,
+    "ball_tracking": bench_ball_tracking,
+    "ball_lut": bench_ball_lut,
+    "map_detections": bench_map_detections,
+    "replay": bench_replay,
+}
+
+if __name__ == "__main__":
+    for name in sys.argv[1:] or BENCHMARKS:
+        BENCHMARKS[name]()
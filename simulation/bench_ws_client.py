@@ -0,0 +1,168 @@
+# Copyright (c) 2025 Oguzhan Cagirir (OguzhanCOG), KCL Electronics Society
+#
+# Project: KCL FoAI RoboFootball System
+# File: bench_ws_client.py
+# Description: Latency benchmark for the game-thread -> WebSocket command hand-off in ws_client.py.
+#
+# Author: Oguzhan Cagirir (OguzhanCOG)
+# Date: May 24, 2025
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the MIT License as published by
+# the Open Source Initiative.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# MIT License for more details.
+#
+# You should have received a copy of the MIT License
+# along with this program. If not, see <https://opensource.org/licenses/MIT>.
+#
+# --- Version: 1.0.0 ---
+#
+# Run from inside simulation/:
+#   python bench_ws_client.py
+# Starts a local websocket server, sends joystick commands from this (game) thread
+# at the sim tick rate and measures call -> server receive latency for:
+#   legacy  - asyncio.Queue filled with put_nowait from the game thread, consumer polls with wait_for(0.1)
+#   handoff - WebSocketGameClient: per-robot pending slot + call_soon_threadsafe wakeup
+
+import asyncio
+import json
+import socket
+import threading
+import time
+
+import websockets
+
+import ws_client
+
+BENCH_COMMANDS = 300
+BENCH_RATE_HZ = 60
+BENCH_ROBOT_ID = 3
+
+def _percentile(sorted_values, pct):
+    if not sorted_values: return float('nan')
+    return sorted_values[min(len(sorted_values) - 1, max(0, int(round(pct / 100.0 * len(sorted_values))) - 1))]
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+class _ReceiveServer:
+    """Local websocket server that stamps every received message with perf_counter()."""
+    def __init__(self):
+        self.port = _free_port()
+        self.arrivals = []
+        self.connected = threading.Event()
+        self._ready = threading.Event()
+        self._stop = None
+        self.loop = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    async def _handler(self, connection):
+        self.connected.set()
+        async for _ in connection:
+            self.arrivals.append(time.perf_counter())
+
+    async def _serve(self):
+        self._stop = asyncio.Event()
+        async with websockets.serve(self._handler, "127.0.0.1", self.port):
+            self._ready.set()
+            await self._stop.wait()
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        self.loop.run_until_complete(self._serve())
+        self.loop.close()
+
+    def start(self):
+        self.thread.start()
+        self._ready.wait()
+        return f"ws://127.0.0.1:{self.port}"
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self._stop.set)
+        self.thread.join(timeout=5.0)
+
+class _LegacyQueueClient:
+    """The previous ws_client send path, kept here only as the baseline."""
+    def __init__(self, uri):
+        self.uri = uri
+        self.running = False
+        self.is_connected = False
+        self.loop = None
+        self.command_queue = None
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    async def _send_loop(self):
+        self.command_queue = asyncio.Queue(maxsize=100)
+        async with websockets.connect(self.uri) as connection:
+            self.is_connected = True
+            while self.running:
+                try:
+                    command_payload = await asyncio.wait_for(self.command_queue.get(), timeout=0.1)
+                except asyncio.TimeoutError:
+                    continue
+                await connection.send(json.dumps(command_payload))
+
+    def _run(self):
+        self.loop = asyncio.new_event_loop()
+        self.loop.run_until_complete(self._send_loop())
+        self.loop.close()
+
+    def start(self):
+        self.running = True
+        self.thread.start()
+
+    def stop(self):
+        self.running = False
+        self.thread.join(timeout=5.0)
+
+    def check_if_actively_connected(self):
+        return self.running and self.is_connected
+
+    def send_joystick_command(self, userid, x, y):
+        payload = {"type": "joystick", "userid": userid, "joystick": {'x': round(x,2), 'y': round(y,2)},
+                   "ts_ms": int(time.monotonic() * 1000)}
+        self.command_queue.put_nowait(payload)
+
+def _run_client(make_client, commands, rate_hz):
+    server = _ReceiveServer()
+    uri = server.start()
+    client = make_client(uri)
+    client.start()
+    deadline = time.perf_counter() + 5.0
+    while not client.check_if_actively_connected() and time.perf_counter() < deadline:
+        time.sleep(0.01)
+    server.connected.wait(timeout=5.0)
+
+    period = 1.0 / rate_hz
+    called_at = []
+    start = time.perf_counter()
+    for i in range(commands):
+        delay = start + i * period - time.perf_counter()
+        if delay > 0: time.sleep(delay)
+        called_at.append(time.perf_counter())
+        client.send_joystick_command(BENCH_ROBOT_ID, 0.5, -0.5)
+    time.sleep(0.3)
+    client.stop()
+    server.stop()
+    # one command per tick and the tick period is well above the send time, so arrivals line up with calls
+    latencies = sorted((arrived - called) * 1000.0 for called, arrived in zip(called_at, server.arrivals))
+    return latencies, len(server.arrivals), client
+
+def bench_handoff(commands=BENCH_COMMANDS, rate_hz=BENCH_RATE_HZ):
+    print(f"send_joystick_command -> server receive latency, {commands} commands at {rate_hz} Hz")
+    print(f"{'path':>8} {'recv':>6} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for name, make_client in (("legacy", _LegacyQueueClient), ("handoff", ws_client.WebSocketGameClient)):
+        latencies, received, client = _run_client(make_client, commands, rate_hz)
+        print(f"{name:>8} {received:>6} {_percentile(latencies, 50):>8.2f} {_percentile(latencies, 95):>8.2f} "
+              f"{_percentile(latencies, 99):>8.2f} {latencies[-1] if latencies else float('nan'):>8.2f}")
+        if isinstance(client, ws_client.WebSocketGameClient):
+            print(f"{'':>8} client stats: {client.stats}, enqueue -> send(): {client.get_send_latency_stats()}")
+
+if __name__ == "__main__":
+    bench_handoff()
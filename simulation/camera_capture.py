@@ -0,0 +1,108 @@
+# Copyright (c) 2025 Oguzhan Cagirir (OguzhanCOG), KCL Electronics Society
+#
+# Project: KCL FoAI RoboFootball System
+# File: camera_capture.py
+# Description: Dedicated camera capture thread that keeps only the newest frame, stamped with capture time and index.
+#
+# Author: Oguzhan Cagirir (OguzhanCOG)
+# Date: May 24, 2025
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the MIT License as published by
+# the Open Source Initiative.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# MIT License for more details.
+#
+# You should have received a copy of the MIT License
+# along with this program. If not, see <https://opensource.org/licenses/MIT>.
+#
+# --- Version: 1.0.0 ---
+
+import collections
+import threading
+import time
+
+import cv2
+
+# capture_ts is time.perf_counter() right after read() returned; frame_index counts every frame grabbed
+CapturedFrame = collections.namedtuple("CapturedFrame", ["image", "capture_ts", "frame_index"])
+
+CAPTURE_READ_FAIL_SLEEP_SECONDS = 0.05
+
+class LatestFrameCapture:
+    """Reads a cv2.VideoCapture as fast as the camera delivers on its own thread.
+
+    Only the newest frame is kept. A consumer that is slower than the camera skips
+    straight to the latest frame instead of working through the driver's backlog,
+    so its latency is bounded by one processing cycle.
+    """
+    def __init__(self, capture):
+        self.capture = capture
+        self.thread = None
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._latest = None
+        self._last_taken_index = -1
+        self.frames_captured = 0
+        self.frames_taken = 0
+        self.frames_dropped = 0
+        self.read_failures = 0
+        # keep the driver queue short too, where the backend supports it
+        self.capture.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+    def start(self):
+        if self.thread and self.thread.is_alive():
+            return
+        self._stop.clear()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        print("CAPTURE: Capture thread started.")
+
+    def stop(self, timeout=2.0):
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=timeout)
+            if self.thread.is_alive(): print("CAPTURE: Warning: capture thread did not stop in time.")
+        print(f"CAPTURE: Stopped. {self.stats()}")
+
+    def _run(self):
+        frame_index = 0
+        while not self._stop.is_set():
+            ret, image = self.capture.read()
+            capture_ts = time.perf_counter()
+            if not ret:
+                self.read_failures += 1
+                time.sleep(CAPTURE_READ_FAIL_SLEEP_SECONDS)
+                continue
+            with self._cond:
+                if self._latest is not None and self._latest.frame_index > self._last_taken_index:
+                    self.frames_dropped += 1
+                self._latest = CapturedFrame(image, capture_ts, frame_index)
+                self.frames_captured += 1
+                self._cond.notify_all()
+            frame_index += 1
+
+    def get_latest(self, after_index=-1, timeout=None):
+        """Newest frame with frame_index > after_index, waiting up to timeout. None on timeout or stop."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._stop.is_set() or (self._latest is not None and self._latest.frame_index > after_index),
+                                timeout)
+            latest = self._latest
+            if latest is None or latest.frame_index <= after_index:
+                return None
+            self._last_taken_index = latest.frame_index
+            self.frames_taken += 1
+            return latest
+
+    def stats(self):
+        return {
+            'captured': self.frames_captured,
+            'taken': self.frames_taken,
+            'dropped': self.frames_dropped,
+            'read_failures': self.read_failures,
+        }
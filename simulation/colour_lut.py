@@ -0,0 +1,111 @@
+# Copyright (c) 2025 Oguzhan Cagirir (OguzhanCOG), KCL Electronics Society
+#
+# Project: KCL FoAI RoboFootball System
+# File: colour_lut.py
+# Description: Ball colour segmentation through a precomputed BGR colour-membership table instead of a per-frame HSV conversion.
+#
+# Author: Oguzhan Cagirir (OguzhanCOG)
+# Date: May 24, 2025
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the MIT License as published by
+# the Open Source Initiative.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# MIT License for more details.
+#
+# You should have received a copy of the MIT License
+# along with this program. If not, see <https://opensource.org/licenses/MIT>.
+#
+# --- Version: 1.0.0 ---
+#
+# The table has 2**COLOUR_LUT_BITS bins per BGR channel. A bin is "ball" if most of its sample colours fall inside
+# the HSV bounds under cv2.cvtColor + cv2.inRange, i.e. the same test the HSV path does per pixel.
+# The lookup is done with OpenCV kernels only:
+#   1. cv2.LUT quantises every byte to its bin index (one 8-bit table, frame viewed as a single channel)
+#   2. BGR -> BGRA with alpha cleared, so each pixel is 4 bytes (b, g, r, 0)
+#   3. those bytes read as a CV_16SC2 map are (x = b + 256 * g, y = r) on a little-endian machine,
+#      and cv2.remap with INTER_NEAREST reads the membership table laid out as an image at (x, y).
+
+import sys
+import time
+
+import cv2
+import numpy as np
+
+COLOUR_LUT_BITS = 6
+# sample colours per channel inside each bin; 1 = bin centre only. More samples move the bin edges closer to
+# inRange's, but at 6 bits 2 per axis agreed no better than 1 on benchmark frames and builds ~8x slower
+COLOUR_LUT_SAMPLES_PER_AXIS = 1
+
+class HsvColourLut:
+    """Mask of the pixels inside an HSV box, looked up straight from BGR.
+
+    set_bounds() rebuilds the table when the bounds actually change (a few ms), so the caller can pass
+    the current bounds every frame and the table follows live tuning. half_resolution segments every
+    other pixel and scales the mask back up, the mask always has the frame's size.
+    """
+    def __init__(self, lower_hsv, upper_hsv, bits=COLOUR_LUT_BITS, samples_per_axis=COLOUR_LUT_SAMPLES_PER_AXIS, half_resolution=False):
+        if sys.byteorder != 'little':
+            raise RuntimeError("HsvColourLut reads BGRA bytes as int16 pairs, which needs a little-endian machine")
+        if not 1 <= bits <= 6:
+            raise ValueError(f"bits must be 1..6 (cv2.remap wants the table narrower than SHRT_MAX), got {bits}")
+        self.bits = bits
+        self.samples_per_axis = max(1, min(samples_per_axis, 256 >> bits))
+        self.half_resolution = half_resolution
+        self.quantise = (np.arange(256) >> (8 - bits)).astype(np.uint8)
+        self.bounds = None
+        self.table = None
+        self.builds = 0
+        self.last_build_ms = 0.0
+        self.set_bounds(lower_hsv, upper_hsv)
+
+    def set_bounds(self, lower_hsv, upper_hsv):
+        # returns True if the table was rebuilt
+        bounds = (tuple(int(v) for v in lower_hsv), tuple(int(v) for v in upper_hsv))
+        if bounds == self.bounds:
+            return False
+        start = time.perf_counter()
+        self.table = self._build_table(*bounds)
+        self.bounds = bounds
+        self.builds += 1
+        self.last_build_ms = (time.perf_counter() - start) * 1000.0
+        return True
+
+    def _build_table(self, lower_hsv, upper_hsv):
+        bins = 1 << self.bits
+        bin_width = 256 >> self.bits
+        k = self.samples_per_axis
+        # k evenly spread sample values inside every bin, grouped by bin: shape (bins * k,)
+        offsets = (np.arange(k) * bin_width + bin_width // 2) // k
+        values = (np.arange(bins)[:, None] * bin_width + offsets[None, :]).reshape(-1).astype(np.uint8)
+        b, g, r = np.meshgrid(values, values, values, indexing='ij')
+        samples = np.stack([b, g, r], axis=-1).reshape(-1, bins * k, 3)
+        inside = cv2.inRange(cv2.cvtColor(samples, cv2.COLOR_BGR2HSV), np.array(lower_hsv), np.array(upper_hsv))
+        votes = inside.reshape(bins, k, bins, k, bins, k).mean(axis=(1, 3, 5), dtype=np.float32)
+        member = np.where(votes >= 127.5, 255, 0).astype(np.uint8)  # [b, g, r]
+        # image layout for the remap lookup: row r, column b + 256 * g
+        table = np.zeros((bins, 256 * bins), np.uint8)
+        columns = (np.arange(bins)[:, None] + 256 * np.arange(bins)[None, :]).reshape(-1)  # (b, g) -> x, b-major
+        table[:, columns] = member.reshape(bins * bins, bins).T
+        return table
+
+    def _lookup(self, bgr_frame):
+        height, width = bgr_frame.shape[:2]
+        quantised = cv2.LUT(np.ascontiguousarray(bgr_frame).reshape(height, -1), self.quantise).reshape(height, width, 3)
+        bgra = cv2.cvtColor(quantised, cv2.COLOR_BGR2BGRA)
+        cv2.bitwise_and(bgra, (255, 255, 255, 0), dst=bgra)
+        return cv2.remap(self.table, bgra.view(np.int16), None, cv2.INTER_NEAREST)
+
+    def mask(self, bgr_frame):
+        height, width = bgr_frame.shape[:2]
+        if self.half_resolution and height >= 2 and width >= 2:
+            small = cv2.resize(bgr_frame, (width // 2, height // 2), interpolation=cv2.INTER_NEAREST)
+            return cv2.resize(self._lookup(small), (width, height), interpolation=cv2.INTER_NEAREST)
+        return self._lookup(bgr_frame)
+
+    def stats(self):
+        return {'bits': self.bits, 'half_resolution': self.half_resolution, 'builds': self.builds,
+                'last_build_ms': round(self.last_build_ms, 2), 'bounds': self.bounds}
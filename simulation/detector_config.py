@@ -0,0 +1,169 @@
+# Copyright (c) 2025 Oguzhan Cagirir (OguzhanCOG), KCL Electronics Society
+#
+# Project: KCL FoAI RoboFootball System
+# File: detector_config.py
+# Description: Shared AprilTag detector settings and a runtime controller that tunes them to a per-frame time budget.
+#
+# Author: Oguzhan Cagirir (OguzhanCOG)
+# Date: May 24, 2025
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the MIT License as published by
+# the Open Source Initiative.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# MIT License for more details.
+#
+# You should have received a copy of the MIT License
+# along with this program. If not, see <https://opensource.org/licenses/MIT>.
+#
+# --- Version: 1.0.0 ---
+
+import collections
+import os
+import time
+
+import pupil_apriltags
+
+APRILTAG_FAMILY = "tag36h11"
+
+# starting point for every detector (main.py, setup.py, vision workers); AdaptiveDetectorController moves
+# quad_decimate / nthreads away from it at runtime
+DETECTOR_KWARGS = {
+    'families': APRILTAG_FAMILY, 'nthreads': 1, 'quad_decimate': 1.0,
+    'quad_sigma': 0.0, 'refine_edges': True, 'decode_sharpening': 0.25, 'debug': False
+}
+
+ADAPTIVE_TARGET_FRAME_MS = 16.0
+# allowed settings, in the order the controller steps through them
+ADAPTIVE_QUAD_DECIMATE_LEVELS = (1.0, 1.5, 2.0, 3.0, 4.0)
+ADAPTIVE_MAX_NTHREADS = max(1, min(4, (os.cpu_count() or 1) - 1))
+# decide every N frames on the median detection time of the last N frames
+ADAPTIVE_WINDOW_FRAMES = 15
+# speed up above budget * HIGH, give accuracy back below budget * LOW
+ADAPTIVE_BUDGET_HIGH = 1.1
+ADAPTIVE_BUDGET_LOW = 0.5
+# hit rate = tags found per frame / most tags found in one frame over the last ADAPTIVE_HIT_HISTORY_SECONDS
+ADAPTIVE_MIN_HIT_RATE = 0.95
+ADAPTIVE_HIT_HISTORY_SECONDS = 3.0
+# a decimation level that cost hits is not tried again for this long (doubling each time it fails again);
+# short, because a robot being covered while the level is on trial looks the same as decimation losing it
+ADAPTIVE_BLOCK_SECONDS = 3.0
+ADAPTIVE_BLOCK_MAX_SECONDS = 60.0
+
+def create_detector(**overrides):
+    kwargs = {**DETECTOR_KWARGS, **overrides}
+    detector = pupil_apriltags.Detector(**kwargs)
+    # pupil_apriltags passes decode_sharpening through int(), which turns the configured 0.25 into 0
+    set_detector_params(detector, decode_sharpening=kwargs['decode_sharpening'])
+    return detector
+
+def get_detector_params(detector):
+    params = detector.tag_detector_ptr.contents
+    return {'quad_decimate': round(float(params.quad_decimate), 2), 'nthreads': int(params.nthreads),
+            'decode_sharpening': round(float(params.decode_sharpening), 3)}
+
+def set_detector_params(detector, quad_decimate=None, nthreads=None, decode_sharpening=None):
+    # pupil_apriltags copies its kwargs into the C detector once; the struct fields are read on every detect(),
+    # so changing them there takes effect on the next frame without rebuilding the tag family tables
+    params = detector.tag_detector_ptr.contents
+    if quad_decimate is not None:
+        params.quad_decimate = float(quad_decimate); detector.params['quad_decimate'] = float(quad_decimate)
+    if nthreads is not None:
+        params.nthreads = int(nthreads); detector.params['nthreads'] = int(nthreads)
+    if decode_sharpening is not None:
+        params.decode_sharpening = float(decode_sharpening); detector.params['decode_sharpening'] = float(decode_sharpening)
+
+class AdaptiveDetectorController:
+    """Holds detection time per frame near target_ms by moving quad_decimate and nthreads within bounds.
+
+    Over budget: add a thread first (no accuracy cost), then raise quad_decimate.
+    Well under budget: lower quad_decimate first, then give threads back.
+    If the robot tag hit rate drops after raising quad_decimate, the change is undone and that level
+    is blocked for a while (ADAPTIVE_BLOCK_SECONDS, doubling on repeat failures), so a tight budget
+    doesn't trade away detections.
+    """
+    def __init__(self, detector, target_ms=ADAPTIVE_TARGET_FRAME_MS, decimate_levels=ADAPTIVE_QUAD_DECIMATE_LEVELS,
+                 max_nthreads=ADAPTIVE_MAX_NTHREADS):
+        self.detector = detector
+        self.target_ms = target_ms
+        self.decimate_levels = tuple(sorted(decimate_levels))
+        self.max_nthreads = max(1, max_nthreads)
+        current = get_detector_params(detector)
+        self.level = min(range(len(self.decimate_levels)), key=lambda i: abs(self.decimate_levels[i] - current['quad_decimate']))
+        self.nthreads = min(max(1, current['nthreads']), self.max_nthreads)
+        self._blocked_until = {}
+        self._block_seconds = {}
+        self._raised_at_hit_rate = None
+        self._frame_ms = collections.deque(maxlen=ADAPTIVE_WINDOW_FRAMES)
+        self._hits = collections.deque(maxlen=ADAPTIVE_WINDOW_FRAMES)
+        self._hit_history = collections.deque()
+        self._frames_since_decision = 0
+        self.changes = 0
+        self.last_detect_ms = 0.0
+        self._apply()
+
+    def _apply(self):
+        set_detector_params(self.detector, quad_decimate=self.decimate_levels[self.level], nthreads=self.nthreads)
+
+    def hit_rate(self):
+        if not self._hits:
+            return 1.0
+        best = max(hits for _, hits in self._hit_history)
+        if best == 0:
+            return 1.0
+        return sum(self._hits) / (len(self._hits) * best)
+
+    def observe(self, detect_ms, tags_found, now=None):
+        """Record one frame; every ADAPTIVE_WINDOW_FRAMES frames, maybe change the detector settings."""
+        now = time.perf_counter() if now is None else now
+        self.last_detect_ms = detect_ms
+        self._frame_ms.append(detect_ms)
+        self._hits.append(tags_found)
+        self._hit_history.append((now, tags_found))
+        while self._hit_history and now - self._hit_history[0][0] > ADAPTIVE_HIT_HISTORY_SECONDS:
+            self._hit_history.popleft()
+        self._frames_since_decision += 1
+        if self._frames_since_decision < ADAPTIVE_WINDOW_FRAMES:
+            return
+        self._frames_since_decision = 0
+        self._decide(now)
+
+    def _decide(self, now):
+        median_ms = sorted(self._frame_ms)[len(self._frame_ms) // 2]
+        hit_rate = self.hit_rate()
+        changed = False
+        if self._raised_at_hit_rate is not None:
+            # first decision after raising quad_decimate: keep it only if it didn't cost detections
+            if hit_rate < min(ADAPTIVE_MIN_HIT_RATE, self._raised_at_hit_rate) and self.level > 0:
+                block = min(ADAPTIVE_BLOCK_MAX_SECONDS, self._block_seconds.get(self.level, ADAPTIVE_BLOCK_SECONDS / 2.0) * 2.0)
+                self._block_seconds[self.level] = block
+                self._blocked_until[self.level] = now + block
+                self.level -= 1; changed = True
+            self._raised_at_hit_rate = None
+        elif median_ms > self.target_ms * ADAPTIVE_BUDGET_HIGH:
+            if self.nthreads < self.max_nthreads:
+                self.nthreads += 1; changed = True
+            elif self.level + 1 < len(self.decimate_levels) and self._blocked_until.get(self.level + 1, 0.0) <= now:
+                self._raised_at_hit_rate = hit_rate
+                self.level += 1; changed = True
+        elif median_ms < self.target_ms * ADAPTIVE_BUDGET_LOW:
+            if self.level > 0:
+                self.level -= 1; changed = True
+            elif self.nthreads > 1:
+                self.nthreads -= 1; changed = True
+        elif hit_rate < ADAPTIVE_MIN_HIT_RATE and self.level > 0:
+            # within budget but missing tags: spend the headroom on accuracy
+            self.level -= 1; changed = True
+        if changed:
+            self.changes += 1
+            self._apply()
+            # the samples were taken with the old settings
+            self._frame_ms.clear(); self._hits.clear()
+
+    def state(self):
+        median_ms = sorted(self._frame_ms)[len(self._frame_ms) // 2] if self._frame_ms else self.last_detect_ms
+        return {**get_detector_params(self.detector), 'target_ms': self.target_ms, 'detect_ms_p50': round(median_ms, 2),
+                'hit_rate': round(self.hit_rate(), 3), 'changes': self.changes}
@@ -0,0 +1,363 @@
+# Copyright (c) 2025 Oguzhan Cagirir (OguzhanCOG), KCL Electronics Society
+#
+# Project: KCL FoAI RoboFootball System
+# File: frame_source.py
+# Description: Frame sources for the vision entry points: live camera, recording a camera session to disk, and replaying one.
+#
+# Author: Oguzhan Cagirir (OguzhanCOG)
+# Date: May 24, 2025
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the MIT License as published by
+# the Open Source Initiative.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# MIT License for more details.
+#
+# You should have received a copy of the MIT License
+# along with this program. If not, see <https://opensource.org/licenses/MIT>.
+#
+# --- Version: 1.0.0 ---
+#
+# Every source has the cv2.VideoCapture calls the entry points use (isOpened, read, get, set, release), so
+# LatestFrameCapture, setup.py and hsv_tuner.py take any of them. open_frame_source() picks one from the environment:
+#   FOAI_REPLAY_DIR=<session dir>   replay a recording instead of opening the camera
+#   FOAI_REPLAY_MODE=realtime|max|step   (default realtime); FOAI_REPLAY_LOOP=1 starts over at the end
+#   FOAI_RECORD_DIR=<dir>           record whatever is read into a new session under <dir>
+#
+# Session layout:
+#   session.json          resolution, fps, codec, chunk files, frame count, source
+#   chunk_0000.avi ...    RECORD_CHUNK_FRAMES frames each
+#   frames.csv            frame_index, chunk, capture_ts (s since the first frame, perf_counter), wall_time
+#   calibration/          copies of the calibration / perspective .npz files in use when recording started
+
+import csv
+import json
+import os
+import queue
+import shutil
+import threading
+import time
+
+import cv2
+
+REPLAY_DIR = os.environ.get("FOAI_REPLAY_DIR") or None
+REPLAY_MODE = os.environ.get("FOAI_REPLAY_MODE", "realtime")
+REPLAY_LOOP = os.environ.get("FOAI_REPLAY_LOOP", "0") == "1"
+RECORD_DIR = os.environ.get("FOAI_RECORD_DIR") or None
+
+REPLAY_MODES = ("realtime", "max", "step")
+# "lossless": HuffYUV, bit-exact and cheap to encode but ~1.5 MB per 1280x960 frame.
+# "high_quality": MJPEG at RECORD_JPEG_QUALITY, about a tenth of the size.
+RECORD_CODECS = {"lossless": ("HFYU", ".avi"), "high_quality": ("MJPG", ".avi")}
+RECORD_CODEC = os.environ.get("FOAI_RECORD_CODEC", "lossless")
+RECORD_JPEG_QUALITY = 95
+RECORD_CHUNK_FRAMES = 900
+# frames waiting for the writer thread; beyond this, frames are dropped from the recording (never from the vision loop)
+RECORD_QUEUE_FRAMES = 64
+RECORD_DEFAULT_FPS = 30.0
+# step mode: read() waits this long for step() before reporting no frame, so capture threads can still be stopped
+REPLAY_STEP_WAIT_SECONDS = 0.25
+
+SESSION_FILE = "session.json"
+FRAMES_FILE = "frames.csv"
+CALIBRATION_SUBDIR = "calibration"
+
+_frame_source_printed_messages = set()
+def print_once_fs(message_key, message_content):
+    if message_key not in _frame_source_printed_messages:
+        print(message_content)
+        _frame_source_printed_messages.add(message_key)
+
+class FrameRecorder:
+    """Writes frames to chunked video files plus a per-frame timestamp table, on its own thread.
+
+    write() only copies the frame into a bounded queue, so recording never slows the caller down;
+    if the disk can't keep up, frames are left out of the recording and counted in stats().
+    """
+    def __init__(self, session_dir, width, height, fps=RECORD_DEFAULT_FPS, codec=RECORD_CODEC,
+                 calibration_files=(), source_name=None, chunk_frames=RECORD_CHUNK_FRAMES):
+        self.session_dir = session_dir
+        self.width, self.height = int(width), int(height)
+        self.fps = float(fps) if fps and fps > 0 else RECORD_DEFAULT_FPS
+        self.codec = codec
+        self.fourcc, self.extension = RECORD_CODECS[codec]
+        self.chunk_frames = chunk_frames
+        self.source_name = source_name
+        self.chunks = []
+        self.frames_written = 0
+        self.frames_dropped = 0
+        self._first_ts = None
+        self._writer = None
+        self._queue = queue.Queue(maxsize=RECORD_QUEUE_FRAMES)
+        os.makedirs(session_dir, exist_ok=True)
+        self.calibration_files = self._snapshot_calibration(calibration_files)
+        self._frames_file = open(os.path.join(session_dir, FRAMES_FILE), "w", newline="", encoding="utf-8")
+        self._frames_csv = csv.writer(self._frames_file)
+        self._frames_csv.writerow(["frame_index", "chunk", "capture_ts", "wall_time"])
+        self._write_session_file()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+        print(f"FRAME_RECORDER: Recording {self.width}x{self.height} ({codec}) to {session_dir}")
+
+    def _snapshot_calibration(self, calibration_files):
+        copied = []
+        for path in calibration_files:
+            if path and os.path.exists(path):
+                os.makedirs(os.path.join(self.session_dir, CALIBRATION_SUBDIR), exist_ok=True)
+                shutil.copy2(path, os.path.join(self.session_dir, CALIBRATION_SUBDIR, os.path.basename(path)))
+                copied.append(os.path.basename(path))
+            elif path:
+                print(f"FRAME_RECORDER: Calibration file '{path}' not found, not included in the recording.")
+        return copied
+
+    def _write_session_file(self):
+        session = {
+            'width': self.width, 'height': self.height, 'fps': self.fps, 'codec': self.codec, 'fourcc': self.fourcc,
+            'chunk_frames': self.chunk_frames, 'chunks': self.chunks, 'frame_count': self.frames_written,
+            'frames_dropped': self.frames_dropped, 'source': self.source_name, 'calibration_files': self.calibration_files,
+            'created': time.asctime(),
+        }
+        with open(os.path.join(self.session_dir, SESSION_FILE), "w", encoding="utf-8") as f:
+            json.dump(session, f, indent=2)
+
+    def write(self, image, capture_ts=None, block=False):
+        # block=True waits for the writer instead of dropping the frame (offline recording, e.g. benchmarks)
+        capture_ts = time.perf_counter() if capture_ts is None else capture_ts
+        try:
+            self._queue.put((image.copy(), capture_ts, time.time()), block=block)
+        except queue.Full:
+            self.frames_dropped += 1
+
+    def _open_chunk(self):
+        if self._writer is not None:
+            self._writer.release()
+        name = f"chunk_{len(self.chunks):04d}{self.extension}"
+        self._writer = cv2.VideoWriter(os.path.join(self.session_dir, name), cv2.VideoWriter_fourcc(*self.fourcc),
+                                       self.fps, (self.width, self.height))
+        if not self._writer.isOpened():
+            raise RuntimeError(f"cannot open video writer for {name} ({self.fourcc})")
+        if self.fourcc == "MJPG":
+            self._writer.set(cv2.VIDEOWRITER_PROP_QUALITY, RECORD_JPEG_QUALITY)
+        self.chunks.append(name)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            image, capture_ts, wall_time = item
+            if image.shape[1] != self.width or image.shape[0] != self.height:
+                print_once_fs("recorder_shape", f"FRAME_RECORDER: Frame {image.shape[1]}x{image.shape[0]} != session "
+                                                f"{self.width}x{self.height}. Skipping such frames.")
+                self.frames_dropped += 1; continue
+            try:
+                if self.frames_written % self.chunk_frames == 0:
+                    self._open_chunk()
+                    self._write_session_file()
+                self._writer.write(image)
+            except Exception as e:
+                print_once_fs("recorder_write_err", f"FRAME_RECORDER: ERR writing frame: {e}. Recording stopped.")
+                break
+            if self._first_ts is None:
+                self._first_ts = capture_ts
+            self._frames_csv.writerow([self.frames_written, len(self.chunks) - 1, f"{capture_ts - self._first_ts:.6f}", f"{wall_time:.6f}"])
+            self.frames_written += 1
+
+    def close(self):
+        if self.thread is None:
+            return
+        if self.thread.is_alive():
+            self._queue.put(None)
+            self.thread.join()
+        self.thread = None
+        if self._writer is not None:
+            self._writer.release()
+        self._frames_file.close()
+        self._write_session_file()
+        print(f"FRAME_RECORDER: Closed {self.session_dir}. {self.stats()}")
+
+    def stats(self):
+        return {'written': self.frames_written, 'dropped': self.frames_dropped, 'chunks': len(self.chunks)}
+
+class RecordingSource:
+    """Any frame source, with every frame read also handed to a FrameRecorder."""
+    def __init__(self, source, recorder):
+        self.source = source
+        self.recorder = recorder
+
+    def isOpened(self):
+        return self.source.isOpened()
+
+    def read(self, image=None):
+        ret, frame = self.source.read(image) if image is not None else self.source.read()
+        if ret:
+            self.recorder.write(frame, time.perf_counter())
+        return ret, frame
+
+    def get(self, prop):
+        return self.source.get(prop)
+
+    def set(self, prop, value):
+        return self.source.set(prop, value)
+
+    def step(self, frames=1):
+        if hasattr(self.source, 'step'):
+            self.source.step(frames)
+
+    def release(self):
+        self.source.release()
+        self.recorder.close()
+
+class ReplaySource:
+    """Plays a recorded session back through the cv2.VideoCapture interface.
+
+    mode "realtime" paces frames by their recorded timestamps (and skips frames, like a camera, if the
+    reader falls behind), "max" returns them as fast as they decode, "step" returns one frame per step().
+    last_recorded_ts is the recorded capture_ts of the frame read() returned last.
+    """
+    def __init__(self, session_dir, mode=REPLAY_MODE, loop=REPLAY_LOOP):
+        if mode not in REPLAY_MODES:
+            raise ValueError(f"replay mode must be one of {REPLAY_MODES}, got {mode!r}")
+        self.session_dir = session_dir
+        self.mode = mode
+        self.loop = loop
+        with open(os.path.join(session_dir, SESSION_FILE), encoding="utf-8") as f:
+            self.session = json.load(f)
+        with open(os.path.join(session_dir, FRAMES_FILE), newline="", encoding="utf-8") as f:
+            self.timestamps = [float(row["capture_ts"]) for row in csv.DictReader(f)]
+        self.width, self.height = self.session['width'], self.session['height']
+        self._cap = None
+        self._chunk = -1
+        self._next_index = 0
+        self._start_wall = None
+        self._steps = threading.Semaphore(0)
+        self._released = False
+        self.last_recorded_ts = None
+        self.frames_read = 0
+        self.frames_skipped = 0
+        self.finished = False
+        print(f"FRAME_REPLAY: {session_dir}: {len(self.timestamps)} frames at {self.width}x{self.height}, mode {mode}"
+              f"{' (looping)' if loop else ''}.")
+
+    def isOpened(self):
+        return not self._released and bool(self.timestamps)
+
+    def _seek_chunk(self, index):
+        chunk = min(index // self.session['chunk_frames'], len(self.session['chunks']) - 1)
+        if chunk != self._chunk:
+            if self._cap is not None:
+                self._cap.release()
+            self._cap = cv2.VideoCapture(os.path.join(self.session_dir, self.session['chunks'][chunk]))
+            self._chunk = chunk
+            skip = index - chunk * self.session['chunk_frames']
+            if skip: self._cap.set(cv2.CAP_PROP_POS_FRAMES, skip)
+
+    def _wait_for_turn(self):
+        # False if no frame is due (step mode without a step, or released)
+        if self.mode == "step":
+            return self._steps.acquire(timeout=REPLAY_STEP_WAIT_SECONDS) and not self._released
+        if self.mode == "realtime":
+            now = time.perf_counter()
+            if self._start_wall is None:
+                self._start_wall = now - self.timestamps[self._next_index]
+            # behind schedule by more than a frame: drop frames the way a camera would
+            while self._next_index + 1 < len(self.timestamps) and self._start_wall + self.timestamps[self._next_index + 1] <= now:
+                self._seek_chunk(self._next_index)
+                self._cap.grab()
+                self._next_index += 1
+                self.frames_skipped += 1
+            delay = self._start_wall + self.timestamps[self._next_index] - now
+            if delay > 0:
+                time.sleep(delay)
+        return not self._released
+
+    def read(self, image=None):
+        if self._released:
+            return False, None
+        if self._next_index >= len(self.timestamps):
+            if not self.loop:
+                self.finished = True
+                print_once_fs(f"replay_end_{self.session_dir}", f"FRAME_REPLAY: End of {self.session_dir} after {self.frames_read} frames.")
+                return False, None
+            self._next_index, self._start_wall = 0, None
+            self._seek_chunk(0); self._cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+        if not self._wait_for_turn():
+            return False, None
+        self._seek_chunk(self._next_index)
+        ret, frame = self._cap.read(image) if image is not None else self._cap.read()
+        if not ret:
+            print_once_fs(f"replay_decode_{self.session_dir}", f"FRAME_REPLAY: Could not decode frame {self._next_index}, recording truncated?")
+            self._next_index = len(self.timestamps)
+            return False, None
+        self.last_recorded_ts = self.timestamps[self._next_index]
+        self._next_index += 1
+        self.frames_read += 1
+        return True, frame
+
+    def step(self, frames=1):
+        for _ in range(frames):
+            self._steps.release()
+
+    def get(self, prop):
+        if prop == cv2.CAP_PROP_FRAME_WIDTH: return float(self.width)
+        if prop == cv2.CAP_PROP_FRAME_HEIGHT: return float(self.height)
+        if prop == cv2.CAP_PROP_FPS: return float(self.session['fps'])
+        if prop == cv2.CAP_PROP_FRAME_COUNT: return float(len(self.timestamps))
+        if prop == cv2.CAP_PROP_POS_FRAMES: return float(self._next_index)
+        return 0.0
+
+    def set(self, prop, value):
+        # resolution, buffer size etc. are fixed by the recording; like a camera that ignores a setting
+        if prop in (cv2.CAP_PROP_FRAME_WIDTH, cv2.CAP_PROP_FRAME_HEIGHT) and int(value) != int(self.get(prop)):
+            print_once_fs("replay_set_res", f"FRAME_REPLAY: Recording is {self.width}x{self.height}, requested resolution ignored.")
+        return False
+
+    def release(self):
+        self._released = True
+        self._steps.release()
+        if self._cap is not None:
+            self._cap.release()
+            self._cap = None
+
+    def stats(self):
+        return {'read': self.frames_read, 'skipped': self.frames_skipped, 'total': len(self.timestamps), 'finished': self.finished}
+
+def new_session_dir(record_dir):
+    return os.path.join(record_dir, time.strftime("session_%Y%m%d_%H%M%S"))
+
+def open_frame_source(camera_index, width=None, height=None, calibration_files=(),
+                      replay_dir=None, replay_mode=None, record_dir=None):
+    """Camera (or FOAI_REPLAY_DIR replay), wrapped in a recorder if FOAI_RECORD_DIR is set.
+
+    Check isOpened() on the result, as with cv2.VideoCapture. calibration_files are snapshotted into a new recording.
+    """
+    replay_dir = replay_dir or REPLAY_DIR
+    record_dir = record_dir or RECORD_DIR
+    if replay_dir:
+        source = ReplaySource(replay_dir, replay_mode or REPLAY_MODE)
+        source_name = f"replay:{replay_dir}"
+    else:
+        source = cv2.VideoCapture(camera_index)
+        source_name = f"camera:{camera_index}"
+        if source.isOpened() and width and height:
+            source.set(cv2.CAP_PROP_FRAME_WIDTH, width)
+            source.set(cv2.CAP_PROP_FRAME_HEIGHT, height)
+    if record_dir and source.isOpened():
+        recorder = FrameRecorder(new_session_dir(record_dir), source.get(cv2.CAP_PROP_FRAME_WIDTH), source.get(cv2.CAP_PROP_FRAME_HEIGHT),
+                                 source.get(cv2.CAP_PROP_FPS), calibration_files=calibration_files, source_name=source_name)
+        source = RecordingSource(source, recorder)
+    return source
+
+def replay_calibration_file(path, replay_dir=None):
+    """The replayed session's snapshot of calibration file `path` if replaying and it has one, else path."""
+    replay_dir = replay_dir or REPLAY_DIR
+    if not replay_dir:
+        return path
+    snapshot = os.path.join(replay_dir, CALIBRATION_SUBDIR, os.path.basename(path))
+    if os.path.exists(snapshot):
+        print_once_fs(f"replay_calib_{path}", f"FRAME_REPLAY: Using the recording's copy of {os.path.basename(path)}.")
+        return snapshot
+    return path
@@ -19,12 +19,16 @@
 # You should have received a copy of the MIT License
 # along with this program. If not, see <https://opensource.org/licenses/MIT>.
 #
-# --- Version: 1.0.0 ---
+# --- Version: 1.4.0 ---
 
 import cv2
 import numpy as np
 import os
 import time
+import undistort_maps
+import frame_source
+import colour_lut
+import vision_params
 
 CALIBRATION_DATA_FOLDER = "camera_calibration_data"
 
@@ -45,35 +49,49 @@ INITIAL_V_HIGH = 255
 def nothing(x):
     pass
 
+def load_initial_values():
+    # start from what the running simulation uses if there is a live parameter store, else the INITIAL_* values
+    values = {'lower_yellow_hsv': [INITIAL_H_LOW, INITIAL_S_LOW, INITIAL_V_LOW], 'upper_yellow_hsv': [INITIAL_H_HIGH, INITIAL_S_HIGH, INITIAL_V_HIGH],
+              'ball_erode_iterations': 1, 'ball_dilate_iterations': 1, 'ball_morph_kernel_size': 5}
+    try:
+        version, params = vision_params.read_params()
+        values.update(params)
+        print(f"Loaded live vision params version {version} from '{vision_params.VISION_PARAMS_PATH}'.")
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError) as e:
+        print(f"WARNING: Ignoring '{vision_params.VISION_PARAMS_PATH}': {e}")
+    return values
+
 def main():
 
     camera_matrix, dist_coeffs = None, None
+    calibration_file_path = frame_source.replay_calibration_file(CALIBRATION_FILE_PATH)
     try:
-        calibration_data = np.load(CALIBRATION_FILE_PATH)
+        calibration_data = np.load(calibration_file_path)
         camera_matrix = calibration_data['camera_matrix']
         dist_coeffs = calibration_data['dist_coeffs']
 
         calib_w = int(calibration_data.get('image_width', 0))
         calib_h = int(calibration_data.get('image_height', 0))
         if calib_w > 0 and (calib_w != CAMERA_RESOLUTION_W or calib_h != CAMERA_RESOLUTION_H):
-            print(f"WARNING: Loaded calib file '{CALIBRATION_FILE_PATH}' is for {calib_w}x{calib_h}, "
+            print(f"WARNING: Loaded calib file '{calibration_file_path}' is for {calib_w}x{calib_h}, "
                   f"but tuner is set for {CAMERA_RESOLUTION_W}x{CAMERA_RESOLUTION_H}. "
                   "Ensure consistency for best results when transferring values.")
-        print(f"Successfully loaded camera calibration from: {CALIBRATION_FILE_PATH}")
+        print(f"Successfully loaded camera calibration from: {calibration_file_path}")
     except FileNotFoundError:
-        print(f"ERROR: Calibration file not found at '{CALIBRATION_FILE_PATH}'.")
+        print(f"ERROR: Calibration file not found at '{calibration_file_path}'.")
         print("       Proceeding without undistortion, which might affect tuning accuracy.")
     except Exception as e:
-        print(f"ERROR loading calibration file '{CALIBRATION_FILE_PATH}': {e}")
+        print(f"ERROR loading calibration file '{calibration_file_path}': {e}")
         print("       Proceeding without undistortion.")
 
-    cap = cv2.VideoCapture(CAMERA_INDEX)
+    # camera, or a recorded session if FOAI_REPLAY_DIR is set (see frame_source.py)
+    cap = frame_source.open_frame_source(CAMERA_INDEX, CAMERA_RESOLUTION_W, CAMERA_RESOLUTION_H, calibration_files=(CALIBRATION_FILE_PATH,))
     if not cap.isOpened():
         print(f"ERROR: Cannot open camera source: {CAMERA_INDEX}")
         return
 
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, CAMERA_RESOLUTION_W)
-    cap.set(cv2.CAP_PROP_FRAME_HEIGHT, CAMERA_RESOLUTION_H)
     time.sleep(0.5) 
 
     actual_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
@@ -84,18 +102,24 @@ def main():
               f"but script expected {CAMERA_RESOLUTION_W}x{CAMERA_RESOLUTION_H}. "
               "Using actual resolution for display.")
 
+    frame_undistort_maps = None
+    if camera_matrix is not None and dist_coeffs is not None:
+        frame_undistort_maps = undistort_maps.load_or_build_undistort_maps(calibration_file_path, camera_matrix, dist_coeffs, actual_width, actual_height)
+
+    initial = load_initial_values()
+    (h_low, s_low, v_low), (h_high, s_high, v_high) = initial['lower_yellow_hsv'], initial['upper_yellow_hsv']
     cv2.namedWindow("HSV Color Tuner")
-    cv2.createTrackbar("H Low", "HSV Color Tuner", INITIAL_H_LOW, 179, nothing) 
-    cv2.createTrackbar("S Low", "HSV Color Tuner", INITIAL_S_LOW, 255, nothing)
-    cv2.createTrackbar("V Low", "HSV Color Tuner", INITIAL_V_LOW, 255, nothing)
-    cv2.createTrackbar("H High", "HSV Color Tuner", INITIAL_H_HIGH, 179, nothing)
-    cv2.createTrackbar("S High", "HSV Color Tuner", INITIAL_S_HIGH, 255, nothing)
-    cv2.createTrackbar("V High", "HSV Color Tuner", INITIAL_V_HIGH, 255, nothing)
+    cv2.createTrackbar("H Low", "HSV Color Tuner", h_low, 179, nothing) 
+    cv2.createTrackbar("S Low", "HSV Color Tuner", s_low, 255, nothing)
+    cv2.createTrackbar("V Low", "HSV Color Tuner", v_low, 255, nothing)
+    cv2.createTrackbar("H High", "HSV Color Tuner", h_high, 179, nothing)
+    cv2.createTrackbar("S High", "HSV Color Tuner", s_high, 255, nothing)
+    cv2.createTrackbar("V High", "HSV Color Tuner", v_high, 255, nothing)
 
     cv2.namedWindow("Morphological Ops Control", cv2.WINDOW_NORMAL)
-    cv2.createTrackbar("Erode Iter", "Morphological Ops Control", 1, 10, nothing)
-    cv2.createTrackbar("Dilate Iter", "Morphological Ops Control", 1, 10, nothing)
-    cv2.createTrackbar("Kernel Size", "Morphological Ops Control", 5, 15, nothing) 
+    cv2.createTrackbar("Erode Iter", "Morphological Ops Control", initial['ball_erode_iterations'], 10, nothing)
+    cv2.createTrackbar("Dilate Iter", "Morphological Ops Control", initial['ball_dilate_iterations'], 10, nothing)
+    cv2.createTrackbar("Kernel Size", "Morphological Ops Control", min(initial['ball_morph_kernel_size'], 15), 15, nothing) 
 
     print("\n--- HSV Tuning Instructions ---")
     print("Place your YELLOW ball in the camera's view under typical arena lighting.")
@@ -105,21 +129,36 @@ def main():
     print("Try to make the white ball region solid, with minimal noise.")
     print("Adjust 'Morphological Ops Control' sliders to clean the mask if needed.")
     print("Press 'p' to print the current HSV values to the console.")
+    print(f"Press 's' to send the current values to the running simulation ('{vision_params.VISION_PARAMS_PATH}'),")
+    print("      'a' to toggle sending them automatically whenever a slider changes.")
+    print("Press 'l' to toggle the colour-LUT mask (main.py's BALL_SEGMENTER = \"lut\"), rebuilt as the sliders move.")
+    if frame_source.REPLAY_DIR:
+        print("Replaying a recording: the last frame stays up between frames; press 'n' for the next one in step mode.")
     print("Press 'q' to quit.")
     print("=" * 40)
 
+    last_frame_bgr = None
+    ball_colour_lut = None
+    auto_send = False
+    last_sent = None
     while True:
         ret, frame_bgr = cap.read()
-        if not ret:
+        if not ret and last_frame_bgr is not None and frame_source.REPLAY_DIR:
+            # between steps / after the end of a recording: keep tuning on the last frame
+            frame_bgr = last_frame_bgr
+        elif not ret:
             print("ERROR: Can't receive frame. Exiting ...")
             break
+        last_frame_bgr = frame_bgr
 
         if frame_bgr.shape[1] != actual_width or frame_bgr.shape[0] != actual_height:
             print(f"Warning: Frame res changed to {frame_bgr.shape[1]}x{frame_bgr.shape[0]}. Trying to adapt.")
             actual_width, actual_height = frame_bgr.shape[1], frame_bgr.shape[0]
+            if frame_undistort_maps is not None:
+                frame_undistort_maps = undistort_maps.build_undistort_maps(camera_matrix, dist_coeffs, actual_width, actual_height)
 
-        if camera_matrix is not None and dist_coeffs is not None:
-            frame_to_process = cv2.undistort(frame_bgr, camera_matrix, dist_coeffs, None, camera_matrix)
+        if frame_undistort_maps is not None:
+            frame_to_process = undistort_maps.undistort_frame(frame_bgr, frame_undistort_maps)
         else:
             frame_to_process = frame_bgr.copy()
 
@@ -140,6 +179,10 @@ def main():
         upper_bound = np.array([h_high, s_high, v_high])
 
         mask = cv2.inRange(frame_hsv, lower_bound, upper_bound)
+        if ball_colour_lut is not None:
+            if ball_colour_lut.set_bounds(lower_bound, upper_bound):
+                print(f"Colour LUT rebuilt in {ball_colour_lut.last_build_ms:.1f} ms")
+            lut_mask = ball_colour_lut.mask(frame_to_process)
 
         erode_iter = cv2.getTrackbarPos("Erode Iter", "Morphological Ops Control")
         dilate_iter = cv2.getTrackbarPos("Dilate Iter", "Morphological Ops Control")
@@ -168,10 +211,28 @@ def main():
 
         cv2.imshow("Raw Mask", resize_for_display(mask))
         cv2.imshow("Processed Mask (Final)", resize_for_display(processed_mask))
+        if ball_colour_lut is not None:
+            # white: both agree, grey: only one of inRange / the LUT has the pixel
+            cv2.imshow("LUT Mask", resize_for_display(np.where(lut_mask == mask, mask, 128).astype(np.uint8)))
+
+        current_params = {'lower_yellow_hsv': [h_low, s_low, v_low], 'upper_yellow_hsv': [h_high, s_high, v_high],
+                          'ball_morph_kernel_size': kernel_s, 'ball_erode_iterations': erode_iter, 'ball_dilate_iterations': dilate_iter}
 
         key = cv2.waitKey(1) & 0xFF
         if key == ord('q'):
             break
+        elif key == ord('a'):
+            auto_send = not auto_send
+            print(f"Auto-send {'ON' if auto_send else 'OFF'}.")
+        elif key == ord('l'):
+            if ball_colour_lut is None:
+                ball_colour_lut = colour_lut.HsvColourLut(lower_bound, upper_bound)
+                print(f"Colour LUT on, built in {ball_colour_lut.last_build_ms:.1f} ms")
+            else:
+                ball_colour_lut = None
+                cv2.destroyWindow("LUT Mask")
+        elif key == ord('n') and hasattr(cap, 'step'):
+            cap.step()
         elif key == ord('p'):
             print("\n--- Current HSV Values ---")
             print(f"LOWER_YELLOW = np.array([{h_low}, {s_low}, {v_low}])")
@@ -179,6 +240,15 @@ def main():
             print(f"Erode Iter: {erode_iter}, Dilate Iter: {dilate_iter}, Kernel Size: {kernel_s}")
             print("-" * 26)
 
+        if key == ord('s') or (auto_send and current_params != last_sent):
+            # not retried until a value changes, e.g. S Low above S High is rejected until it's fixed
+            last_sent = current_params
+            try:
+                version = vision_params.write_params(current_params, source="hsv_tuner")
+                print(f"Sent vision params version {version}: {current_params}")
+            except (OSError, ValueError) as e:
+                print(f"ERROR: Could not send vision params: {e}")
+
     cap.release()
     cv2.destroyAllWindows()
     print("\nHSV Tuner finished. Final printed values are your tuned parameters.")
@@ -0,0 +1,134 @@
+# Copyright (c) 2025 Oguzhan Cagirir (OguzhanCOG), KCL Electronics Society
+#
+# Project: KCL FoAI RoboFootball System
+# File: latency_trace.py
+# Description: Capture-to-send latency histograms for the control loop, one per pipeline stage.
+#
+# Author: Oguzhan Cagirir (OguzhanCOG)
+# Date: May 24, 2025
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the MIT License as published by
+# the Open Source Initiative.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# MIT License for more details.
+#
+# You should have received a copy of the MIT License
+# along with this program. If not, see <https://opensource.org/licenses/MIT>.
+#
+# --- Version: 1.0.0 ---
+#
+# Every sample is the age of the camera frame a result was computed from, in ms: time.perf_counter() when the
+# stage finished minus the frame's capture_ts. perf_counter is system-wide, so worker processes can stamp too.
+# The relay measures its own receive -> robot send time (api/latency.py, /debug), it has no access to this clock.
+
+import collections
+import json
+import threading
+import time
+
+# stages in pipeline order:
+#   detected     -- vision payload ready (thread or worker process)
+#   game_pickup  -- update_game_state() took the payload off apriltag_queue
+#   bt_tick      -- a robot's behaviour tree ticked on the state estimated from that frame
+#   joystick     -- calculate_joystick_from_world_target() done
+#   ws_queued    -- command handed to the ws_client queue (after the CommandScheduler held it, if it did)
+#   ws_sent      -- websocket send() of the message carrying the command returned
+LATENCY_STAGES = ('detected', 'game_pickup', 'bt_tick', 'joystick', 'ws_queued', 'ws_sent')
+LATENCY_SAMPLES = 2000
+LATENCY_REPORT_INTERVAL_SECONDS = 10.0
+# bucket upper edges (ms) for the shutdown dump; the last bucket takes everything above
+LATENCY_BUCKET_EDGES_MS = (2, 5, 10, 20, 30, 50, 75, 100, 150, 250, 500, 1000)
+LATENCY_DUMP_PATH = "latency_trace.json"
+
+class LatencyHistograms:
+    """Per-stage ring of recent latency samples (ms). record() may be called from any thread."""
+    def __init__(self, stages=LATENCY_STAGES, samples=LATENCY_SAMPLES):
+        self.stages = tuple(stages)
+        self._samples = {stage: collections.deque(maxlen=samples) for stage in self.stages}
+        self._counts = collections.Counter()
+        self._lock = threading.Lock()
+
+    def record(self, stage, capture_ts, now=None):
+        # capture_ts None (no camera frame behind this result yet) is ignored
+        if capture_ts is None:
+            return
+        now = time.perf_counter() if now is None else now
+        with self._lock:
+            if stage not in self._samples:
+                self._samples[stage] = collections.deque(maxlen=LATENCY_SAMPLES)
+            self._samples[stage].append((now - capture_ts) * 1000.0)
+            self._counts[stage] += 1
+
+    def _snapshot(self):
+        with self._lock:
+            return {stage: sorted(samples) for stage, samples in self._samples.items() if samples}, dict(self._counts)
+
+    def stats(self):
+        # {stage: {'n', 'p50', 'p95', 'p99', 'max'}} over the last LATENCY_SAMPLES samples of each stage, in ms
+        samples_by_stage, counts = self._snapshot()
+        stats = {}
+        for stage, values in samples_by_stage.items():
+            pick = lambda q: round(values[min(len(values) - 1, int(q * len(values)))], 2)
+            stats[stage] = {'n': counts[stage], 'p50': pick(0.50), 'p95': pick(0.95), 'p99': pick(0.99), 'max': round(values[-1], 2)}
+        return stats
+
+    def histograms(self, edges=LATENCY_BUCKET_EDGES_MS):
+        samples_by_stage, _ = self._snapshot()
+        labels = [f"<={edge}" for edge in edges] + [f">{edges[-1]}"]
+        result = {}
+        for stage, values in samples_by_stage.items():
+            buckets = [0] * len(labels)
+            for value in values:
+                buckets[next((i for i, edge in enumerate(edges) if value <= edge), len(edges))] += 1
+            result[stage] = dict(zip(labels, buckets))
+        return result
+
+    def reset(self):
+        with self._lock:
+            for samples in self._samples.values(): samples.clear()
+            self._counts.clear()
+
+latency_histograms = LatencyHistograms()
+
+def record(stage, capture_ts, now=None):
+    latency_histograms.record(stage, capture_ts, now)
+
+def get_stats():
+    return latency_histograms.stats()
+
+def format_stats(stats):
+    # one line, stages in pipeline order: "detected 12.1/18.0/25.3 | game_pickup ..." (p50/p95/p99 ms)
+    order = [s for s in LATENCY_STAGES if s in stats] + [s for s in stats if s not in LATENCY_STAGES]
+    return " | ".join(f"{stage} {stats[stage]['p50']}/{stats[stage]['p95']}/{stats[stage]['p99']}" for stage in order)
+
+def report(last_report_time, force=False):
+    # prints p50/p95/p99 per stage every LATENCY_REPORT_INTERVAL_SECONDS, returns the new last report time
+    now = time.perf_counter()
+    if not force and now - last_report_time < LATENCY_REPORT_INTERVAL_SECONDS:
+        return last_report_time
+    stats = get_stats()
+    if stats:
+        print(f"LATENCY: ms since capture, p50/p95/p99: {format_stats(stats)}")
+    return now
+
+def dump(path=LATENCY_DUMP_PATH, extra=None):
+    """Prints the final per-stage stats and writes them, plus bucket counts, to path as JSON."""
+    stats = get_stats()
+    if not stats:
+        print("LATENCY: No samples recorded.")
+        return None
+    print(f"LATENCY: Final, ms since capture, p50/p95/p99: {format_stats(stats)}")
+    result = {'written_at': time.asctime(), 'unit': 'ms since capture', 'stats': stats, 'histograms': latency_histograms.histograms()}
+    if extra:
+        result.update(extra)
+    try:
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2, default=str)
+        print(f"LATENCY: Written to {path}")
+    except OSError as e:
+        print(f"LATENCY: Could not write {path}: {e}")
+    return result
@@ -20,20 +20,31 @@
 # along with this program. If not, see <https://opensource.org/licenses/MIT>.
 #
 # --- Development Powered by NeuralFusion(TM) III ---
-# --- Version: 1.7.1 ---
+# --- Version: 1.21.1 ---
 
 import pygame
 import math
 import random
 import traceback
+import collections
+import concurrent.futures
 import cv2
-import pupil_apriltags
 import numpy as np
 import os
 import threading
 import queue
 import time
 import xform_sandbox as sandbox_utils
+import undistort_maps
+import camera_capture
+import vision_workers
+import roi_tracking
+import detector_config
+import state_estimator
+import latency_trace
+import frame_source
+import colour_lut
+import vision_params
 
 _PLAYER_RADIUS_M_VAL = 0.065
 _BALL_RADIUS_M_VAL = 0.025
@@ -94,6 +105,7 @@ CFG = {
     "AI_DEFENSIVE_THIRD_LINE_X_FACTOR_B": 0.70,
     "AI_DEFENSIVE_THIRD_LINE_X_FACTOR_A": 0.30,
     "AI_THREAT_DISTANCE_TO_GOAL_M": _ARENA_WIDTH_M_VAL * 0.40,
+    "AI_THREAT_LOOKAHEAD_S": 0.2,
     "AI_DEFENDER_INTERCEPT_STANDOFF_M": _ARENA_WIDTH_M_VAL * 0.20,
     "AI_DEFENDER_COVER_SPACE_OFFSET_M": _PLAYER_RADIUS_M_VAL * 5.0,
     "AI_DEFENDER_MIN_X_B_FACTOR": 0.45,
@@ -127,7 +139,7 @@ CALIBRATION_DATA_FOLDER = "camera_calibration_data"
 CAMERA_CALIBRATION_FILE_TEMPLATE = "camera_calibration_{width}x{height}.npz"
 PERSPECTIVE_MATRICES_NPZ_FILE = "perspective_transform_matrices.npz"
 
-APRILTAG_FAMILY = "tag36h11"
+APRILTAG_FAMILY = detector_config.APRILTAG_FAMILY
 TAG_SIZE_METERS = 0.093 
 CAMERA_INDEX = 1 
 APRILTAG_CAMERA_RESOLUTION_W = 1280
@@ -146,11 +158,47 @@ BALL_ERODE_ITERATIONS = 1
 BALL_DILATE_ITERATIONS = 1
 MIN_BALL_CONTOUR_AREA_PX = 50
 MIN_BALL_CIRCULARITY = 0.7
-
-DETECTOR_KWARGS = {
-    'families': APRILTAG_FAMILY, 'nthreads': 1, 'quad_decimate': 1.0,
-    'quad_sigma': 0.0, 'refine_edges': True, 'decode_sharpening': 0.25, 'debug': False
-}
+# search for the ball in a window around its predicted position first (roi_tracking.BallRoiTracker)
+BALL_ROI_TRACKING = True
+# "hsv": cv2.cvtColor to HSV + cv2.inRange on every frame. "lut": one lookup per pixel in a BGR colour table built
+# from LOWER/UPPER_YELLOW_HSV (colour_lut.py), rebuilt whenever those change. OpenCV's HSV conversion is SIMD, so
+# check `python bench_vision.py ball_lut` on the event machine before switching.
+BALL_SEGMENTER = "hsv"
+# "lut" only: segment every other pixel and scale the mask back up
+BALL_LUT_HALF_RESOLUTION = False
+# hot-reload the ball colour / morphology values above from vision_params.VISION_PARAMS_PATH (written by
+# hsv_tuner.py) between frames, in the vision thread and in every vision worker process. A store left from an
+# earlier run is applied on the first frame too; delete it to go back to the values above.
+VISION_LIVE_PARAMS = True
+
+# "frame": undistort the whole image, then detect. "points": detect on the raw image and undistort only the
+# ball centre and tag corners (cv2.undistortPoints); tag translation then comes from solvePnP on the undistorted corners.
+VISION_UNDISTORT_MODE = "points"
+# "thread": capture thread + vision thread inside this process. "processes": capture and detection run in worker
+# processes (vision_workers.py) with frames in shared memory, so they don't compete with the game loop for the GIL.
+VISION_PIPELINE_MODE = "thread"
+VISION_WORKER_PROCESSES = max(1, min(3, (os.cpu_count() or 2) - 2))
+# run ball segmentation and tag detection on the same frame concurrently (thread pool).
+# Only pays off with a spare core; on a single core the two stages just contend.
+VISION_PARALLEL_STAGES = (os.cpu_count() or 1) > 1
+VISION_STAGE_TIMING_SAMPLES = 300
+VISION_STAGE_STATS_INTERVAL_SECONDS = 10.0
+SIM_ORIENT_FRONT_INDICES = (0, 1)
+SIM_ORIENT_BACK_INDICES = (3, 2)
+# tag corner layout used by pupil_apriltags' pose estimate, needed for solvePnP in "points" mode
+TAG_OBJECT_POINTS = np.array([[-TAG_SIZE_METERS/2,  TAG_SIZE_METERS/2, 0], [ TAG_SIZE_METERS/2,  TAG_SIZE_METERS/2, 0],
+                              [ TAG_SIZE_METERS/2, -TAG_SIZE_METERS/2, 0], [-TAG_SIZE_METERS/2, -TAG_SIZE_METERS/2, 0]], dtype=np.float64)
+
+# only scan crops around the tracked robot tags (roi_tracking.py), with periodic / on-loss full-frame scans.
+# Full scans use their own detector with TAG_FULL_SCAN_QUAD_DECIMATE; corners are still refined at full resolution.
+TAG_ROI_TRACKING = True
+TAG_FULL_SCAN_QUAD_DECIMATE = 2.0
+
+# shared with setup.py; the adaptive controller (detector_config.py) moves quad_decimate / nthreads at runtime
+# to keep tag detection within VISION_DETECTOR_TARGET_MS per frame without losing robot tags
+DETECTOR_KWARGS = detector_config.DETECTOR_KWARGS
+VISION_ADAPTIVE_DETECTOR = True
+VISION_DETECTOR_TARGET_MS = detector_config.ADAPTIVE_TARGET_FRAME_MS
 
 _AI_LOG_FILE_PATH = "main_sim_log.txt"
 _ai_log_file_handle = None
@@ -164,9 +212,20 @@ apriltag_thread = None
 apriltag_queue = queue.Queue(maxsize=10) 
 stop_apriltag_thread = threading.Event()
 camera_matrix_at, dist_coeffs_at = None, None
+undistort_maps_at = None
 perspective_matrix_metric_to_sim_at = None
 perspective_matrix_pixel_to_sim_at = None 
 apriltag_detector_at, camera_capture_at = None, None
+camera_grabber_at = None
+vision_pipeline_at = None
+tag_tracker_at = None
+ball_tracker_at = None
+ball_colour_lut_at = None
+vision_params_watcher_at = None
+detector_controller_at = None
+vision_detector_state = None
+vision_stage_timings = collections.deque(maxlen=VISION_STAGE_TIMING_SAMPLES)
+_vision_stage_executor = None
 _sim_printed_messages = set()
 
 def print_once(message_key, message_content):
@@ -453,6 +512,11 @@ class Player(Entity):
         my_goal_center = pygame.math.Vector2(CFG["ARENA_WIDTH_M"], CFG["ARENA_HEIGHT_M"] / 2) if self.team == 'B' else pygame.math.Vector2(0, CFG["ARENA_HEIGHT_M"] / 2)
         opponent_goal_center = pygame.math.Vector2(0, CFG["ARENA_HEIGHT_M"] / 2) if self.team == 'B' else pygame.math.Vector2(CFG["ARENA_WIDTH_M"], CFG["ARENA_HEIGHT_M"] / 2)
         return ball, teammates, opponents, my_goal_center, opponent_goal_center, is_designated_ball_winner
+    def _ball_state_at_tick(self, game_state, lookahead_s=0.0):
+        # the state estimator's ball at the tick time (+ lookahead_s); None without a live ball track
+        estimator, tick_ts = game_state.get('state_estimator'), game_state.get('tick_ts')
+        if estimator is None or tick_ts is None: return None
+        return estimator.state_at('ball', tick_ts + lookahead_s)
 
     def condition_HasBall(self, game_state): ball,_,_,_,_,_ = self._get_game_context_objects(game_state); return self.pos_m.distance_squared_to(ball.pos_m) < CFG["AI_HAS_BALL_THRESHOLD_M"]**2
     def condition_CanKickBall(self, game_state):
@@ -519,6 +583,11 @@ class Player(Entity):
         is_ball_advancing = (ball.vel_m_s.x > 0.35 if self.team == 'B' else ball.vel_m_s.x < -0.35)
         ball_in_def_third = self.condition_BallInMyDefensiveThird(game_state)
         close_to_goal_sq = ball.pos_m.distance_squared_to(my_goal_center) < CFG["AI_THREAT_DISTANCE_TO_GOAL_M"]**2
+        # a fast ball counts as soon as it will be close, not once it is; the estimator caps the lookahead
+        # at MAX_EXTRAPOLATION_SECONDS past the last measurement
+        ball_ahead = self._ball_state_at_tick(game_state, CFG["AI_THREAT_LOOKAHEAD_S"])
+        if ball_ahead is not None and not close_to_goal_sq:
+            close_to_goal_sq = pygame.math.Vector2(ball_ahead.pos).distance_squared_to(my_goal_center) < CFG["AI_THREAT_DISTANCE_TO_GOAL_M"]**2
         for opp in opponents:
             if opp.pos_m.distance_squared_to(ball.pos_m) < (CFG["AI_HAS_BALL_THRESHOLD_M"] * 1.3)**2:
                 if opp.pos_m.distance_squared_to(my_goal_center) < (CFG["AI_THREAT_DISTANCE_TO_GOAL_M"] * 1.2)**2: return True
@@ -758,16 +827,311 @@ class Ball(Entity):
         if self.vel_m_s.length_squared() < (0.001*0.001): 
             self.vel_m_s.update(0,0)
 
+def _get_ball_colour_lut():
+    # one per process like the trackers; passing the current bounds rebuilds the table only if they changed
+    global ball_colour_lut_at
+    if ball_colour_lut_at is None or ball_colour_lut_at.half_resolution != BALL_LUT_HALF_RESOLUTION:
+        ball_colour_lut_at = colour_lut.HsvColourLut(LOWER_YELLOW_HSV, UPPER_YELLOW_HSV, half_resolution=BALL_LUT_HALF_RESOLUTION)
+    else:
+        ball_colour_lut_at.set_bounds(LOWER_YELLOW_HSV, UPPER_YELLOW_HSV)
+    return ball_colour_lut_at
+
+def ball_colour_mask(bgr_frame):
+    # 255 where a pixel is inside LOWER/UPPER_YELLOW_HSV, through BALL_SEGMENTER
+    if BALL_SEGMENTER == "lut":
+        return _get_ball_colour_lut().mask(bgr_frame)
+    return cv2.inRange(cv2.cvtColor(bgr_frame, cv2.COLOR_BGR2HSV), LOWER_YELLOW_HSV, UPPER_YELLOW_HSV)
+
+def apply_vision_params(params):
+    # params as checked by vision_params.validate_params(); only the names present are changed
+    global LOWER_YELLOW_HSV, UPPER_YELLOW_HSV, BALL_MORPH_KERNEL_SIZE, BALL_ERODE_ITERATIONS, BALL_DILATE_ITERATIONS
+    if 'lower_yellow_hsv' in params: LOWER_YELLOW_HSV = np.array(params['lower_yellow_hsv'])
+    if 'upper_yellow_hsv' in params: UPPER_YELLOW_HSV = np.array(params['upper_yellow_hsv'])
+    if 'ball_morph_kernel_size' in params: BALL_MORPH_KERNEL_SIZE = params['ball_morph_kernel_size']
+    if 'ball_erode_iterations' in params: BALL_ERODE_ITERATIONS = params['ball_erode_iterations']
+    if 'ball_dilate_iterations' in params: BALL_DILATE_ITERATIONS = params['ball_dilate_iterations']
+
+def poll_vision_params(ball_morph_kernel):
+    """Called between two frames: applies a new vision_params store version if there is one.
+
+    Returns the ball morph kernel to use from the next frame on (a new one if its size changed).
+    Everything is swapped before the next process_vision_frame() starts, so a frame never mixes old and new values.
+    """
+    global vision_params_watcher_at
+    if not VISION_LIVE_PARAMS:
+        return ball_morph_kernel
+    if vision_params_watcher_at is None:
+        vision_params_watcher_at = vision_params.VisionParamsWatcher()
+    params = vision_params_watcher_at.poll()
+    if params is None:
+        return ball_morph_kernel
+    apply_vision_params(params)
+    print(f"VISION_PARAMS: Version {vision_params_watcher_at.version} applied (pid {os.getpid()}): {params}")
+    if ball_morph_kernel is None or ball_morph_kernel.shape[0] != BALL_MORPH_KERNEL_SIZE:
+        return np.ones((BALL_MORPH_KERNEL_SIZE, BALL_MORPH_KERNEL_SIZE), np.uint8)
+    return ball_morph_kernel
+
+def detect_ball_pixel(bgr_frame, ball_morph_kernel):
+    # best ball candidate as (x, y) in bgr_frame's pixel coordinates, or None
+    yellow_mask = ball_colour_mask(bgr_frame)
+
+    processed_mask = yellow_mask
+    if BALL_ERODE_ITERATIONS > 0:
+        processed_mask = cv2.erode(processed_mask, ball_morph_kernel, iterations=BALL_ERODE_ITERATIONS)
+    if BALL_DILATE_ITERATIONS > 0:
+        processed_mask = cv2.dilate(processed_mask, ball_morph_kernel, iterations=BALL_DILATE_ITERATIONS)
+
+    contours, _ = cv2.findContours(processed_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+
+    best_ball_contour = None
+    if contours:
+        valid_ball_candidates = []
+        for contour in contours:
+            area = cv2.contourArea(contour)
+            if area > MIN_BALL_CONTOUR_AREA_PX:
+                perimeter = cv2.arcLength(contour, True)
+                if perimeter > 1e-3:
+                    circularity = 4 * np.pi * (area / (perimeter * perimeter))
+                    if circularity > MIN_BALL_CIRCULARITY:
+                        valid_ball_candidates.append(contour)
+        if valid_ball_candidates:
+            best_ball_contour = max(valid_ball_candidates, key=cv2.contourArea)
+
+    if best_ball_contour is None:
+        return None
+    ((cX_px, cY_px), radius_px) = cv2.minEnclosingCircle(best_ball_contour)
+    return (cX_px, cY_px)
+
+def tag_cam_xy_from_undistorted_corners(undistorted_corners):
+    # same camera-frame translation pupil_apriltags' pose_t gives, from corners already undistorted (so no dist_coeffs)
+    ok, _, tvec = cv2.solvePnP(TAG_OBJECT_POINTS, undistorted_corners.reshape(-1, 2).astype(np.float64),
+                               camera_matrix_at, None, flags=cv2.SOLVEPNP_IPPE_SQUARE)
+    if not ok:
+        return None
+    return tvec[0][0], tvec[1][0]
+
+def _get_ball_tracker():
+    global ball_tracker_at
+    if ball_tracker_at is None:
+        ball_tracker_at = roi_tracking.BallRoiTracker()
+    return ball_tracker_at
+
+def ball_stage(vision_frame, ball_morph_kernel, frame_ts=None):
+    # ball centre (x, y) in vision_frame's pixel coordinates, or None
+    if BALL_ROI_TRACKING:
+        return _get_ball_tracker().detect(vision_frame, lambda image: detect_ball_pixel(image, ball_morph_kernel), frame_ts)
+    return detect_ball_pixel(vision_frame, ball_morph_kernel)
+
+def _get_tag_tracker():
+    # created on first use (one per vision worker process), rebuilt if the detector was replaced
+    global tag_tracker_at
+    if tag_tracker_at is None or tag_tracker_at.detector is not apriltag_detector_at:
+        full_scan_detector = None
+        if TAG_FULL_SCAN_QUAD_DECIMATE != DETECTOR_KWARGS['quad_decimate']:
+            full_scan_detector = detector_config.create_detector(quad_decimate=TAG_FULL_SCAN_QUAD_DECIMATE)
+        tag_tracker_at = roi_tracking.TagRoiTracker(apriltag_detector_at, ALL_ROBOT_TAG_IDS, full_scan_detector)
+    return tag_tracker_at
+
+def _get_detector_controller():
+    # one per process, like the tracker; follows apriltag_detector_at if it gets replaced
+    global detector_controller_at
+    if detector_controller_at is None or detector_controller_at.detector is not apriltag_detector_at:
+        detector_controller_at = detector_config.AdaptiveDetectorController(apriltag_detector_at, VISION_DETECTOR_TARGET_MS)
+    return detector_controller_at
+
+def tag_stage(vision_frame, cam_params_for_pose_estimation, points_mode, frame_ts=None):
+    # robot tags in vision_frame's pixel coordinates: (tag_ids, corners (N, 4, 2) float32, cam_xy (N, 2) or None).
+    # cam_xy is the pose_t x/y from the detector in "frame" mode; in "points" mode it comes later from solvePnP
+    gray_frame_for_tags = cv2.cvtColor(vision_frame, cv2.COLOR_BGR2GRAY)
+    detector = _get_tag_tracker() if TAG_ROI_TRACKING else apriltag_detector_at
+    detect_kwargs = {'timestamp': frame_ts} if TAG_ROI_TRACKING else {}
+    detect_start = time.perf_counter()
+    detections = detector.detect(
+        gray_frame_for_tags, 
+        estimate_tag_pose=not points_mode,
+        camera_params=cam_params_for_pose_estimation,
+        tag_size=TAG_SIZE_METERS,
+        **detect_kwargs
+    )
+    robot_tags = [tag for tag in detections if tag.tag_id in ALL_ROBOT_TAG_IDS and tag.corners is not None]
+    if VISION_ADAPTIVE_DETECTOR:
+        _get_detector_controller().observe((time.perf_counter() - detect_start) * 1000.0, len(robot_tags))
+
+    tag_ids = [tag.tag_id for tag in robot_tags]
+    pixel_corners = np.array([tag.corners for tag in robot_tags], dtype=np.float32).reshape(-1, 4, 2)
+    cam_xy = None
+    if not points_mode:
+        # NaN for a tag without a pose: it still gets an orientation, just no position
+        cam_xy = np.array([tag.pose_t.flatten()[:2] if tag.pose_t is not None else (np.nan, np.nan) for tag in robot_tags],
+                          dtype=np.float32).reshape(-1, 2)
+    return tag_ids, pixel_corners, cam_xy
+
+def map_detections_to_sim(ball_px, tag_detections, points_mode):
+    """Pixel-space detections of one frame -> (ball_sim_pos, robot_positions, robot_orientations).
+
+    Every pixel point of the frame (ball centre + all tag corners) is undistorted ("points" mode) and
+    mapped with M_pixel_to_sim in one call each, and all tag positions go through M_metric_to_sim in one
+    call. Orientations are computed for all tags at once.
+    """
+    tag_ids, pixel_corners, cam_xy = tag_detections
+    tag_count = len(tag_ids)
+    pixel_points = pixel_corners.reshape(-1, 1, 2)
+    if ball_px is not None:
+        pixel_points = np.concatenate([pixel_points, np.array([[ball_px]], dtype=np.float32)])
+    ball_sim_pos_update, robot_positions_update, robot_orientations_update = None, {}, {}
+    if len(pixel_points) == 0:
+        return ball_sim_pos_update, robot_positions_update, robot_orientations_update
+
+    if points_mode:
+        pixel_points = undistort_maps.undistort_points(pixel_points, camera_matrix_at, dist_coeffs_at)
+        undistorted_corners = pixel_points[:tag_count * 4].reshape(-1, 4, 2)
+        cam_xy = np.full((tag_count, 2), np.nan, dtype=np.float32)
+        for i in range(tag_count):
+            xy = tag_cam_xy_from_undistorted_corners(undistorted_corners[i])
+            if xy is not None: cam_xy[i] = xy
+    sim_points = cv2.perspectiveTransform(pixel_points, perspective_matrix_pixel_to_sim_at).reshape(-1, 2)
+    if ball_px is not None:
+        ball_sim_pos_update = (sim_points[-1][0], sim_points[-1][1])
+
+    if tag_count:
+        orientations = sandbox_utils.calculate_orientations_from_sim_corners(
+            sim_points[:tag_count * 4].reshape(-1, 4, 2),
+            front_indices=SIM_ORIENT_FRONT_INDICES,
+            back_indices=SIM_ORIENT_BACK_INDICES
+        )
+        robot_orientations_update = {tag_id: float(deg) for tag_id, deg in zip(tag_ids, orientations) if not np.isnan(deg)}
+        sim_robots = cv2.perspectiveTransform(cam_xy.reshape(-1, 1, 2), perspective_matrix_metric_to_sim_at).reshape(-1, 2)
+        robot_positions_update = {tag_id: (xy[0], xy[1]) for tag_id, xy in zip(tag_ids, sim_robots) if not np.isnan(xy[0])}
+    return ball_sim_pos_update, robot_positions_update, robot_orientations_update
+
+def _timed_stage(stage_fn, *args):
+    start = time.perf_counter()
+    result = stage_fn(*args)
+    return result, (time.perf_counter() - start) * 1000.0
+
+def _get_vision_stage_executor():
+    # created on first use, so every vision worker process gets its own
+    global _vision_stage_executor
+    if _vision_stage_executor is None:
+        _vision_stage_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="ball-stage")
+    return _vision_stage_executor
+
+def record_vision_stage_timings(timings_ms):
+    vision_stage_timings.append(timings_ms)
+
+def record_detector_state(state):
+    # latest detector settings + robot tag hit rate, from this process's controller or a worker's payload
+    global vision_detector_state
+    vision_detector_state = state
+
+def get_vision_stage_stats():
+    # p50/p95 per stage over the last VISION_STAGE_TIMING_SAMPLES frames, in ms
+    samples = list(vision_stage_timings)
+    if not samples:
+        return {}
+    stats = {'frames': len(samples)}
+    for stage in samples[-1]:
+        values = sorted(t[stage] for t in samples if stage in t)
+        stats[stage] = {'p50': round(values[len(values) // 2], 2), 'p95': round(values[min(len(values) - 1, int(len(values) * 0.95))], 2)}
+    return stats
+
+def report_vision_stage_stats(last_report_time, force=False):
+    # prints per-stage timings every VISION_STAGE_STATS_INTERVAL_SECONDS, returns the new last report time
+    now = time.perf_counter()
+    if not force and now - last_report_time < VISION_STAGE_STATS_INTERVAL_SECONDS:
+        return last_report_time
+    stats = get_vision_stage_stats()
+    if stats:
+        print(f"AT_THREAD (UltimateSim): Stage timings ms (parallel={VISION_PARALLEL_STAGES}): {stats}")
+    if tag_tracker_at is not None:
+        print(f"AT_THREAD (UltimateSim): Tag ROI tracking: {tag_tracker_at.stats()}")
+    if ball_tracker_at is not None:
+        print(f"AT_THREAD (UltimateSim): Ball ROI tracking: {ball_tracker_at.stats()}")
+    if ball_colour_lut_at is not None:
+        print(f"AT_THREAD (UltimateSim): Ball colour LUT: {ball_colour_lut_at.stats()}")
+    if vision_params_watcher_at is not None and vision_params_watcher_at.applied:
+        print(f"AT_THREAD (UltimateSim): Live vision params: {vision_params_watcher_at.stats()}")
+    if vision_detector_state is not None:
+        print(f"AT_THREAD (UltimateSim): Detector: {vision_detector_state}")
+    return now
+
+def process_vision_frame(frame, ball_morph_kernel, cam_params_for_pose_estimation, frame_ts=None):
+    # one camera frame -> update payload for the game thread. frame_ts (perf_counter at capture) drives the tag ROI prediction
+    frame_start = time.perf_counter()
+    points_mode = VISION_UNDISTORT_MODE == "points"
+    if points_mode:
+        # detect on the raw image, only the detected points get undistorted below
+        vision_frame = frame
+    elif undistort_maps_at is not None:
+        vision_frame = undistort_maps.undistort_frame(frame, undistort_maps_at)
+    else:
+        print_once("at_thread_no_undistort_maps", "AT_THREAD (UltimateSim): No undistortion maps, falling back to cv2.undistort per frame.")
+        vision_frame = cv2.undistort(frame, camera_matrix_at, dist_coeffs_at, None, camera_matrix_at)
+    undistort_ms = (time.perf_counter() - frame_start) * 1000.0
+
+    if VISION_PARALLEL_STAGES:
+        # ball segmentation and tag detection don't depend on each other and both release the GIL in
+        # OpenCV / the apriltag C library, so the ball stage runs on the pool while tags run here
+        ball_future = _get_vision_stage_executor().submit(_timed_stage, ball_stage, vision_frame, ball_morph_kernel, frame_ts)
+        tag_detections, tags_ms = _timed_stage(tag_stage, vision_frame, cam_params_for_pose_estimation, points_mode, frame_ts)
+        ball_px, ball_ms = ball_future.result()
+    else:
+        ball_px, ball_ms = _timed_stage(ball_stage, vision_frame, ball_morph_kernel, frame_ts)
+        tag_detections, tags_ms = _timed_stage(tag_stage, vision_frame, cam_params_for_pose_estimation, points_mode, frame_ts)
+    (ball_sim_pos_update, robot_positions_update, robot_orientations_update), map_ms = _timed_stage(
+        map_detections_to_sim, ball_px, tag_detections, points_mode)
+
+    timings_ms = {'undistort': undistort_ms, 'ball': ball_ms, 'tags': tags_ms, 'map': map_ms, 'total': (time.perf_counter() - frame_start) * 1000.0}
+    record_vision_stage_timings(timings_ms)
+    update_payload = {
+        'ball_sim_pos': ball_sim_pos_update,
+        'robot_positions': robot_positions_update,
+        'robot_orientations': robot_orientations_update,
+        'timings_ms': timings_ms,
+        'detected_ts': time.perf_counter(),
+    }
+    if VISION_ADAPTIVE_DETECTOR and detector_controller_at is not None:
+        update_payload['detector'] = detector_controller_at.state()
+        record_detector_state(update_payload['detector'])
+    return update_payload
+
+def publish_vision_payload(update_payload):
+    # the game loop only ever wants the newest payload
+    latency_trace.record('detected', update_payload.get('capture_ts'), update_payload['detected_ts'])
+    if apriltag_queue.full():
+        try: apriltag_queue.get_nowait() 
+        except queue.Empty: pass
+    apriltag_queue.put_nowait(update_payload)
+
+def vision_pipeline_collector_loop():
+    # "processes" mode: detection runs in vision_workers' processes, this thread just hands results to the game loop
+    print(f"AT_THREAD (UltimateSim): Collecting results from vision processes. Undistort mode: {VISION_UNDISTORT_MODE}")
+    last_stats_report = time.perf_counter()
+    while not stop_apriltag_thread.is_set():
+        update_payload = vision_pipeline_at.get_result()
+        if update_payload is None:
+            if not vision_pipeline_at.is_alive():
+                print_once("at_pipeline_dead", "AT_THREAD (UltimateSim): All vision processes have exited.")
+                time.sleep(0.5)
+            continue
+        # stage timings were measured in the worker, collect them here so they're reported in one place
+        record_vision_stage_timings(update_payload['timings_ms'])
+        if 'detector' in update_payload:
+            record_detector_state(update_payload['detector'])
+        publish_vision_payload(update_payload)
+        last_stats_report = report_vision_stage_stats(last_stats_report)
+    print("AT_THREAD (UltimateSim): Collector stopped.")
+    report_vision_stage_stats(last_stats_report, force=True)
+    vision_pipeline_at.stop()
+
 def apriltag_processing_loop():
-    global camera_matrix_at, dist_coeffs_at
+    global camera_matrix_at, dist_coeffs_at, undistort_maps_at
     global perspective_matrix_metric_to_sim_at, perspective_matrix_pixel_to_sim_at
-    global apriltag_detector_at, camera_capture_at
-    global TAG_SIZE_METERS, ALL_ROBOT_TAG_IDS, LOWER_YELLOW_HSV, UPPER_YELLOW_HSV
-    global BALL_MORPH_KERNEL_SIZE, BALL_ERODE_ITERATIONS, BALL_DILATE_ITERATIONS
-    global MIN_BALL_CONTOUR_AREA_PX, MIN_BALL_CIRCULARITY
+    global apriltag_detector_at, camera_capture_at, camera_grabber_at
 
     if apriltag_detector_at is None or \
        camera_capture_at is None or \
+       camera_grabber_at is None or \
        camera_matrix_at is None or \
        dist_coeffs_at is None or \
        perspective_matrix_metric_to_sim_at is None or \
@@ -781,99 +1145,29 @@ def apriltag_processing_loop():
 
     actual_w = int(camera_capture_at.get(cv2.CAP_PROP_FRAME_WIDTH))
     actual_h = int(camera_capture_at.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    print(f"AT_THREAD (UltimateSim): Starting detection. Cam res: {actual_w}x{actual_h}")
+    print(f"AT_THREAD (UltimateSim): Starting detection. Cam res: {actual_w}x{actual_h}, undistort mode: {VISION_UNDISTORT_MODE}")
 
     ball_morph_kernel = np.ones((BALL_MORPH_KERNEL_SIZE, BALL_MORPH_KERNEL_SIZE), np.uint8)
 
-    SIM_ORIENT_FRONT_INDICES = (0, 1)
-    SIM_ORIENT_BACK_INDICES = (3, 2)
-
+    last_frame_index = -1
+    last_stats_report = time.perf_counter()
     while not stop_apriltag_thread.is_set():
-        ret, frame = camera_capture_at.read()
-        if not ret:
-            print_once("at_thread_cam_fail","AT_THREAD (UltimateSim): Frame grab fail."); time.sleep(0.1); continue
+        # newest frame only; frames captured while the previous one was being processed are skipped
+        captured = camera_grabber_at.get_latest(after_index=last_frame_index, timeout=0.5)
+        if captured is None:
+            print_once("at_thread_cam_fail","AT_THREAD (UltimateSim): No new frame from capture thread."); continue
+        last_frame_index = captured.frame_index
+        frame = captured.image
         if frame.shape[1]!=actual_w or frame.shape[0]!=actual_h: 
             print_once("at_thread_res_chg",f"AT_THREAD (UltimateSim): Frame res {frame.shape[1]}x{frame.shape[0]} != expected {actual_w}x{actual_h}. Skipping."); time.sleep(0.1); continue
 
         try:
-            undistorted_frame = cv2.undistort(frame, camera_matrix_at, dist_coeffs_at, None, camera_matrix_at)
-
-            ball_sim_pos_update = None
-            hsv_frame = cv2.cvtColor(undistorted_frame, cv2.COLOR_BGR2HSV)
-            yellow_mask = cv2.inRange(hsv_frame, LOWER_YELLOW_HSV, UPPER_YELLOW_HSV)
-
-            processed_mask = yellow_mask
-            if BALL_ERODE_ITERATIONS > 0:
-                processed_mask = cv2.erode(processed_mask, ball_morph_kernel, iterations=BALL_ERODE_ITERATIONS)
-            if BALL_DILATE_ITERATIONS > 0:
-                processed_mask = cv2.dilate(processed_mask, ball_morph_kernel, iterations=BALL_DILATE_ITERATIONS)
-
-            contours, _ = cv2.findContours(processed_mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
-
-            best_ball_contour = None
-            if contours:
-                valid_ball_candidates = []
-                for contour in contours:
-                    area = cv2.contourArea(contour)
-                    if area > MIN_BALL_CONTOUR_AREA_PX:
-                        perimeter = cv2.arcLength(contour, True)
-                        if perimeter > 1e-3:
-                            circularity = 4 * np.pi * (area / (perimeter * perimeter))
-                            if circularity > MIN_BALL_CIRCULARITY:
-                                valid_ball_candidates.append(contour)
-                if valid_ball_candidates:
-                    best_ball_contour = max(valid_ball_candidates, key=cv2.contourArea)
-
-            if best_ball_contour is not None:
-                ((cX_px, cY_px), radius_px) = cv2.minEnclosingCircle(best_ball_contour)
-                pt_pixel_ball = np.array([[[cX_px, cY_px]]], dtype=np.float32)
-                pt_sim_ball = cv2.perspectiveTransform(pt_pixel_ball, perspective_matrix_pixel_to_sim_at)
-                if pt_sim_ball is not None:
-                    sim_x, sim_y = pt_sim_ball[0][0][0], pt_sim_ball[0][0][1]
-                    ball_sim_pos_update = (sim_x, sim_y)
-
-            gray_frame_for_tags = cv2.cvtColor(undistorted_frame, cv2.COLOR_BGR2GRAY)
-            detections = apriltag_detector_at.detect(
-                gray_frame_for_tags, 
-                estimate_tag_pose=True,
-                camera_params=cam_params_for_pose_estimation,
-                tag_size=TAG_SIZE_METERS
-            )
-
-            robot_positions_update = {}
-            robot_orientations_update = {}
-
-            for tag in detections:
-                if tag.tag_id in ALL_ROBOT_TAG_IDS:
-                    if tag.pose_t is not None:
-                        cam_x,cam_y = tag.pose_t.flatten()[0],tag.pose_t.flatten()[1]
-                        pt_cam_robot = np.array([[[cam_x,cam_y]]],dtype=np.float32)
-                        pt_sim_robot = cv2.perspectiveTransform(pt_cam_robot, perspective_matrix_metric_to_sim_at)
-                        if pt_sim_robot is not None:
-                            robot_positions_update[tag.tag_id] = (pt_sim_robot[0][0][0],pt_sim_robot[0][0][1])
-
-                    if tag.corners is not None:
-                        pixel_corners = tag.corners.reshape(-1, 1, 2).astype(np.float32)
-                        sim_corners_m = cv2.perspectiveTransform(pixel_corners, perspective_matrix_pixel_to_sim_at)
-                        if sim_corners_m is not None:
-                            orientation_deg = sandbox_utils.calculate_orientation_from_sim_corners(
-                                sim_corners_m,
-                                front_indices=SIM_ORIENT_FRONT_INDICES,
-                                back_indices=SIM_ORIENT_BACK_INDICES
-                            )
-                            if orientation_deg is not None:
-                                robot_orientations_update[tag.tag_id] = orientation_deg
-
-            update_payload = {
-                'ball_sim_pos': ball_sim_pos_update,
-                'robot_positions': robot_positions_update,
-                'robot_orientations': robot_orientations_update
-            }
-
-            if apriltag_queue.full():
-                try: apriltag_queue.get_nowait() 
-                except queue.Empty: pass
-            apriltag_queue.put_nowait(update_payload)
+            ball_morph_kernel = poll_vision_params(ball_morph_kernel)
+            update_payload = process_vision_frame(frame, ball_morph_kernel, cam_params_for_pose_estimation, captured.capture_ts)
+            update_payload['frame_index'] = captured.frame_index
+            update_payload['capture_ts'] = captured.capture_ts
+            publish_vision_payload(update_payload)
+            last_stats_report = report_vision_stage_stats(last_stats_report)
 
             time.sleep(0.001)
         except Exception as e:
@@ -882,6 +1176,8 @@ def apriltag_processing_loop():
             time.sleep(0.5)
 
     print("AT_THREAD (UltimateSim): Loop stopped.")
+    report_vision_stage_stats(last_stats_report, force=True)
+    camera_grabber_at.stop()
     if camera_capture_at:
         camera_capture_at.release()
         print("AT_THREAD (UltimateSim): Camera released.")
@@ -889,7 +1185,7 @@ def apriltag_processing_loop():
 class Game:
     def __init__(self):
         global camera_matrix_at, dist_coeffs_at, perspective_matrix_metric_to_sim_at, perspective_matrix_pixel_to_sim_at
-        global apriltag_detector_at, camera_capture_at, apriltag_thread, _ai_log_file_handle
+        global apriltag_detector_at, camera_capture_at, apriltag_thread, _ai_log_file_handle, undistort_maps_at, camera_grabber_at, vision_pipeline_at
         global DETECTOR_KWARGS, APRILTAG_FAMILY, CAMERA_INDEX, APRILTAG_CAMERA_RESOLUTION_W, APRILTAG_CAMERA_RESOLUTION_H
         global CALIBRATION_DATA_FOLDER, CAMERA_CALIBRATION_FILE_TEMPLATE, PERSPECTIVE_MATRICES_NPZ_FILE
 
@@ -914,6 +1210,9 @@ class Game:
         print("GAME INIT: Loading AprilTag & Calibration data...")
         calib_file_name = CAMERA_CALIBRATION_FILE_TEMPLATE.format(width=APRILTAG_CAMERA_RESOLUTION_W,height=APRILTAG_CAMERA_RESOLUTION_H)
         calib_file_path = os.path.join(CALIBRATION_DATA_FOLDER, calib_file_name)
+        # a replayed session brings the calibration it was recorded with
+        recorded_calibration_files = (calib_file_path, PERSPECTIVE_MATRICES_NPZ_FILE)
+        calib_file_path = frame_source.replay_calibration_file(calib_file_path)
         try:
             calib_data = np.load(calib_file_path)
             camera_matrix_at = calib_data['camera_matrix']
@@ -926,7 +1225,7 @@ class Game:
             raise RuntimeError(f"FATAL ERROR: Could not load camera calibration file '{calib_file_path}': {e}. Please run setup.py.")
 
         try:
-            pt_data = np.load(PERSPECTIVE_MATRICES_NPZ_FILE)
+            pt_data = np.load(frame_source.replay_calibration_file(PERSPECTIVE_MATRICES_NPZ_FILE))
             perspective_matrix_metric_to_sim_at = pt_data['M_metric_to_sim']
             perspective_matrix_pixel_to_sim_at = pt_data['M_pixel_to_sim'] 
 
@@ -942,23 +1241,48 @@ class Game:
             raise RuntimeError(f"FATAL ERROR: Could not load perspective transform file '{PERSPECTIVE_MATRICES_NPZ_FILE}': {e}. Please run setup.py.")
 
         try:
-            apriltag_detector_at = pupil_apriltags.Detector(**DETECTOR_KWARGS)
+            apriltag_detector_at = detector_config.create_detector()
             print(f"  AprilTag detector initialized for family: {APRILTAG_FAMILY}")
         except Exception as e:
             raise RuntimeError(f"FATAL ERROR: Could not initialize AprilTag Detector: {e}")
 
-        camera_capture_at = cv2.VideoCapture(CAMERA_INDEX)
-        if not camera_capture_at.isOpened():
-            raise RuntimeError(f"FATAL ERROR: Cannot open camera {CAMERA_INDEX}")
-        camera_capture_at.set(cv2.CAP_PROP_FRAME_WIDTH,APRILTAG_CAMERA_RESOLUTION_W)
-        camera_capture_at.set(cv2.CAP_PROP_FRAME_HEIGHT,APRILTAG_CAMERA_RESOLUTION_H)
-        time.sleep(0.5) 
-        actual_w_at, actual_h_at = int(camera_capture_at.get(cv2.CAP_PROP_FRAME_WIDTH)), int(camera_capture_at.get(cv2.CAP_PROP_FRAME_HEIGHT))
-        if actual_w_at != APRILTAG_CAMERA_RESOLUTION_W or actual_h_at != APRILTAG_CAMERA_RESOLUTION_H:
-            print_once("cam_res_final_warning",f"CRITICAL WARNING: Camera for AT thread started at {actual_w_at}x{actual_h_at}, but system is configured for {APRILTAG_CAMERA_RESOLUTION_W}x{APRILTAG_CAMERA_RESOLUTION_H}! This will cause issues.")
-        print(f"  Camera for AprilTags opened at {actual_w_at}x{actual_h_at}")
-
-        apriltag_thread = threading.Thread(target=apriltag_processing_loop, daemon=True)
+        if VISION_PIPELINE_MODE == "processes":
+            # the capture process opens the camera itself
+            vision_w, vision_h = APRILTAG_CAMERA_RESOLUTION_W, APRILTAG_CAMERA_RESOLUTION_H
+        else:
+            # camera, or a recorded session if FOAI_REPLAY_DIR is set; FOAI_RECORD_DIR records it (frame_source.py)
+            camera_capture_at = frame_source.open_frame_source(CAMERA_INDEX, APRILTAG_CAMERA_RESOLUTION_W, APRILTAG_CAMERA_RESOLUTION_H,
+                                                               calibration_files=recorded_calibration_files)
+            if not camera_capture_at.isOpened():
+                raise RuntimeError(f"FATAL ERROR: Cannot open camera {CAMERA_INDEX}")
+            time.sleep(0.5) 
+            actual_w_at, actual_h_at = int(camera_capture_at.get(cv2.CAP_PROP_FRAME_WIDTH)), int(camera_capture_at.get(cv2.CAP_PROP_FRAME_HEIGHT))
+            if actual_w_at != APRILTAG_CAMERA_RESOLUTION_W or actual_h_at != APRILTAG_CAMERA_RESOLUTION_H:
+                print_once("cam_res_final_warning",f"CRITICAL WARNING: Camera for AT thread started at {actual_w_at}x{actual_h_at}, but system is configured for {APRILTAG_CAMERA_RESOLUTION_W}x{APRILTAG_CAMERA_RESOLUTION_H}! This will cause issues.")
+            print(f"  Camera for AprilTags opened at {actual_w_at}x{actual_h_at}")
+            vision_w, vision_h = actual_w_at, actual_h_at
+
+        try:
+            undistort_maps_at = undistort_maps.load_or_build_undistort_maps(calib_file_path, camera_matrix_at, dist_coeffs_at, vision_w, vision_h)
+        except Exception as e:
+            print(f"  WARNING: Could not prepare undistortion maps ({e}). Vision loop will use cv2.undistort per frame.")
+            undistort_maps_at = None
+
+        if VISION_PIPELINE_MODE == "processes":
+            worker_globals = {
+                'camera_matrix_at': camera_matrix_at, 'dist_coeffs_at': dist_coeffs_at, 'undistort_maps_at': undistort_maps_at,
+                'perspective_matrix_metric_to_sim_at': perspective_matrix_metric_to_sim_at,
+                'perspective_matrix_pixel_to_sim_at': perspective_matrix_pixel_to_sim_at,
+                'VISION_UNDISTORT_MODE': VISION_UNDISTORT_MODE,
+            }
+            vision_pipeline_at = vision_workers.VisionProcessPipeline(CAMERA_INDEX, vision_w, vision_h, {'globals': worker_globals}, VISION_WORKER_PROCESSES,
+                                                                      calibration_files=recorded_calibration_files)
+            vision_pipeline_at.start()
+            apriltag_thread = threading.Thread(target=vision_pipeline_collector_loop, daemon=True)
+        else:
+            camera_grabber_at = camera_capture.LatestFrameCapture(camera_capture_at)
+            camera_grabber_at.start()
+            apriltag_thread = threading.Thread(target=apriltag_processing_loop, daemon=True)
         apriltag_thread.start()
         print("  AprilTag processing thread started.")
 
@@ -983,6 +1307,10 @@ class Game:
         self.last_goal_time_ms = 0
 
         self.robot_orientations_deg = {} 
+        # smoothed position / velocity / heading per tracked object ('ball', robot tag ids), queryable at any time
+        self.state_estimator = state_estimator.ObjectStateEstimator()
+        # capture time of the newest frame the estimator has seen: the age every command computed this tick is measured against
+        self.control_capture_ts = None
 
         self.setup_entities_for_kickoff()
         print("GAME INIT: Complete.")
@@ -1092,27 +1420,37 @@ class Game:
             pass 
 
         if latest_payload_from_thread:
-            if self.ball and latest_payload_from_thread.get('ball_sim_pos') is not None:
-                sim_x_ball, sim_y_ball = latest_payload_from_thread['ball_sim_pos']
-                clamped_x_ball = max(self.ball.radius_m, min(sim_x_ball, CFG["ARENA_WIDTH_M"] - self.ball.radius_m))
-                clamped_y_ball = max(self.ball.radius_m, min(sim_y_ball, CFG["ARENA_HEIGHT_M"] - self.ball.radius_m))
-                self.ball.pos_m.update(clamped_x_ball, clamped_y_ball)
-                self.ball.vel_m_s.update(0,0) 
-
-            robot_positions = latest_payload_from_thread.get('robot_positions', {})
-            for tag_id, (sim_x_robot, sim_y_robot) in robot_positions.items():
-                if tag_id in self.tag_to_player_map:
-                    player = self.tag_to_player_map[tag_id]
-                    clamped_x_robot = max(player.radius_m, min(sim_x_robot, CFG["ARENA_WIDTH_M"] - player.radius_m))
-                    clamped_y_robot = max(player.radius_m, min(sim_y_robot, CFG["ARENA_HEIGHT_M"] - player.radius_m))
-                    player.pos_m.update(clamped_x_robot, clamped_y_robot)
-
-                    if player.is_ai_driven_by_bt or player.tag_id_link is not None: 
-                        player.vel_m_s.update(0,0)
-
-            robot_orientations_from_at = latest_payload_from_thread.get('robot_orientations', {})
-            for tag_id, orient_deg in robot_orientations_from_at.items():
-                self.robot_orientations_deg[tag_id] = orient_deg
+            # measurements go in at capture time, so vision latency doesn't show up as lag in the estimates
+            self.state_estimator.update_from_payload(latest_payload_from_thread, latest_payload_from_thread.get('capture_ts', time.perf_counter()))
+            if latest_payload_from_thread.get('capture_ts') is not None:
+                self.control_capture_ts = latest_payload_from_thread['capture_ts']
+                latency_trace.record('game_pickup', self.control_capture_ts)
+
+        # positions, velocities and headings as estimated for this tick, not as of the last frame
+        tick_ts = time.perf_counter()
+        ball_state = self.state_estimator.state_at('ball', tick_ts) if self.ball else None
+        if ball_state is not None:
+            sim_x_ball, sim_y_ball = ball_state.pos
+            clamped_x_ball = max(self.ball.radius_m, min(sim_x_ball, CFG["ARENA_WIDTH_M"] - self.ball.radius_m))
+            clamped_y_ball = max(self.ball.radius_m, min(sim_y_ball, CFG["ARENA_HEIGHT_M"] - self.ball.radius_m))
+            self.ball.pos_m.update(clamped_x_ball, clamped_y_ball)
+            self.ball.vel_m_s.update(*ball_state.vel)
+
+        for tag_id in [key for key in self.state_estimator.tracks if key != 'ball']:
+            robot_state = self.state_estimator.state_at(tag_id, tick_ts)
+            if robot_state is None:
+                continue
+            if tag_id in self.tag_to_player_map:
+                player = self.tag_to_player_map[tag_id]
+                sim_x_robot, sim_y_robot = robot_state.pos
+                clamped_x_robot = max(player.radius_m, min(sim_x_robot, CFG["ARENA_WIDTH_M"] - player.radius_m))
+                clamped_y_robot = max(player.radius_m, min(sim_y_robot, CFG["ARENA_HEIGHT_M"] - player.radius_m))
+                player.pos_m.update(clamped_x_robot, clamped_y_robot)
+
+                if player.is_ai_driven_by_bt or player.tag_id_link is not None: 
+                    player.vel_m_s.update(*robot_state.vel)
+            if robot_state.heading_deg is not None:
+                self.robot_orientations_deg[tag_id] = robot_state.heading_deg
 
         ai_team_b_players = [p for p in self.players if p.team == 'B' and p.is_ai_driven_by_bt]
         designated_winner_b = None 
@@ -1140,13 +1478,16 @@ class Game:
                 log_ai(None, "GAME_LOG", f"Designated B winner changed to: {current_winner_str}")
                 self._last_designated_b_winner = designated_winner_b
 
+        ws_commands_this_tick = {}
         for p in self.players:
             if p.is_ai_driven_by_bt:
                 teammates=[m for m in self.players if m.team==p.team and m is not p]
                 opps=[o for o in self.players if o.team!=p.team]
                 gs_bt={'ball':self.ball,'teammates':teammates,'opponents':opps,'dt':dt,
-                       'is_designated_ball_winner':(p is designated_winner_b)}
+                       'is_designated_ball_winner':(p is designated_winner_b),
+                       'state_estimator':self.state_estimator,'tick_ts':tick_ts}
                 p.update_ai(gs_bt) 
+                latency_trace.record('bt_tick', self.control_capture_ts)
 
                 if p.team == 'B':
                     target_pos_m_vec = p.primary_steering_target_m
@@ -1161,16 +1502,13 @@ class Game:
                                 ai_target_pos_m=(target_pos_m_vec.x, target_pos_m_vec.y),
                                 current_orientation_deg=current_orientation_deg
                             )
+                            latency_trace.record('joystick', self.control_capture_ts)
                             websocket_user_id = -1
                             if p.player_num == 1: websocket_user_id = 3
                             elif p.player_num == 2: websocket_user_id = 4
 
                             if self.sandbox_ws_initialized and websocket_user_id != -1:
-                                sandbox_utils.send_transformed_joystick_command_ws(
-                                    websocket_user_id=websocket_user_id,
-                                    joy_x=joy_x,
-                                    joy_y=joy_y
-                                )
+                                ws_commands_this_tick[websocket_user_id] = (joy_x, joy_y)
                         else:
                             error_key = f"no_orient_B{p.player_num}_tag{p.tag_id_link}"
                             print_once(error_key, f"ULTIMATE_SIM: No orientation for B{p.player_num} (Tag {p.tag_id_link}) to send to WS.")
@@ -1178,8 +1516,15 @@ class Game:
 
                 p.update(dt) 
 
+        if ws_commands_this_tick:
+            sandbox_utils.send_transformed_joystick_batch_ws(
+                ws_commands_this_tick,
+                new_vision_frame=latest_payload_from_thread is not None,
+                capture_ts=self.control_capture_ts
+            )
+
         if self.ball:
-            if not (latest_payload_from_thread and latest_payload_from_thread.get('ball_sim_pos') is not None):
+            if ball_state is None:
                 self.ball.update(dt) 
 
         for p_entity in self.players + ([self.ball] if self.ball else []):
@@ -1283,6 +1628,7 @@ class Game:
         global stop_apriltag_thread, apriltag_thread
         is_running = True
         print("GAME LOOP: Started.")
+        last_latency_report = time.perf_counter()
         try:
             while is_running:
                 dt = min(self.clock.tick(CFG["FPS"])/1000.0, 0.1) 
@@ -1296,10 +1642,14 @@ class Game:
                         self.score = {'A':0,'B':0} 
                         self.last_goal_time_ms = 0 
                         self.game_active = False 
+                    if event.type == pygame.KEYDOWN and event.key == pygame.K_n and hasattr(camera_capture_at, 'step'):
+                        # replay in step mode: next frame
+                        camera_capture_at.step()
 
                 self.handle_human_input() 
                 self.update_game_state(dt)
                 self.render_all()
+                last_latency_report = latency_trace.report(last_latency_report)
         finally:
             print("GAME LOOP: Exiting. Signaling AprilTag thread to stop...")
             stop_apriltag_thread.set()
@@ -1320,6 +1670,9 @@ class Game:
                     print(f"ULTIMATE_SIM: EXCEPTION during Sandbox WebSocket Client shutdown: {e_ws_shutdown}")
                     traceback.print_exc()
 
+            # after the WS client stopped, so the last ws_sent samples are in
+            latency_trace.dump(extra={'command_scheduler': sandbox_utils.get_command_scheduler_stats()})
+
             if pygame.get_init(): 
                 pygame.quit()
                 print("GAME LOOP: Pygame quit successfully.")
@@ -0,0 +1,280 @@
+# Copyright (c) 2025 Oguzhan Cagirir (OguzhanCOG), KCL Electronics Society
+#
+# Project: KCL FoAI RoboFootball System
+# File: roi_tracking.py
+# Description: Region-of-interest tracking for the vision loop: robot tags and the ball are searched for only around where they are expected to be.
+#
+# Author: Oguzhan Cagirir (OguzhanCOG)
+# Date: May 24, 2025
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the MIT License as published by
+# the Open Source Initiative.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# MIT License for more details.
+#
+# You should have received a copy of the MIT License
+# along with this program. If not, see <https://opensource.org/licenses/MIT>.
+#
+# --- Version: 1.1.0 ---
+
+import time
+
+import numpy as np
+
+# ROI half-size = max(TAG_ROI_MIN_HALF_PX, tag edge * TAG_ROI_SIZE_FACTOR) + predicted motion slack
+TAG_ROI_SIZE_FACTOR = 1.5
+TAG_ROI_MIN_HALF_PX = 40
+# how much of the distance the tag could move since it was last seen is added as slack
+TAG_ROI_VELOCITY_SLACK = 1.5
+# every missed frame grows the ROI by this much of the tag edge, until the track times out
+TAG_ROI_MISS_GROWTH = 0.5
+TAG_TRACK_TIMEOUT_SECONDS = 0.5
+# full-frame scan every N frames even if every tag is tracked, so a robot that was picked up elsewhere is found
+TAG_FULL_SCAN_INTERVAL_FRAMES = 30
+# a tracked tag that isn't in its ROI triggers a full scan, but at most every N frames
+TAG_LOST_RESCAN_MIN_FRAMES = 3
+# velocity estimate: exponential smoothing weight of the newest measurement
+TAG_VELOCITY_SMOOTHING = 0.6
+
+# ball: first window half-size; doubled after every miss within a frame until it covers the whole frame
+BALL_ROI_HALF_PX = 48
+BALL_ROI_VELOCITY_SLACK = 1.5
+BALL_ROI_GROWTH = 2.0
+# a window bigger than this fraction of the frame is not worth cropping, search the whole frame instead
+BALL_ROI_MAX_FRAME_FRACTION = 0.25
+BALL_TRACK_TIMEOUT_SECONDS = 0.5
+
+class _Track:
+    __slots__ = ('center', 'velocity', 'last_seen_ts', 'size_px', 'misses')
+
+    def __init__(self, center, size_px, timestamp):
+        self.center = center
+        self.velocity = np.zeros(2)
+        self.last_seen_ts = timestamp
+        self.size_px = size_px
+        self.misses = 0
+
+    def predict(self, timestamp):
+        return self.center + self.velocity * (timestamp - self.last_seen_ts)
+
+    def update(self, center, size_px, timestamp):
+        dt = timestamp - self.last_seen_ts
+        if dt > 1e-4:
+            measured = (center - self.center) / dt
+            self.velocity = TAG_VELOCITY_SMOOTHING * measured + (1.0 - TAG_VELOCITY_SMOOTHING) * self.velocity
+        self.center = center
+        self.size_px = size_px
+        self.last_seen_ts = timestamp
+        self.misses = 0
+
+def _edge_px(corners):
+    return float(np.max(np.linalg.norm(corners - np.roll(corners, 1, axis=0), axis=1)))
+
+def _window(center, half, frame_w, frame_h):
+    x0, y0 = int(max(0, center[0] - half)), int(max(0, center[1] - half))
+    x1, y1 = int(min(frame_w, center[0] + half + 1)), int(min(frame_h, center[1] + half + 1))
+    return x0, y0, x1, y1
+
+class TagRoiTracker:
+    """Wraps a pupil_apriltags detector so each frame only scans crops around the tracked tags.
+
+    Each tag in tag_ids is tracked by its pixel centre, velocity and size. A frame is scanned
+    in full when nothing is tracked, every TAG_FULL_SCAN_INTERVAL_FRAMES frames, or when a
+    tracked tag was missed in its ROI. Full scans can use a separate, decimated detector
+    (quad_decimate only affects quad finding; decoding and corners stay at full resolution).
+
+    detect() returns pupil_apriltags Detections in full-frame coordinates, like detector.detect().
+    """
+    def __init__(self, detector, tag_ids, full_scan_detector=None):
+        self.detector = detector
+        self.full_scan_detector = full_scan_detector or detector
+        self.tag_ids = frozenset(tag_ids)
+        self.tracks = {}
+        self.frame_count = 0
+        self._last_full_scan_frame = -TAG_FULL_SCAN_INTERVAL_FRAMES
+        self.roi_scans = 0
+        self.full_scans = 0
+        self.lost_rescans = 0
+        self.roi_hits = 0
+        self.roi_misses = 0
+
+    def reset(self):
+        self.tracks.clear()
+
+    def _roi(self, track, timestamp, frame_w, frame_h):
+        center = track.predict(timestamp)
+        dt = max(0.0, timestamp - track.last_seen_ts)
+        half = max(TAG_ROI_MIN_HALF_PX, track.size_px * TAG_ROI_SIZE_FACTOR)
+        half += np.linalg.norm(track.velocity) * dt * TAG_ROI_VELOCITY_SLACK + track.misses * track.size_px * TAG_ROI_MISS_GROWTH
+        x0, y0, x1, y1 = _window(center, half, frame_w, frame_h)
+        if x1 - x0 < 8 or y1 - y0 < 8:
+            return None
+        return x0, y0, x1, y1
+
+    def _detect_crop(self, gray, roi, estimate_tag_pose, camera_params, tag_size):
+        x0, y0, x1, y1 = roi
+        crop = np.ascontiguousarray(gray[y0:y1, x0:x1])
+        crop_params = None
+        if camera_params is not None:
+            # a crop of a pinhole image is the same camera with the principal point shifted
+            fx, fy, cx, cy = camera_params
+            crop_params = (fx, fy, cx - x0, cy - y0)
+        detections = self.detector.detect(crop, estimate_tag_pose=estimate_tag_pose, camera_params=crop_params, tag_size=tag_size)
+        offset = np.array([x0, y0], dtype=np.float64)
+        for tag in detections:
+            tag.center = tag.center + offset
+            tag.corners = tag.corners + offset
+        return detections
+
+    def _full_scan_due(self, missed_tracked_tag):
+        since_full = self.frame_count - self._last_full_scan_frame
+        if not self.tracks or since_full >= TAG_FULL_SCAN_INTERVAL_FRAMES:
+            return True
+        if missed_tracked_tag and since_full >= TAG_LOST_RESCAN_MIN_FRAMES:
+            self.lost_rescans += 1
+            return True
+        return False
+
+    def detect(self, gray, timestamp=None, estimate_tag_pose=False, camera_params=None, tag_size=None):
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        frame_h, frame_w = gray.shape[:2]
+        self.frame_count += 1
+        for tag_id in [t for t, track in self.tracks.items() if timestamp - track.last_seen_ts > TAG_TRACK_TIMEOUT_SECONDS]:
+            del self.tracks[tag_id]
+
+        found = {}
+        others = []
+        missed_tracked_tag = False
+        for tag_id, track in self.tracks.items():
+            if tag_id in found:
+                continue  # already picked up in a neighbouring robot's ROI
+            roi = self._roi(track, timestamp, frame_w, frame_h)
+            if roi is None:
+                missed_tracked_tag = True; continue
+            self.roi_scans += 1
+            for tag in self._detect_crop(gray, roi, estimate_tag_pose, camera_params, tag_size):
+                if tag.tag_id in self.tag_ids:
+                    found.setdefault(tag.tag_id, tag)
+            if tag_id in found:
+                self.roi_hits += 1
+            else:
+                self.roi_misses += 1
+                missed_tracked_tag = True
+
+        if self._full_scan_due(missed_tracked_tag):
+            self.full_scans += 1
+            self._last_full_scan_frame = self.frame_count
+            for tag in self.full_scan_detector.detect(gray, estimate_tag_pose=estimate_tag_pose, camera_params=camera_params, tag_size=tag_size):
+                if tag.tag_id in self.tag_ids:
+                    found.setdefault(tag.tag_id, tag)
+                else:
+                    others.append(tag)
+
+        for tag_id, tag in found.items():
+            track = self.tracks.get(tag_id)
+            if track is None:
+                self.tracks[tag_id] = _Track(np.asarray(tag.center, dtype=np.float64), _edge_px(tag.corners), timestamp)
+            else:
+                track.update(np.asarray(tag.center, dtype=np.float64), _edge_px(tag.corners), timestamp)
+        for tag_id, track in self.tracks.items():
+            if tag_id not in found:
+                track.misses += 1
+        return list(found.values()) + others
+
+    def stats(self):
+        return {
+            'frames': self.frame_count,
+            'tracked': len(self.tracks),
+            'roi_scans': self.roi_scans,
+            'roi_hits': self.roi_hits,
+            'roi_misses': self.roi_misses,
+            'full_scans': self.full_scans,
+            'lost_rescans': self.lost_rescans,
+        }
+
+class BallRoiTracker:
+    """Searches for the ball in a window around its predicted position, growing the window on a miss.
+
+    detect_fn(bgr_image) -> (x, y) or None is the full ball detector (colour mask, morphology and the
+    area / circularity filters); it is just run on a crop. With no recent track, or once the window has
+    grown past the frame, the whole frame is searched.
+    """
+    def __init__(self):
+        self.track = None
+        self.frames = 0
+        self.window_hits = 0
+        self.grown_hits = 0
+        self.full_scans = 0
+        self.misses = 0
+        self.pixels_searched = 0
+
+    def reset(self):
+        self.track = None
+
+    def _search(self, frame, window, detect_fn):
+        x0, y0, x1, y1 = window
+        self.pixels_searched += (x1 - x0) * (y1 - y0)
+        found = detect_fn(frame[y0:y1, x0:x1])
+        if found is None:
+            return None
+        return np.array([found[0] + x0, found[1] + y0], dtype=np.float64)
+
+    def detect(self, frame, detect_fn, timestamp=None):
+        """Ball centre (x, y) in frame pixel coordinates, or None."""
+        if timestamp is None:
+            timestamp = time.perf_counter()
+        frame_h, frame_w = frame.shape[:2]
+        self.frames += 1
+        if self.track is not None and timestamp - self.track.last_seen_ts > BALL_TRACK_TIMEOUT_SECONDS:
+            self.track = None
+
+        found = None
+        full_searched = False
+        if self.track is not None:
+            center = self.track.predict(timestamp)
+            dt = max(0.0, timestamp - self.track.last_seen_ts)
+            half = BALL_ROI_HALF_PX + np.linalg.norm(self.track.velocity) * dt * BALL_ROI_VELOCITY_SLACK
+            first = True
+            while found is None:
+                window = _window(center, half, frame_w, frame_h)
+                if (window[2] - window[0]) * (window[3] - window[1]) > BALL_ROI_MAX_FRAME_FRACTION * frame_w * frame_h:
+                    window = (0, 0, frame_w, frame_h)
+                full_searched = window == (0, 0, frame_w, frame_h)
+                found = self._search(frame, window, detect_fn)
+                if found is not None:
+                    if full_searched: self.full_scans += 1
+                    elif first: self.window_hits += 1
+                    else: self.grown_hits += 1
+                if full_searched:
+                    break
+                half *= BALL_ROI_GROWTH
+                first = False
+        if found is None and not full_searched:
+            found = self._search(frame, (0, 0, frame_w, frame_h), detect_fn)
+            full_searched = True
+            if found is not None: self.full_scans += 1
+
+        if found is None:
+            self.misses += 1
+            if self.track is not None: self.track.misses += 1
+            return None
+        if self.track is None:
+            self.track = _Track(found, 0.0, timestamp)
+        else:
+            self.track.update(found, 0.0, timestamp)
+        return found[0], found[1]
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'window_hits': self.window_hits,
+            'grown_hits': self.grown_hits,
+            'full_scans': self.full_scans,
+            'misses': self.misses,
+            'kpx_per_frame': round(self.pixels_searched / max(1, self.frames) / 1000.0, 1),
+        }
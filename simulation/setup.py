@@ -19,14 +19,16 @@
 # You should have received a copy of the MIT License
 # along with this program. If not, see <https://opensource.org/licenses/MIT>.
 #
-# --- Version: 1.2.0 ---
+# --- Version: 1.5.0 ---
 
 import cv2
-import pupil_apriltags
 import numpy as np
 import time
 import os
 import glob 
+import undistort_maps
+import detector_config
+import frame_source
 
 CAMERA_INDEX = 1
 DESIRED_WIDTH = 1280
@@ -37,7 +39,7 @@ CHECKERBOARD_INTERNAL_CORNERS_HEIGHT = 6
 SQUARE_SIZE_MM = 30.0
 MIN_IMAGES_FOR_CALIBRATION = 15
 
-APRILTAG_FAMILY = "tag36h11"
+APRILTAG_FAMILY = detector_config.APRILTAG_FAMILY
 TAG_SIZE_METERS = 0.093
 
 SIM_ARENA_WIDTH_M = 2.4
@@ -58,10 +60,7 @@ CALIBRATION_DATA_FOLDER = "camera_calibration_data"
 PERSPECTIVE_MATRIX_FILE_NPZ = "perspective_transform_matrices.npz" 
 CALIBRATION_FILE_NAME_TEMPLATE = "camera_calibration_{width}x{height}.npz"
 
-DETECTOR_KWARGS = {
-    'families': APRILTAG_FAMILY, 'nthreads': 1, 'quad_decimate': 1.0,
-    'quad_sigma': 0.0, 'refine_edges': True, 'decode_sharpening': 0.25, 'debug': False
-}
+DETECTOR_KWARGS = detector_config.DETECTOR_KWARGS
 
 _printed_messages = set()
 def print_once(message_key, message_content):
@@ -141,8 +140,10 @@ def perform_camera_calibration(cap, current_width, current_height):
         else: print("ERROR: Camera calibration failed."); return None, None
     else: print("Not enough data for calibration."); return None, None
 
-def calculate_and_save_all_perspective_transforms(cap, camera_matrix, dist_coeffs, actual_width, actual_height, detector):
+def calculate_and_save_all_perspective_transforms(cap, camera_matrix, dist_coeffs, actual_width, actual_height, detector, frame_undistort_maps=None):
     """Calculates and saves BOTH M_metric_to_sim and M_pixel_to_sim."""
+    if frame_undistort_maps is None:
+        frame_undistort_maps = undistort_maps.build_undistort_maps(camera_matrix, dist_coeffs, actual_width, actual_height)
     print("\n--- Setting Up ALL Perspective Transforms ---")
     print("Looking for required corner tags:", REQUIRED_CORNER_TAG_IDS)
     print("Position all 4 corner tags, then press 's' to capture points, 'q' to skip/quit.")
@@ -157,7 +158,7 @@ def calculate_and_save_all_perspective_transforms(cap, camera_matrix, dist_coeff
         if frame.shape[1] != actual_width or frame.shape[0] != actual_height:
             print_once("pt_res_skip",f"PT: Frame res {frame.shape[1]}x{frame.shape[0]} != expected {actual_width}x{actual_height}. Skipping."); time.sleep(0.1); continue
 
-        undistorted_frame = cv2.undistort(frame, camera_matrix, dist_coeffs, None, camera_matrix)
+        undistorted_frame = undistort_maps.undistort_frame(frame, frame_undistort_maps)
         gray_frame = cv2.cvtColor(undistorted_frame, cv2.COLOR_BGR2GRAY)
         detections = detector.detect(gray_frame, True, camera_params_for_detector, TAG_SIZE_METERS)
 
@@ -238,11 +239,10 @@ def calculate_and_save_all_perspective_transforms(cap, camera_matrix, dist_coeff
 def main_setup_flow():
     if not os.path.exists(CALIBRATION_DATA_FOLDER): os.makedirs(CALIBRATION_DATA_FOLDER)
 
-    cap = cv2.VideoCapture(CAMERA_INDEX)
-    if not cap.isOpened(): print(f"FATAL: Cannot open camera {CAMERA_INDEX}"); return
-
+    # camera, or a recorded session if FOAI_REPLAY_DIR is set (see frame_source.py)
     print(f"Attempting to set initial camera resolution to: {DESIRED_WIDTH}x{DESIRED_HEIGHT}")
-    cap.set(cv2.CAP_PROP_FRAME_WIDTH, DESIRED_WIDTH); cap.set(cv2.CAP_PROP_FRAME_HEIGHT, DESIRED_HEIGHT)
+    cap = frame_source.open_frame_source(CAMERA_INDEX, DESIRED_WIDTH, DESIRED_HEIGHT)
+    if not cap.isOpened(): print(f"FATAL: Cannot open camera {CAMERA_INDEX}"); return
     time.sleep(0.5)
     actual_width, actual_height = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)), int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
     print(f"Camera operational at: {actual_width}x{actual_height}")
@@ -266,10 +266,12 @@ def main_setup_flow():
     if camera_matrix is None or dist_coeffs is None:
         print("Camera calibration failed/skipped. Cannot proceed."); cap.release(); cv2.destroyAllWindows(); return
 
+    frame_undistort_maps = undistort_maps.load_or_build_undistort_maps(current_calib_file, camera_matrix, dist_coeffs, actual_width, actual_height)
+
     final_fx, final_fy = camera_matrix[0,0], camera_matrix[1,1]
     final_cx, final_cy = camera_matrix[0,2], camera_matrix[1,2]
 
-    detector = pupil_apriltags.Detector(**DETECTOR_KWARGS)
+    detector = detector_config.create_detector()
     M_metric, M_pixel = None, None 
 
     if os.path.exists(PERSPECTIVE_MATRIX_FILE_NPZ) and get_user_choice(f"Found '{PERSPECTIVE_MATRIX_FILE_NPZ}'. Use it?", default_yes=True):
@@ -285,7 +287,7 @@ def main_setup_flow():
         except Exception as e: print(f"Error loading '{PERSPECTIVE_MATRIX_FILE_NPZ}': {e}. Will calculate new ones.")
 
     if M_metric is None or M_pixel is None: 
-        M_metric, M_pixel = calculate_and_save_all_perspective_transforms(cap, camera_matrix, dist_coeffs, actual_width, actual_height, detector)
+        M_metric, M_pixel = calculate_and_save_all_perspective_transforms(cap, camera_matrix, dist_coeffs, actual_width, actual_height, detector, frame_undistort_maps)
 
     if M_metric is None or M_pixel is None: print("Perspective transform calculation failed/skipped.")
     else:
@@ -303,7 +305,7 @@ def main_setup_flow():
                 ret, frame = cap.read()
                 if not ret: break
                 if frame.shape[1]!=actual_width or frame.shape[0]!=actual_height: continue
-                undistorted = cv2.undistort(frame,camera_matrix,dist_coeffs,None,camera_matrix)
+                undistorted = undistort_maps.undistort_frame(frame,frame_undistort_maps)
                 gray = cv2.cvtColor(undistorted,cv2.COLOR_BGR2GRAY)
                 detections = detector.detect(gray,True,test_cam_params,TAG_SIZE_METERS)
                 vis = undistorted.copy()
@@ -0,0 +1,160 @@
+# Copyright (c) 2025 Oguzhan Cagirir (OguzhanCOG), KCL Electronics Society
+#
+# Project: KCL FoAI RoboFootball System
+# File: state_estimator.py
+# Description: Constant-velocity Kalman filters for the robots and the ball, fed with time-stamped vision detections.
+#
+# Author: Oguzhan Cagirir (OguzhanCOG)
+# Date: May 24, 2025
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the MIT License as published by
+# the Open Source Initiative.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# MIT License for more details.
+#
+# You should have received a copy of the MIT License
+# along with this program. If not, see <https://opensource.org/licenses/MIT>.
+#
+# --- Version: 1.0.1 ---
+#
+# Timestamps are time.perf_counter() seconds: the capture_ts the vision loop stamps on each payload for
+# measurements, the game tick's own perf_counter() for queries. perf_counter is a system-wide monotonic clock,
+# so this also holds for payloads from the vision worker processes.
+
+import collections
+
+import numpy as np
+
+# white-noise acceleration (m/s^2, 1 sigma) and measurement noise (m, 1 sigma)
+ROBOT_ACCEL_SIGMA = 3.0
+BALL_ACCEL_SIGMA = 8.0
+POSITION_MEAS_SIGMA = 0.01
+# initial velocity uncertainty (m/s, 1 sigma) for a new track
+INITIAL_VEL_SIGMA = 1.0
+# heading alpha-beta gains (per update)
+HEADING_ALPHA = 0.5
+HEADING_BETA = 0.1
+# no measurement for this long -> the track is dropped
+TRACK_TIMEOUT_SECONDS = 1.0
+# extrapolate at most this far past the last measurement; beyond it the position (and heading) is held
+# and reported as standing still, so position and velocity stay consistent until the track times out
+MAX_EXTRAPOLATION_SECONDS = 0.25
+
+# pos/vel are (x, y) tuples in sim metres; cov is the 4x4 covariance of (x, y, vx, vy);
+# heading_deg / heading_rate_deg_s are None until an orientation was measured; age = seconds since the last measurement
+EstimatedState = collections.namedtuple("EstimatedState", ["pos", "vel", "cov", "heading_deg", "heading_rate_deg_s", "age"])
+
+def _wrap_deg(angle_deg):
+    return (angle_deg + 180.0) % 360.0 - 180.0
+
+class KalmanTrack2D:
+    """Constant-velocity Kalman filter on (x, y, vx, vy) with position-only measurements."""
+    def __init__(self, pos, timestamp, accel_sigma, meas_sigma=POSITION_MEAS_SIGMA):
+        self.x = np.array([pos[0], pos[1], 0.0, 0.0])
+        self.P = np.diag([meas_sigma ** 2, meas_sigma ** 2, INITIAL_VEL_SIGMA ** 2, INITIAL_VEL_SIGMA ** 2])
+        self.timestamp = timestamp
+        self.accel_sigma = accel_sigma
+        self.R = np.eye(2) * meas_sigma ** 2
+        self.heading_deg = None
+        self.heading_rate_deg_s = 0.0
+        self.heading_ts = None
+
+    def _propagate(self, dt):
+        F = np.eye(4)
+        F[0, 2] = F[1, 3] = dt
+        q = self.accel_sigma ** 2
+        dt2, dt3, dt4 = dt * dt, dt ** 3, dt ** 4
+        Q = q * np.array([[dt4 / 4, 0, dt3 / 2, 0], [0, dt4 / 4, 0, dt3 / 2],
+                          [dt3 / 2, 0, dt2, 0], [0, dt3 / 2, 0, dt2]])
+        return F @ self.x, F @ self.P @ F.T + Q
+
+    def update(self, pos, timestamp):
+        dt = timestamp - self.timestamp
+        if dt <= 0.0:
+            return False  # older than what the filter already has
+        x, P = self._propagate(dt)
+        # H = [I 0]: innovation uses the position part only
+        S = P[:2, :2] + self.R
+        K = P[:, :2] @ np.linalg.inv(S)
+        self.x = x + K @ (np.asarray(pos, dtype=np.float64) - x[:2])
+        self.P = (np.eye(4) - K @ np.hstack([np.eye(2), np.zeros((2, 2))])) @ P
+        self.timestamp = timestamp
+        return True
+
+    def update_heading(self, heading_deg, timestamp):
+        if self.heading_deg is None or self.heading_ts is None:
+            self.heading_deg, self.heading_ts = float(heading_deg), timestamp
+            return
+        dt = timestamp - self.heading_ts
+        if dt <= 0.0:
+            return
+        predicted = self.heading_deg + self.heading_rate_deg_s * dt
+        residual = _wrap_deg(heading_deg - predicted)
+        self.heading_deg = _wrap_deg(predicted + HEADING_ALPHA * residual)
+        self.heading_rate_deg_s += HEADING_BETA * residual / dt
+        self.heading_ts = timestamp
+
+    def state_at(self, timestamp):
+        age = timestamp - self.timestamp
+        dt = min(max(0.0, age), MAX_EXTRAPOLATION_SECONDS)
+        x, P = self._propagate(dt) if dt > 0.0 else (self.x, self.P)
+        vel = (x[2], x[3]) if age <= MAX_EXTRAPOLATION_SECONDS else (0.0, 0.0)
+        heading, heading_rate = None, None
+        if self.heading_deg is not None:
+            heading_age = timestamp - self.heading_ts
+            heading_dt = min(max(0.0, heading_age), MAX_EXTRAPOLATION_SECONDS)
+            heading = _wrap_deg(self.heading_deg + self.heading_rate_deg_s * heading_dt)
+            heading_rate = self.heading_rate_deg_s if heading_age <= MAX_EXTRAPOLATION_SECONDS else 0.0
+        return EstimatedState((x[0], x[1]), vel, P, heading, heading_rate, age)
+
+class ObjectStateEstimator:
+    """One KalmanTrack2D per tracked object: 'ball' and every robot tag id.
+
+    update_from_payload() feeds a vision payload in at its capture time; state_at() answers for any
+    time, e.g. the game tick, by extrapolating along the estimated velocity.
+    """
+    def __init__(self, robot_accel_sigma=ROBOT_ACCEL_SIGMA, ball_accel_sigma=BALL_ACCEL_SIGMA):
+        self.robot_accel_sigma = robot_accel_sigma
+        self.ball_accel_sigma = ball_accel_sigma
+        self.tracks = {}
+        self.updates = 0
+        self.out_of_order = 0
+
+    def _track(self, key, pos, timestamp):
+        track = self.tracks.get(key)
+        if track is None or timestamp - track.timestamp > TRACK_TIMEOUT_SECONDS:
+            accel_sigma = self.ball_accel_sigma if key == 'ball' else self.robot_accel_sigma
+            self.tracks[key] = KalmanTrack2D(pos, timestamp, accel_sigma)
+            return None
+        return track
+
+    def update_position(self, key, pos, timestamp):
+        track = self._track(key, pos, timestamp)
+        if track is None:
+            return
+        if track.update(pos, timestamp): self.updates += 1
+        else: self.out_of_order += 1
+
+    def update_heading(self, key, heading_deg, timestamp):
+        track = self.tracks.get(key)
+        if track is not None:
+            track.update_heading(heading_deg, timestamp)
+
+    def update_from_payload(self, payload, timestamp):
+        if payload.get('ball_sim_pos') is not None:
+            self.update_position('ball', payload['ball_sim_pos'], timestamp)
+        for tag_id, pos in payload.get('robot_positions', {}).items():
+            self.update_position(tag_id, pos, timestamp)
+        for tag_id, heading_deg in payload.get('robot_orientations', {}).items():
+            self.update_heading(tag_id, heading_deg, timestamp)
+
+    def state_at(self, key, timestamp):
+        """EstimatedState of key at timestamp, or None if it isn't tracked (or timed out)."""
+        track = self.tracks.get(key)
+        if track is None or timestamp - track.timestamp > TRACK_TIMEOUT_SECONDS:
+            return None
+        return track.state_at(timestamp)
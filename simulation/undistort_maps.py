@@ -0,0 +1,87 @@
+# Copyright (c) 2025 Oguzhan Cagirir (OguzhanCOG), KCL Electronics Society
+#
+# Project: KCL FoAI RoboFootball System
+# File: undistort_maps.py
+# Description: Precomputed camera undistortion remap maps, cached next to the calibration file and shared by every tool.
+#
+# Author: Oguzhan Cagirir (OguzhanCOG)
+# Date: May 24, 2025
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the MIT License as published by
+# the Open Source Initiative.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# MIT License for more details.
+#
+# You should have received a copy of the MIT License
+# along with this program. If not, see <https://opensource.org/licenses/MIT>.
+#
+# --- Version: 1.0.0 ---
+
+import os
+
+import cv2
+import numpy as np
+
+# cv2.undistort() rebuilds the distortion model for every pixel on every call. The maps only depend on the
+# calibration, so build them once with initUndistortRectifyMap and reuse them with cv2.remap().
+# CV_16SC2 + CV_16UC1 is OpenCV's fixed-point map format, noticeably faster to remap than float maps.
+UNDISTORT_MAP_TYPE = cv2.CV_16SC2
+UNDISTORT_INTERPOLATION = cv2.INTER_LINEAR
+UNDISTORT_MAPS_SUFFIX = "_undistort_maps.npz"
+
+def undistort_maps_path(calib_file_path):
+    # camera_calibration_1280x960.npz -> camera_calibration_1280x960_undistort_maps.npz
+    root, _ = os.path.splitext(calib_file_path)
+    return root + UNDISTORT_MAPS_SUFFIX
+
+def build_undistort_maps(camera_matrix, dist_coeffs, width, height):
+    # new camera matrix == camera_matrix, same as the cv2.undistort(frame, K, D, None, K) calls it replaces
+    return cv2.initUndistortRectifyMap(camera_matrix, dist_coeffs, None, camera_matrix, (width, height), UNDISTORT_MAP_TYPE)
+
+def _cache_matches(cache, camera_matrix, dist_coeffs, width, height):
+    return (int(cache['image_width']) == width and int(cache['image_height']) == height
+            and np.array_equal(cache['camera_matrix'], camera_matrix)
+            and np.array_equal(cache['dist_coeffs'], dist_coeffs))
+
+def load_or_build_undistort_maps(calib_file_path, camera_matrix, dist_coeffs, width, height):
+    """Returns (map1, map2) for cv2.remap.
+
+    Uses the cached maps next to calib_file_path if they were built from the same camera matrix,
+    distortion coefficients and resolution; otherwise builds them and rewrites the cache.
+    """
+    maps_path = undistort_maps_path(calib_file_path)
+    if os.path.exists(maps_path):
+        try:
+            with np.load(maps_path) as cache:
+                if _cache_matches(cache, camera_matrix, dist_coeffs, width, height):
+                    print(f"  Loaded undistortion maps from: {maps_path}")
+                    return cache['map1'], cache['map2']
+            print(f"  Undistortion maps in '{maps_path}' are for a different calibration/resolution. Rebuilding.")
+        except Exception as e:
+            print(f"  Could not read undistortion maps '{maps_path}': {e}. Rebuilding.")
+
+    map1, map2 = build_undistort_maps(camera_matrix, dist_coeffs, width, height)
+    try:
+        np.savez(maps_path, map1=map1, map2=map2, camera_matrix=camera_matrix, dist_coeffs=dist_coeffs,
+                 image_width=width, image_height=height)
+        print(f"  Built and cached undistortion maps: {maps_path}")
+    except OSError as e:
+        print(f"  Built undistortion maps but could not cache them to '{maps_path}': {e}")
+    return map1, map2
+
+def undistort_frame(frame, undistort_maps):
+    map1, map2 = undistort_maps
+    return cv2.remap(frame, map1, map2, UNDISTORT_INTERPOLATION)
+
+# undistortPoints' default 5 iterations leaves ~0.4 px error near the corners of a wide-angle frame; iterate to convergence.
+UNDISTORT_POINTS_CRITERIA = (cv2.TERM_CRITERIA_COUNT | cv2.TERM_CRITERIA_EPS, 30, 1e-6)
+
+def undistort_points(pixel_points, camera_matrix, dist_coeffs):
+    # raw (distorted) pixel coordinates, shape (N, 1, 2) float32 -> the same points in undistort_frame()'s image
+    if hasattr(cv2, 'undistortPointsIter'):
+        return cv2.undistortPointsIter(pixel_points, camera_matrix, dist_coeffs, None, camera_matrix, UNDISTORT_POINTS_CRITERIA)
+    return cv2.undistortPoints(pixel_points, camera_matrix, dist_coeffs, None, None, camera_matrix, UNDISTORT_POINTS_CRITERIA)
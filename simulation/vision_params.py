@@ -0,0 +1,156 @@
+# Copyright (c) 2025 Oguzhan Cagirir (OguzhanCOG), KCL Electronics Society
+#
+# Project: KCL FoAI RoboFootball System
+# File: vision_params.py
+# Description: Live ball colour / morphology parameters, shared through a watched JSON file between hsv_tuner and the running vision loop.
+#
+# Author: Oguzhan Cagirir (OguzhanCOG)
+# Date: May 24, 2025
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the MIT License as published by
+# the Open Source Initiative.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# MIT License for more details.
+#
+# You should have received a copy of the MIT License
+# along with this program. If not, see <https://opensource.org/licenses/MIT>.
+#
+# --- Version: 1.0.1 ---
+#
+# Store layout: {"version": n, "written_at": unix time, "source": "...", "params": {name: value}}.
+# Writers replace the whole file atomically (temp file + os.replace), so a reader sees the old version or the
+# new one, never half of it. Readers poll the file's mtime / size; every process (the vision thread, each
+# vision worker process) runs its own VisionParamsWatcher and applies a new version between two frames.
+#   FOAI_VISION_PARAMS=<path>   store location (default vision_params.json in the working directory)
+
+import json
+import numbers
+import os
+import tempfile
+import time
+
+VISION_PARAMS_PATH = os.environ.get("FOAI_VISION_PARAMS", "vision_params.json")
+VISION_PARAMS_POLL_SECONDS = 0.2
+
+# name -> (min, max) per element; the HSV bounds are [H, S, V] with OpenCV's H range of 0..179
+_HSV_LIMITS = ((0, 179), (0, 255), (0, 255))
+PARAM_LIMITS = {
+    'lower_yellow_hsv': _HSV_LIMITS,
+    'upper_yellow_hsv': _HSV_LIMITS,
+    'ball_morph_kernel_size': (1, 31),
+    'ball_erode_iterations': (0, 10),
+    'ball_dilate_iterations': (0, 10),
+}
+
+def _int_param(name, value):
+    # JSON numbers that are whole ints; bool is an int subclass but never a valid parameter, and a float
+    # like 21.7 is rejected rather than truncated
+    if isinstance(value, bool) or not isinstance(value, numbers.Integral):
+        raise ValueError(f"{name} must be an integer, got {value!r}")
+    return int(value)
+
+def validate_params(params):
+    """Checked copy of params (any subset of PARAM_LIMITS), raises ValueError on an unknown name or a bad value."""
+    if not isinstance(params, dict):
+        raise ValueError(f"params must be a dict, got {type(params).__name__}")
+    checked = {}
+    for name, value in params.items():
+        limits = PARAM_LIMITS.get(name)
+        if limits is None:
+            raise ValueError(f"unknown parameter '{name}'")
+        if name.endswith('_hsv'):
+            if not isinstance(value, (list, tuple)) or len(value) != 3:
+                raise ValueError(f"{name} must be [H, S, V], got {value!r}")
+            values = [_int_param(name, v) for v in value]
+            for v, (lo, hi) in zip(values, limits):
+                if not lo <= v <= hi:
+                    raise ValueError(f"{name} {values} outside {list(limits)}")
+            checked[name] = values
+        else:
+            v = _int_param(name, value)
+            if not limits[0] <= v <= limits[1]:
+                raise ValueError(f"{name} {v} outside {list(limits)}")
+            checked[name] = v
+    if 'ball_morph_kernel_size' in checked and checked['ball_morph_kernel_size'] % 2 == 0:
+        raise ValueError(f"ball_morph_kernel_size must be odd, got {checked['ball_morph_kernel_size']}")
+    lower, upper = checked.get('lower_yellow_hsv'), checked.get('upper_yellow_hsv')
+    if lower is not None and upper is not None and any(lo > hi for lo, hi in zip(lower, upper)):
+        raise ValueError(f"lower_yellow_hsv {lower} above upper_yellow_hsv {upper}")
+    return checked
+
+def read_params(path=VISION_PARAMS_PATH):
+    # (version, checked params) of the store, raises OSError / ValueError for anything unreadable or malformed
+    with open(path, "r", encoding="utf-8") as f:
+        store = json.load(f)
+    if not isinstance(store, dict):
+        raise ValueError(f"store must be a JSON object, got {type(store).__name__}")
+    return _int_param('version', store.get('version', 0)), validate_params(store.get('params', {}))
+
+def write_params(params, path=VISION_PARAMS_PATH, source=None):
+    """Validates params and atomically replaces the store with them as the next version. Returns that version."""
+    checked = validate_params(params)
+    try:
+        version, _ = read_params(path)
+    except (OSError, ValueError):
+        version = 0
+    store = {'version': version + 1, 'written_at': time.time(), 'source': source, 'params': checked}
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp_path = tempfile.mkstemp(prefix=".vision_params_", suffix=".tmp", dir=directory)
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            json.dump(store, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try: os.unlink(tmp_path)
+        except OSError: pass
+        raise
+    return store['version']
+
+class VisionParamsWatcher:
+    """poll() returns the store's params if the file changed since the last poll, else None.
+
+    The file is stat'ed at most every poll_seconds. A store that fails to parse or validate is reported
+    once and skipped; the caller keeps running on what it had.
+    """
+    def __init__(self, path=VISION_PARAMS_PATH, poll_seconds=VISION_PARAMS_POLL_SECONDS):
+        self.path = path
+        self.poll_seconds = poll_seconds
+        self.version = None
+        self.applied = 0
+        self.rejected = 0
+        self._stamp = None
+        self._next_check = 0.0
+
+    def poll(self, now=None):
+        now = time.perf_counter() if now is None else now
+        if now < self._next_check:
+            return None
+        self._next_check = now + self.poll_seconds
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return None
+        stamp = (st.st_mtime_ns, st.st_size)
+        if stamp == self._stamp:
+            return None
+        self._stamp = stamp
+        try:
+            version, params = read_params(self.path)
+        except (OSError, ValueError) as e:
+            self.rejected += 1
+            print(f"VISION_PARAMS: Ignoring '{self.path}': {e}")
+            return None
+        # a changed file is applied even if its version number isn't new: a writer that found the store
+        # unreadable starts counting again at 1
+        self.version = version
+        self.applied += 1
+        return params
+
+    def stats(self):
+        return {'path': self.path, 'version': self.version, 'applied': self.applied, 'rejected': self.rejected}
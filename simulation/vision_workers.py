@@ -0,0 +1,308 @@
+# Copyright (c) 2025 Oguzhan Cagirir (OguzhanCOG), KCL Electronics Society
+#
+# Project: KCL FoAI RoboFootball System
+# File: vision_workers.py
+# Description: Multi-process vision pipeline: capture and detection worker processes sharing frames through shared memory.
+#
+# Author: Oguzhan Cagirir (OguzhanCOG)
+# Date: May 24, 2025
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the MIT License as published by
+# the Open Source Initiative.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE. See the
+# MIT License for more details.
+#
+# You should have received a copy of the MIT License
+# along with this program. If not, see <https://opensource.org/licenses/MIT>.
+#
+# --- Version: 1.2.0 ---
+#
+# Layout:
+#   capture process  -- cv2.VideoCapture.read() straight into a free slot of the frame ring
+#   N detection workers -- each claims the newest unclaimed frame, runs main.process_vision_frame() on a
+#                          zero-copy view of the slot and sends the small update payload back on a queue
+#   game process     -- VisionProcessPipeline.get_result() (collector thread in main.py) keeps the newest payload
+#
+# A slot is never written while a worker holds it or while it is the newest frame, so N workers need N + 2 slots.
+
+import multiprocessing as mp
+import os
+import queue
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+VISION_RING_EXTRA_SLOTS = 2
+VISION_CLAIM_TIMEOUT_SECONDS = 0.5
+VISION_RESULT_QUEUE_SIZE = 16
+VISION_PROCESS_JOIN_TIMEOUT_SECONDS = 3.0
+
+class SharedFrameRing:
+    """Fixed number of frame slots in one shared memory block, plus per-slot metadata.
+
+    Picklable: passing it to a child process re-attaches to the same block there, and
+    frame(slot) is a numpy view onto the shared buffer, no copies.
+    """
+    def __init__(self, slots, shape, ctx, dtype=np.uint8):
+        self.slots = slots
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.frame_bytes = int(np.prod(self.shape)) * self.dtype.itemsize
+        self._shm = shared_memory.SharedMemory(create=True, size=self.frame_bytes * slots)
+        self.name = self._shm.name
+        self._owner = True
+        self._frames = np.ndarray((slots, *self.shape), self.dtype, buffer=self._shm.buf)
+        # all metadata is guarded by cond's lock
+        self.cond = ctx.Condition()
+        self.slot_frame_index = ctx.RawArray('q', [-1] * slots)
+        self.slot_capture_ts = ctx.RawArray('d', [0.0] * slots)
+        self.slot_readers = ctx.RawArray('i', [0] * slots)
+        self.latest_slot = ctx.RawValue('i', -1)
+        self.last_claimed_index = ctx.RawValue('q', -1)
+        self.stopped = ctx.RawValue('b', 0)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_shm'], state['_frames']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._owner = False
+        # spawned children share the parent's resource tracker, so attaching here doesn't take ownership;
+        # only the creating process unlinks the block in close()
+        self._shm = shared_memory.SharedMemory(name=self.name)
+        self._frames = np.ndarray((self.slots, *self.shape), self.dtype, buffer=self._shm.buf)
+
+    def frame(self, slot):
+        return self._frames[slot]
+
+    def acquire_write_slot(self):
+        # single writer: any slot that is neither the newest frame nor held by a worker
+        with self.cond:
+            for slot in range(self.slots):
+                if slot != self.latest_slot.value and self.slot_readers[slot] == 0:
+                    return slot
+        return None
+
+    def publish(self, slot, frame_index, capture_ts):
+        with self.cond:
+            self.slot_frame_index[slot] = frame_index
+            self.slot_capture_ts[slot] = capture_ts
+            self.latest_slot.value = slot
+            self.cond.notify_all()
+
+    def claim_latest(self, timeout=VISION_CLAIM_TIMEOUT_SECONDS):
+        """(slot, frame_index, capture_ts) of the newest frame no other worker has taken, or None."""
+        def ready():
+            slot = self.latest_slot.value
+            return self.stopped.value or (slot >= 0 and self.slot_frame_index[slot] > self.last_claimed_index.value)
+        with self.cond:
+            if not self.cond.wait_for(ready, timeout) or self.stopped.value:
+                return None
+            slot = self.latest_slot.value
+            self.slot_readers[slot] += 1
+            self.last_claimed_index.value = self.slot_frame_index[slot]
+            return slot, self.slot_frame_index[slot], self.slot_capture_ts[slot]
+
+    def release(self, slot):
+        with self.cond:
+            self.slot_readers[slot] -= 1
+
+    def stop(self):
+        with self.cond:
+            self.stopped.value = 1
+            self.cond.notify_all()
+
+    def close(self):
+        self._frames = None
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+def _capture_process_main(ring, camera_index, width, height, stats, calibration_files=()):
+    import cv2
+    import frame_source
+    # camera, or the FOAI_REPLAY_DIR recording; the environment is inherited from the game process
+    cap = frame_source.open_frame_source(camera_index, width, height, calibration_files=calibration_files)
+    if not cap.isOpened():
+        print(f"VISION_CAPTURE: Cannot open camera {camera_index}.")
+        ring.stop(); return
+    cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+    print(f"VISION_CAPTURE: Camera {camera_index} opened at {int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))}x{int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))}.")
+    warned_shape = False
+    frame_index = 0
+    try:
+        while not ring.stopped.value:
+            slot = ring.acquire_write_slot()
+            if slot is None:
+                time.sleep(0.001); continue
+            target = ring.frame(slot)
+            ret, image = cap.read(target)
+            capture_ts = time.perf_counter()
+            if not ret:
+                stats['read_failures'] += 1
+                time.sleep(0.05); continue
+            if image.shape != target.shape:
+                if not warned_shape:
+                    print(f"VISION_CAPTURE: Frame shape {image.shape} != ring shape {target.shape}. Skipping frames.")
+                    warned_shape = True
+                continue
+            if not np.shares_memory(image, target):
+                np.copyto(target, image)
+            ring.publish(slot, frame_index, capture_ts)
+            stats['captured'] += 1
+            frame_index += 1
+    finally:
+        cap.release()
+        print("VISION_CAPTURE: Camera released.")
+
+def _detection_worker_main(ring, results, worker_params, worker_id, stats):
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    import main as vision_main
+
+    # same globals Game.__init__ sets up for the in-process vision thread
+    for name, value in worker_params['globals'].items():
+        setattr(vision_main, name, value)
+    vision_main.apriltag_detector_at = vision_main.detector_config.create_detector()
+    ball_morph_kernel = np.ones((vision_main.BALL_MORPH_KERNEL_SIZE, vision_main.BALL_MORPH_KERNEL_SIZE), np.uint8)
+    camera_matrix = vision_main.camera_matrix_at
+    cam_params = (camera_matrix[0, 0], camera_matrix[1, 1], camera_matrix[0, 2], camera_matrix[1, 2])
+    print(f"VISION_WORKER {worker_id}: Ready (pid {os.getpid()}).")
+
+    while not ring.stopped.value:
+        claim = ring.claim_latest()
+        if claim is None:
+            continue
+        slot, frame_index, capture_ts = claim
+        try:
+            # every worker watches the live parameter store itself, see vision_params.py
+            ball_morph_kernel = vision_main.poll_vision_params(ball_morph_kernel)
+            payload = vision_main.process_vision_frame(ring.frame(slot), ball_morph_kernel, cam_params, capture_ts)
+        except Exception as e:
+            print(f"VISION_WORKER {worker_id}: ERR processing frame {frame_index}: {e}")
+            continue
+        finally:
+            ring.release(slot)
+        payload['frame_index'] = frame_index
+        payload['capture_ts'] = capture_ts
+        payload['worker'] = worker_id
+        stats['processed'] += 1
+        try:
+            results.put_nowait(payload)
+        except queue.Full:
+            stats['result_overflow'] += 1
+
+class VisionProcessPipeline:
+    """Capture process + worker_count detection processes around a SharedFrameRing.
+
+    worker_params['globals'] are assigned onto main.py's module globals in every worker
+    (camera matrix, perspective matrices, undistortion maps, ...).
+    """
+    def __init__(self, camera_index, width, height, worker_params, worker_count, calibration_files=()):
+        self.camera_index = camera_index
+        # snapshotted into the session if the capture process records (FOAI_RECORD_DIR)
+        self.calibration_files = tuple(calibration_files)
+        self.width = width
+        self.height = height
+        self.worker_params = worker_params
+        self.worker_count = worker_count
+        # spawn everywhere: forking a process that already runs pygame and several threads is not safe
+        self._ctx = mp.get_context("spawn")
+        self.ring = None
+        self.results = None
+        self.processes = []
+        self._shared_stats = None
+        self.delivered = 0
+        self.stale_results = 0
+        self._last_delivered_index = -1
+
+    def start(self):
+        self.ring = SharedFrameRing(self.worker_count + VISION_RING_EXTRA_SLOTS, (self.height, self.width, 3), self._ctx)
+        self.results = self._ctx.Queue(maxsize=VISION_RESULT_QUEUE_SIZE)
+        capture_stats = self._new_stats('captured', 'read_failures')
+        self.processes = [self._ctx.Process(target=_capture_process_main, name="vision-capture", daemon=True,
+                                            args=(self.ring, self.camera_index, self.width, self.height, capture_stats, self.calibration_files))]
+        worker_stats = []
+        for worker_id in range(self.worker_count):
+            stats = self._new_stats('processed', 'result_overflow')
+            worker_stats.append(stats)
+            self.processes.append(self._ctx.Process(target=_detection_worker_main, name=f"vision-worker-{worker_id}", daemon=True,
+                                                    args=(self.ring, self.results, self.worker_params, worker_id, stats)))
+        self._shared_stats = {'capture': capture_stats, 'workers': worker_stats}
+        for process in self.processes:
+            process.start()
+        print(f"VISION_PIPELINE: Started capture + {self.worker_count} detection processes, {self.ring.slots}-slot frame ring "
+              f"({self.ring.frame_bytes * self.ring.slots / 1e6:.1f} MB shared).")
+
+    def _new_stats(self, *names):
+        return _SharedCounters(self._ctx, names)
+
+    def get_result(self, timeout=VISION_CLAIM_TIMEOUT_SECONDS):
+        """Newest payload from the workers, or None. Results older than one already delivered are dropped."""
+        try:
+            payload = self.results.get(timeout=timeout)
+        except queue.Empty:
+            return None
+        # workers finish out of order; drain whatever else is ready and keep the newest frame
+        while True:
+            try: newer = self.results.get_nowait()
+            except queue.Empty: break
+            if newer['frame_index'] > payload['frame_index']:
+                self.stale_results += 1; payload = newer
+            else:
+                self.stale_results += 1
+        if payload['frame_index'] <= self._last_delivered_index:
+            self.stale_results += 1
+            return None
+        self._last_delivered_index = payload['frame_index']
+        self.delivered += 1
+        return payload
+
+    def is_alive(self):
+        return any(process.is_alive() for process in self.processes)
+
+    def stop(self):
+        if self.ring is None:
+            return
+        print("VISION_PIPELINE: Stopping worker processes...")
+        self.ring.stop()
+        for process in self.processes:
+            process.join(timeout=VISION_PROCESS_JOIN_TIMEOUT_SECONDS)
+            if process.is_alive():
+                print(f"VISION_PIPELINE: {process.name} did not stop in time, terminating.")
+                process.terminate(); process.join(timeout=1.0)
+        print(f"VISION_PIPELINE: Stopped. {self.stats()}")
+        self.results.close()
+        self.ring.close()
+        self.ring = None
+
+    def stats(self):
+        if self._shared_stats is None:
+            return {}
+        return {
+            'capture': self._shared_stats['capture'].snapshot(),
+            'workers': [stats.snapshot() for stats in self._shared_stats['workers']],
+            'delivered': self.delivered,
+            'stale_results': self.stale_results,
+        }
+
+class _SharedCounters:
+    """A few named int counters in shared memory, incremented by one process and read by another."""
+    def __init__(self, ctx, names):
+        self._names = tuple(names)
+        self._values = ctx.RawArray('q', len(self._names))
+
+    def __getitem__(self, name):
+        return self._values[self._names.index(name)]
+
+    def __setitem__(self, name, value):
+        self._values[self._names.index(name)] = value
+
+    def snapshot(self):
+        return dict(zip(self._names, self._values))
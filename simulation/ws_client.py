@@ -19,15 +19,52 @@
 # You should have received a copy of the MIT License
 # along with this program. If not, see <https://opensource.org/licenses/MIT>.
 #
-# --- Version: 1.2.0 ---
+# --- Version: 1.7.0 ---
 
 import asyncio
+import collections
 import websockets
 import json
+import random
+import struct
 import threading
 import time
 import traceback
 
+import latency_trace
+
+# Binary joystick frame, must match api/wire.py and the ESP32 firmware:
+# type u8 | robot id u8 | seq u16 | x*100 i16 | y*100 i16 | timestamp ms u32, little-endian.
+# Batch frame: type u8 | count u8 | seq u16 | timestamp ms u32, then count x (robot id u8 | x i16 | y i16).
+# Only used when the relay accepts JOYSTICK_SUBPROTOCOL in the handshake, JSON otherwise.
+WS_BINARY_WIRE_ENABLED = True
+WS_LATENCY_SAMPLES = 1000
+# Reconnect backoff: sleep uniform(0, min(MAX, BASE * 2**failures)) between attempts ("full jitter"),
+# so a relay restart isn't hit by every client at the same instant.
+WS_RECONNECT_BASE_SECONDS = 0.05
+WS_RECONNECT_MAX_SECONDS = 2.0
+WS_CONNECT_TIMEOUT_SECONDS = 2.0
+# Failover: move on to the next relay after this many consecutive failures (connect errors and dropped links),
+# and while on a standby, try the primary again this often and switch back once it accepts a connection.
+WS_FAILOVER_AFTER_FAILURES = 3
+WS_PRIMARY_RETRY_SECONDS = 30.0
+# Commands queued while reconnecting are still sent if they are younger than this, dropped otherwise.
+WS_COMMAND_STALE_SECONDS = 0.3
+# App-level ping for RTT stats and dead-link detection.
+WS_PING_INTERVAL_SECONDS = 1.0
+WS_PING_TIMEOUT_SECONDS = 1.5
+WS_RTT_SAMPLES = 100
+JOYSTICK_SUBPROTOCOL = "foai.joystick.v1"
+MSG_JOYSTICK = 0x01
+MSG_JOYSTICK_BATCH = 0x02
+JOYSTICK_AXIS_SCALE = 100
+JOYSTICK_FRAME = struct.Struct("<BBHhhI")
+JOYSTICK_BATCH_HEADER = struct.Struct("<BBHI")
+JOYSTICK_BATCH_ENTRY = struct.Struct("<Bhh")
+
+def _to_wire_axis(value):
+    return max(-32768, min(32767, int(round(value * JOYSTICK_AXIS_SCALE))))
+
 _ws_client_printed_messages = set()
 def print_once_ws(message_key, message_content):
     global _ws_client_printed_messages
@@ -36,65 +73,207 @@ def print_once_ws(message_key, message_content):
         _ws_client_printed_messages.add(message_key)
 
 class WebSocketGameClient:
-    def __init__(self, uri):
-        self.uri = uri
+    """Sends joystick commands to one relay, reconnecting and failing over on its own thread.
+
+    uri is the primary relay, standby_uris are tried in order after it. A failed connect or a dropped link
+    is retried on the same relay; only WS_FAILOVER_AFTER_FAILURES failures in a row move the client on to
+    the next one. While connected to a standby, the primary is probed every WS_PRIMARY_RETRY_SECONDS and
+    the client hands over to it as soon as a probe connects.
+    """
+    def __init__(self, uri, standby_uris=(), name=None):
+        self.uris = [uri, *standby_uris]
+        self._uri_index = 0
+        self.name = name or uri
         self.loop = None
         self.thread = None
         self.running = False
         self.is_connected = False
-        self.command_queue = asyncio.Queue(maxsize=100)
+        self.binary_wire = False
+        self._seq = 0
+        # latest command per robot, written by the game thread, drained by the loop thread
+        self._pending_commands = {}
+        self._pending_lock = threading.Lock()
+        self._wakeup = None
+        self._stopping = None
+        self.stats = {'enqueued': 0, 'overwritten': 0, 'stale_dropped': 0, 'sent_messages': 0, 'sent_commands': 0}
+        self.send_latencies_ms = collections.deque(maxlen=WS_LATENCY_SAMPLES)
+        self.rtt_ms = collections.deque(maxlen=WS_RTT_SAMPLES)
+        self.connects = 0
+        self.disconnects = 0
+        self.consecutive_failures = 0
+        self.failovers = 0
+        self._return_to_primary = False
+        self.last_error = None
+        self.last_connected_at = None
+        self.last_disconnected_at = None
         print(f"WS_CLIENT_INIT: Instance created for {self.uri}. Running: {self.running}, Connected: {self.is_connected}")
 
+    @property
+    def uri(self):
+        return self.uris[self._uri_index]
+
+    def _signal_threadsafe(self, event):
+        loop = self.loop
+        if loop is not None and event is not None and not loop.is_closed():
+            try: loop.call_soon_threadsafe(event.set)
+            except RuntimeError: pass
+
+    def _signal_wakeup(self):
+        self._signal_threadsafe(self._wakeup)
+
+    def _take_pending_commands(self):
+        with self._pending_lock:
+            pending, self._pending_commands = self._pending_commands, {}
+        cutoff = time.perf_counter() - WS_COMMAND_STALE_SECONDS
+        fresh = {userid: cmd for userid, cmd in pending.items() if cmd[3] >= cutoff}
+        self.stats['stale_dropped'] += len(pending) - len(fresh)
+        return fresh
+
+    def _restore_pending_commands(self, pending):
+        # puts back commands a failed send took; a newer command queued meanwhile for the same robot wins
+        if not pending: return
+        with self._pending_lock:
+            for userid, cmd in pending.items():
+                self._pending_commands.setdefault(userid, cmd)
+
+    def _reconnect_delay(self):
+        return random.uniform(0, min(WS_RECONNECT_MAX_SECONDS, WS_RECONNECT_BASE_SECONDS * (2 ** self.consecutive_failures)))
+
+    def _record_failure(self, error):
+        self.consecutive_failures += 1
+        self.last_error = str(error)
+        if len(self.uris) > 1 and self.consecutive_failures % WS_FAILOVER_AFTER_FAILURES == 0:
+            self._uri_index = (self._uri_index + 1) % len(self.uris)
+            self.failovers += 1
+
+    def _payload_from_pending(self, pending):
+        if len(pending) == 1:
+            (userid, (x, y, ts_ms, _, _)), = pending.items()
+            return {"type": "joystick", "userid": userid, "joystick": {'x': x, 'y': y}, "ts_ms": ts_ms}
+        return {"type": "joystick_batch", "ts_ms": min(cmd[2] for cmd in pending.values()),
+                "commands": [{"userid": userid, "joystick": {'x': x, 'y': y}}
+                             for userid, (x, y, _, _, _) in pending.items()]}
+
+    async def _watch_connection_closed(self, connection):
+        await connection.wait_closed()
+        self.is_connected = False
+        self._wakeup.set()
+
+    async def _ping_loop(self, connection):
+        while True:
+            await asyncio.sleep(WS_PING_INTERVAL_SECONDS)
+            sent_at = time.perf_counter()
+            try:
+                pong_waiter = await connection.ping()
+                await asyncio.wait_for(pong_waiter, WS_PING_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                print(f"WS_CLIENT_THREAD: No pong from {self.uri} within {WS_PING_TIMEOUT_SECONDS}s. Dropping connection.")
+                self.last_error = "ping timeout"
+                await connection.close()
+                return
+            except websockets.exceptions.ConnectionClosed:
+                return
+            self.rtt_ms.append((time.perf_counter() - sent_at) * 1000.0)
+
+    async def _primary_probe_loop(self, connection):
+        # runs while connected to a standby; a probe that connects to the primary ends the standby link
+        subprotocols = [JOYSTICK_SUBPROTOCOL] if WS_BINARY_WIRE_ENABLED else None
+        while True:
+            await asyncio.sleep(WS_PRIMARY_RETRY_SECONDS)
+            try:
+                probe = await asyncio.wait_for(websockets.connect(self.uris[0], subprotocols=subprotocols, ping_interval=None),
+                                               timeout=WS_CONNECT_TIMEOUT_SECONDS)
+            except Exception:
+                continue
+            try: await probe.close()
+            except Exception: pass
+            print(f"WS_CLIENT_THREAD: Primary {self.uris[0]} is reachable again. Leaving standby {self.uri}.")
+            self._return_to_primary = True
+            await connection.close()
+            return
+
     async def _connect_and_send_loop(self):
         print("WS_CLIENT_THREAD: _connect_and_send_loop started.")
+        self._wakeup = asyncio.Event()
+        self._stopping = asyncio.Event()
         while self.running:
             connection = None
+            closed_watcher = None
+            pinger = None
+            primary_prober = None
             self.is_connected = False
 
             try:
                 print(f"WS_CLIENT_THREAD: Attempting to connect to {self.uri}...")
-                connection = await asyncio.wait_for(websockets.connect(self.uri), timeout=5.0)
-                print(f"WS_CLIENT_THREAD: Successfully connected to WebSocket: {self.uri}")
+                subprotocols = [JOYSTICK_SUBPROTOCOL] if WS_BINARY_WIRE_ENABLED else None
+                connection = await asyncio.wait_for(websockets.connect(self.uri, subprotocols=subprotocols, ping_interval=None),
+                                                    timeout=WS_CONNECT_TIMEOUT_SECONDS)
+                self.binary_wire = connection.subprotocol == JOYSTICK_SUBPROTOCOL
+                print(f"WS_CLIENT_THREAD: Successfully connected to WebSocket: {self.uri} (wire: {'binary' if self.binary_wire else 'json'})")
                 self.is_connected = True
+                self.connects += 1
+                self.consecutive_failures = 0
+                self.last_connected_at = time.time()
+                closed_watcher = asyncio.create_task(self._watch_connection_closed(connection))
+                pinger = asyncio.create_task(self._ping_loop(connection))
+                if self._uri_index != 0:
+                    primary_prober = asyncio.create_task(self._primary_probe_loop(connection))
+                # commands queued while reconnecting go out straight away (stale ones are dropped on take)
+                self._wakeup.set()
 
                 while self.running and self.is_connected:
+                    pending = None
                     try:
-                        command_payload = await asyncio.wait_for(self.command_queue.get(), timeout=0.1)
-                        if command_payload is None:
-                            print("WS_CLIENT_THREAD: Got None shutdown signal from queue.")
-                            self.is_connected = False
-                            if not self.running:
-                                self.command_queue.task_done()
-                                print("WS_CLIENT_THREAD: Shutdown signal processed, exiting inner send loop.")
-                                return
-                            else:
-                                print("WS_CLIENT_THREAD: Got None from queue but still running? Breaking inner loop.")
-                                self.command_queue.task_done()
-                                break
-                        if command_payload:
-                            await connection.send(json.dumps(command_payload))
-                            self.command_queue.task_done()
-                    except asyncio.TimeoutError:
-                        continue
+                        # no timeout: woken by a new command, stop(), or the connection closing
+                        await self._wakeup.wait()
+                        self._wakeup.clear()
+                        # woken by the close watcher: leave the commands queued for the next connection
+                        if not self.is_connected: break
+                        pending = self._take_pending_commands()
+                        if not pending: continue
+                        await connection.send(self._encode(self._payload_from_pending(pending)))
+                        sent_at = time.perf_counter()
+                        self.stats['sent_messages'] += 1
+                        self.stats['sent_commands'] += len(pending)
+                        for cmd in pending.values():
+                            self.send_latencies_ms.append((sent_at - cmd[3]) * 1000.0)
+                            latency_trace.record('ws_sent', cmd[4], sent_at)
                     except websockets.exceptions.ConnectionClosedOK:
                         print("WS_CLIENT_THREAD: WebSocket connection closed normally (OK).")
+                        self._restore_pending_commands(pending)
                         self.is_connected = False; break
                     except websockets.exceptions.ConnectionClosedError as e:
                         print(f"WS_CLIENT_THREAD: WebSocket connection closed with error: {e}.")
+                        self._restore_pending_commands(pending)
                         self.is_connected = False; break
                     except Exception as e_inner:
                         print(f"WS_CLIENT_THREAD: Error in WebSocket send_loop (inner): {e_inner}")
 
                         await asyncio.sleep(0.1)
                 if not self.running: print("WS_CLIENT_THREAD: self.running is False, breaking outer connection loop."); break
-            except asyncio.TimeoutError: print(f"WS_CLIENT_THREAD: WebSocket connection to {self.uri} timed out. Will retry.")
+                print("WS_CLIENT_THREAD: Connection lost. Will retry.")
+                self.disconnects += 1
+                self.last_disconnected_at = time.time()
+                if self._return_to_primary:
+                    self._return_to_primary = False
+                    self._uri_index = 0
+                else:
+                    self._record_failure("connection lost")
+            except asyncio.TimeoutError:
+                print(f"WS_CLIENT_THREAD: WebSocket connection to {self.uri} timed out. Will retry.")
+                self._record_failure("connect timeout")
             except (websockets.exceptions.InvalidURI, websockets.exceptions.InvalidHandshake, ConnectionRefusedError, OSError) as e_conn_protocol:
                 print(f"WS_CLIENT_THREAD: WebSocket connection/protocol error (outer): {e_conn_protocol}. Will retry.")
+                self._record_failure(e_conn_protocol)
             except Exception as e_outer:
                 print(f"WS_CLIENT_THREAD: Unexpected WebSocket error in _connect_and_send_loop (outer): {e_outer}"); traceback.print_exc() 
+                self._record_failure(e_outer)
             finally:
 
                 self.is_connected = False
+                if closed_watcher: closed_watcher.cancel()
+                if pinger: pinger.cancel()
+                if primary_prober: primary_prober.cancel()
                 if connection:
                     try:
 
@@ -103,11 +282,12 @@ class WebSocketGameClient:
                 connection = None
             if not self.running: print("WS_CLIENT_THREAD: self.running is False after outer 'finally', exiting _connect_and_send_loop."); break
             if self.running:
-
+                delay = self._reconnect_delay()
+                print(f"WS_CLIENT_THREAD: Reconnecting to {self.uri} in {delay * 1000:.0f} ms (failures: {self.consecutive_failures}).")
                 try:
-                    for _ in range(50):
-                        if not self.running: break
-                        await asyncio.sleep(0.1)
+                    await asyncio.wait_for(self._stopping.wait(), delay)
+                    print("WS_CLIENT_THREAD: Sleep interrupted for shutdown."); break
+                except asyncio.TimeoutError: pass
                 except asyncio.CancelledError: print("WS_CLIENT_THREAD: Sleep interrupted for shutdown."); break
         print("WS_CLIENT_THREAD: _connect_and_send_loop finished."); self.is_connected = False
 
@@ -121,10 +301,8 @@ class WebSocketGameClient:
             self.loop.run_until_complete(self._connect_and_send_loop())
         except Exception as e: print(f"WS_CLIENT: Error running WebSocket event loop: {e}"); traceback.print_exc()
         finally:
-            print("WS_CLIENT: _run_event_loop 'finally'. Cleaning queue...")
-            while not self.command_queue.empty():
-                try: self.command_queue.get_nowait(); self.command_queue.task_done()
-                except: break 
+            print("WS_CLIENT: _run_event_loop 'finally'. Dropping pending commands...")
+            self._take_pending_commands()
             if self.loop and self.loop.is_running():
                 print("WS_CLIENT: Stopping asyncio event loop from _run_event_loop finally...")
                 self.loop.call_soon_threadsafe(self.loop.stop)
@@ -165,12 +343,10 @@ class WebSocketGameClient:
         self.is_connected = False
 
         if self.loop and self.loop.is_running(): 
-            print("WS_CLIENT: Queuing shutdown signal (None) to command_queue...")
-            future = asyncio.run_coroutine_threadsafe(self.command_queue.put(None), self.loop)
-            try: future.result(timeout=1.0); print("WS_CLIENT: Shutdown signal queued successfully.")
-            except TimeoutError: print("WS_CLIENT: Timeout putting shutdown signal on queue.")
-            except Exception as e: print(f"WS_CLIENT: Exception putting shutdown signal: {e}")
-        else: print("WS_CLIENT: Event loop not available/running for queuing shutdown signal.")
+            print("WS_CLIENT: Waking send loop for shutdown...")
+            self._signal_threadsafe(self._stopping)
+            self._signal_wakeup()
+        else: print("WS_CLIENT: Event loop not available/running for shutdown wakeup.")
 
         if self.thread and self.thread.is_alive():
             print(f"WS_CLIENT: Joining client thread (timeout 7s)...")
@@ -182,20 +358,153 @@ class WebSocketGameClient:
         self.loop = None
         print("WS_CLIENT: Client stop process complete.")
 
+    def _encode(self, command_payload):
+        msg_type = command_payload.get("type")
+        if not self.binary_wire or msg_type not in ("joystick", "joystick_batch"):
+            return json.dumps(command_payload)
+        self._seq = (self._seq + 1) & 0xFFFF
+        ts_ms = command_payload["ts_ms"] & 0xFFFFFFFF
+        if msg_type == "joystick":
+            joystick = command_payload["joystick"]
+            return JOYSTICK_FRAME.pack(MSG_JOYSTICK, command_payload["userid"], self._seq,
+                                       _to_wire_axis(joystick['x']), _to_wire_axis(joystick['y']), ts_ms)
+        commands = command_payload["commands"]
+        parts = [JOYSTICK_BATCH_HEADER.pack(MSG_JOYSTICK_BATCH, len(commands), self._seq, ts_ms)]
+        for command in commands:
+            joystick = command["joystick"]
+            parts.append(JOYSTICK_BATCH_ENTRY.pack(command["userid"], _to_wire_axis(joystick['x']), _to_wire_axis(joystick['y'])))
+        return b"".join(parts)
+
     def check_if_actively_connected(self):
         return self.running and self.is_connected
 
-    def send_joystick_command(self, userid: int, x: float, y: float):
-        if not self.check_if_actively_connected():
+    def can_queue_commands(self):
+        # true while running even if mid-reconnect; queued commands survive for WS_COMMAND_STALE_SECONDS
+        return self.running
 
+    def _put_commands(self, commands: dict, capture_ts=None):
+        # called from the game thread; only the newest command per robot is kept.
+        # capture_ts: perf_counter() capture time of the camera frame the commands were computed from, for latency_trace
+        ts_ms = int(time.monotonic() * 1000)
+        enqueued_at = time.perf_counter()
+        with self._pending_lock:
+            was_empty = not self._pending_commands
+            for userid, (x, y) in commands.items():
+                if userid in self._pending_commands: self.stats['overwritten'] += 1
+                self._pending_commands[userid] = (round(x,2), round(y,2), ts_ms, enqueued_at, capture_ts)
+            self.stats['enqueued'] += len(commands)
+        latency_trace.record('ws_queued', capture_ts, enqueued_at)
+        if was_empty:
+            self._signal_wakeup()
+
+    def send_joystick_command(self, userid: int, x: float, y: float, capture_ts=None):
+        if not self.can_queue_commands():
+
+            return
+        self._put_commands({userid: (x, y)}, capture_ts)
+
+    def send_joystick_batch(self, commands: dict, capture_ts=None):
+        # commands: {userid: (x, y)}. Goes out as one message with one shared timestamp.
+        if not self.can_queue_commands() or not commands:
             return
-        payload = {"type": "joystick", "userid": userid, "joystick": {'x': round(x,2), 'y': round(y,2)}}
-        try: self.command_queue.put_nowait(payload)
-        except queue.Full: 
-             print_once_ws("ws_q_full", "WS_CLIENT (send_cmd): Command queue full. Cmd dropped.")
-        except Exception as e: print_once_ws(f"ws_q_put_err_{e}", f"WS_CLIENT (send_cmd): Error on queue put: {e}")
+        self._put_commands(commands, capture_ts)
+
+    def get_send_latency_stats(self):
+        samples = sorted(self.send_latencies_ms)
+        if not samples: return {'samples': 0}
+        pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+        return {'samples': len(samples), 'p50_ms': pick(0.50), 'p95_ms': pick(0.95), 'p99_ms': pick(0.99), 'max_ms': samples[-1]}
+
+    def health(self):
+        rtt = list(self.rtt_ms)
+        return {
+            'uri': self.uri,
+            'on_primary': self._uri_index == 0,
+            'failovers': self.failovers,
+            'connected': self.check_if_actively_connected(),
+            'wire': 'binary' if self.binary_wire else 'json',
+            'connects': self.connects,
+            'disconnects': self.disconnects,
+            'consecutive_failures': self.consecutive_failures,
+            'last_error': self.last_error,
+            'last_connected_at': self.last_connected_at,
+            'last_disconnected_at': self.last_disconnected_at,
+            'rtt_last_ms': rtt[-1] if rtt else None,
+            'rtt_avg_ms': sum(rtt) / len(rtt) if rtt else None,
+            'rtt_max_ms': max(rtt) if rtt else None,
+            'pending': len(self._pending_commands),
+            **self.stats,
+        }
+
+class WebSocketClientManager:
+    """A set of WebSocketGameClients, each with its own relay connection.
+
+    Endpoints are dicts: {'name': str, 'uris': [primary, standby...], 'robot_ids': [..] or None}.
+    Commands are routed by robot id; the endpoint with robot_ids None takes every robot not claimed
+    by another one. Exposes the same send/check API as a single client.
+    """
+    def __init__(self, endpoints):
+        self.clients = {}
+        self._route = {}
+        self._default_client = None
+        for endpoint in endpoints:
+            uris = list(endpoint['uris'])
+            client = WebSocketGameClient(uris[0], standby_uris=uris[1:], name=endpoint['name'])
+            self.clients[endpoint['name']] = client
+            robot_ids = endpoint.get('robot_ids')
+            if robot_ids is None:
+                if self._default_client is None: self._default_client = client
+            else:
+                for robot_id in robot_ids: self._route[robot_id] = client
+
+    @property
+    def running(self):
+        return any(client.running for client in self.clients.values())
+
+    @property
+    def is_connected(self):
+        return any(client.is_connected for client in self.clients.values())
+
+    def client_for(self, userid):
+        return self._route.get(userid, self._default_client)
+
+    def start(self):
+        for client in self.clients.values(): client.start()
+
+    def stop(self):
+        for client in self.clients.values(): client.stop()
+
+    def check_if_actively_connected(self):
+        return any(client.check_if_actively_connected() for client in self.clients.values())
+
+    def can_queue_commands(self):
+        return any(client.can_queue_commands() for client in self.clients.values())
+
+    def send_joystick_command(self, userid: int, x: float, y: float, capture_ts=None):
+        client = self.client_for(userid)
+        if client is not None: client.send_joystick_command(userid, x, y, capture_ts)
+        else: print_once_ws(f"ws_no_route_{userid}", f"WS_CLIENT_MANAGER: No endpoint for robot {userid}. Cmd dropped.")
+
+    def send_joystick_batch(self, commands: dict, capture_ts=None):
+        by_client = {}
+        for userid, command in commands.items():
+            client = self.client_for(userid)
+            if client is None:
+                print_once_ws(f"ws_no_route_{userid}", f"WS_CLIENT_MANAGER: No endpoint for robot {userid}. Cmd dropped.")
+                continue
+            by_client.setdefault(client, {})[userid] = command
+        for client, client_commands in by_client.items():
+            client.send_joystick_batch(client_commands, capture_ts)
+
+    def health(self):
+        return {name: client.health() for name, client in self.clients.items()}
 
 WS_CLIENT_URI = "ws://89.117.63.5:8000/ws/mobilecontrol"
+WS_CLIENT_STANDBY_URIS = []
+# One entry per persistent connection. Add entries with 'robot_ids' to give a robot group its own relay.
+WS_CLIENT_ENDPOINTS = [
+    {'name': 'relay', 'uris': [WS_CLIENT_URI] + WS_CLIENT_STANDBY_URIS, 'robot_ids': None},
+]
 _ws_game_client_instance = None 
 
 def init_global_ws_client():
@@ -205,8 +514,8 @@ def init_global_ws_client():
             print("WS_CLIENT_GLOBAL: Previous client instance was stopped. Ensuring full cleanup before re-initializing.")
             _ws_game_client_instance.stop() 
             _ws_game_client_instance = None
-        print(f"WS_CLIENT_GLOBAL: Initializing WebSocket client for URI: {WS_CLIENT_URI}")
-        _ws_game_client_instance = WebSocketGameClient(WS_CLIENT_URI)
+        print(f"WS_CLIENT_GLOBAL: Initializing WebSocket client for endpoints: {[e['name'] for e in WS_CLIENT_ENDPOINTS]}")
+        _ws_game_client_instance = WebSocketClientManager(WS_CLIENT_ENDPOINTS)
         _ws_game_client_instance.start()
     else:
         print("WS_CLIENT_GLOBAL: WebSocket client already initialized and appears to be running.")
@@ -220,6 +529,7 @@ def shutdown_global_ws_client():
     if _ws_game_client_instance:
         print("WS_CLIENT_GLOBAL: Shutting down WebSocket client...")
         _ws_game_client_instance.stop()
+        print(f"WS_CLIENT_GLOBAL: Connection health at shutdown: {_ws_game_client_instance.health()}")
         _ws_game_client_instance = None
         print("WS_CLIENT_GLOBAL: Global WebSocket client instance shut down and cleared.")
     else:
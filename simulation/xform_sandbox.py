@@ -19,8 +19,8 @@
 # You should have received a copy of the MIT License
 # along with this program. If not, see <https://opensource.org/licenses/MIT>.
 #
-# --- Version: 1.1.0 ---
-
+# --- Version: 1.4.0 ---
+
 import pygame
 import math
 import numpy as np 
@@ -44,10 +44,18 @@ except ImportError:
     def shutdown_global_ws_client(): _print_once_dummy_ws("ws_dummy_shutdown", "SANDBOX_UTIL: (Dummy) shutdown_global_ws_client called.")
 
 SANDBOX_MOVEMENT_SPEED_INCREMENT = 5.0 
-WS_SEND_INTERVAL_SECONDS = 0.1       
+
+# Command scheduler: commands are flushed once per new vision frame (capped at
+# WS_CMD_MAX_FLUSH_HZ), changes below WS_CMD_CHANGE_THRESHOLD are suppressed, and
+# changes above WS_CMD_URGENT_THRESHOLD go out immediately.
+WS_CMD_ALIGN_TO_VISION_FRAMES = True
+WS_CMD_MAX_FLUSH_HZ = 30.0
+WS_CMD_CHANGE_THRESHOLD = 0.03
+WS_CMD_URGENT_THRESHOLD = 0.35
+WS_CMD_KEEPALIVE_SECONDS = 0.5
 
 g_ws_client_instance_util = None
-g_last_ws_send_times_util = {} 
+g_command_scheduler_util = None
 
 SANDBOX_BASE_ORIENTATION_VECTOR_UTIL = pygame.math.Vector2(1, 0) 
 
@@ -101,7 +109,9 @@ def shutdown_sandbox_websocket_client():
     except Exception as e:
         print(f"SANDBOX_UTIL_API: Error during WebSocket client shutdown: {e}")
     g_ws_client_instance_util = None
-    g_last_ws_send_times_util.clear()
+    if g_command_scheduler_util is not None:
+        print(f"SANDBOX_UTIL_API: Command scheduler stats: {g_command_scheduler_util.stats()}")
+        g_command_scheduler_util.reset()
 
 def calculate_joystick_from_world_target(
         current_pos_m: tuple,
@@ -138,30 +148,146 @@ def calculate_joystick_from_world_target(
 
     return joy_x_local, joy_y_local
 
+class CommandScheduler:
+    """Holds the latest joystick command per robot and decides when to send them.
+
+    submit() may be called every game tick; only the newest command per robot is
+    kept. flush() sends everything pending as one batch when a flush is due
+    (new vision frame, or the rate/keepalive timer), or straight away if any
+    robot's command moved by more than the urgent threshold. Commands that
+    barely differ from what the robot last got are suppressed.
+
+    send_batch_fn(batch, capture_ts) gets the capture time of the oldest camera
+    frame behind the batch (None if unknown), for latency_trace.
+    """
+
+    def __init__(self, send_batch_fn,
+                 align_to_vision_frames=WS_CMD_ALIGN_TO_VISION_FRAMES,
+                 max_flush_hz=WS_CMD_MAX_FLUSH_HZ,
+                 change_threshold=WS_CMD_CHANGE_THRESHOLD,
+                 urgent_threshold=WS_CMD_URGENT_THRESHOLD,
+                 keepalive_seconds=WS_CMD_KEEPALIVE_SECONDS):
+        self.send_batch_fn = send_batch_fn
+        self.align_to_vision_frames = align_to_vision_frames
+        self.min_flush_interval = 1.0 / max_flush_hz if max_flush_hz > 0 else 0.0
+        self.change_threshold = change_threshold
+        self.urgent_threshold = urgent_threshold
+        self.keepalive_seconds = keepalive_seconds
+        self.reset()
+
+    def reset(self):
+        self._pending = {}
+        self._pending_capture_ts = {}
+        self._last_sent = {}
+        self._last_sent_time = {}
+        self._last_flush_time = 0.0
+        self.sent = 0
+        self.suppressed = 0
+        self.coalesced = 0
+        self.urgent_flushes = 0
+        self.flushes = 0
+
+    def submit(self, user_id, joy_x, joy_y, capture_ts=None):
+        if user_id in self._pending:
+            self.coalesced += 1
+        self._pending[user_id] = (joy_x, joy_y)
+        self._pending_capture_ts[user_id] = capture_ts
+
+    def _change_from_last_sent(self, user_id, command):
+        last = self._last_sent.get(user_id)
+        if last is None:
+            return float('inf')
+        return max(abs(command[0] - last[0]), abs(command[1] - last[1]))
+
+    def flush(self, new_vision_frame=True, now=None):
+        if not self._pending:
+            return 0
+        now = time.monotonic() if now is None else now
+        since_flush = now - self._last_flush_time
+
+        due = since_flush >= self.min_flush_interval and (new_vision_frame or not self.align_to_vision_frames)
+        due = due or since_flush >= self.keepalive_seconds
+        urgent = any(self._change_from_last_sent(uid, cmd) >= self.urgent_threshold for uid, cmd in self._pending.items())
+        if not (due or urgent):
+            return 0
+        if urgent and not due:
+            self.urgent_flushes += 1
+
+        batch = {}
+        for user_id, command in self._pending.items():
+            stale = now - self._last_sent_time.get(user_id, 0.0) >= self.keepalive_seconds
+            if self._change_from_last_sent(user_id, command) < self.change_threshold and not stale:
+                self.suppressed += 1
+                continue
+            batch[user_id] = command
+        capture_stamps = [self._pending_capture_ts[user_id] for user_id in batch if self._pending_capture_ts.get(user_id) is not None]
+        self._pending.clear()
+        self._pending_capture_ts.clear()
+        self._last_flush_time = now
+        self.flushes += 1
+        if not batch:
+            return 0
+
+        if self.send_batch_fn(batch, min(capture_stamps) if capture_stamps else None):
+            for user_id, command in batch.items():
+                self._last_sent[user_id] = command
+                self._last_sent_time[user_id] = now
+            self.sent += len(batch)
+        return len(batch)
+
+    def stats(self):
+        return {
+            'sent': self.sent,
+            'suppressed': self.suppressed,
+            'coalesced': self.coalesced,
+            'flushes': self.flushes,
+            'urgent_flushes': self.urgent_flushes,
+        }
+
+def _send_joystick_batch_to_ws(commands_by_user_id: dict, capture_ts: float | None = None) -> bool:
+    # can_queue_commands() stays true through a relay blip; the client holds the newest command per robot until it reconnects
+    if WS_CLIENT_ENABLED and g_ws_client_instance_util and g_ws_client_instance_util.can_queue_commands():
+        try:
+            g_ws_client_instance_util.send_joystick_batch(commands_by_user_id, capture_ts)
+            return True
+        except Exception as e:
+            print_once_sb_util("ws_send_batch_err", f"SANDBOX_UTIL_API: Error sending WS command batch: {e}")
+    elif WS_CLIENT_ENABLED and g_ws_client_instance_util:
+        print_once_sb_util("ws_util_not_conn_send_batch", f"SANDBOX_UTIL_API: WS client not running. Cannot send batch for Users {sorted(commands_by_user_id)}.")
+    elif not WS_CLIENT_ENABLED:
+        print_once_sb_util("ws_util_disabled_send_batch", f"SANDBOX_UTIL_API: WS disabled. Faux batch send for Users {sorted(commands_by_user_id)}.")
+        return True
+    return False
+
+def get_command_scheduler():
+    global g_command_scheduler_util
+    if g_command_scheduler_util is None:
+        g_command_scheduler_util = CommandScheduler(_send_joystick_batch_to_ws)
+    return g_command_scheduler_util
+
+def submit_joystick_command_ws(websocket_user_id: int, joy_x: float, joy_y: float, capture_ts: float | None = None):
+    get_command_scheduler().submit(websocket_user_id, joy_x, joy_y, capture_ts)
+
+def flush_joystick_commands_ws(new_vision_frame: bool = True) -> int:
+    return get_command_scheduler().flush(new_vision_frame=new_vision_frame)
+
+def get_command_scheduler_stats() -> dict:
+    return get_command_scheduler().stats()
+
 def send_transformed_joystick_command_ws(
         websocket_user_id: int,
         joy_x: float,
         joy_y: float
     ):
-    global g_ws_client_instance_util, g_last_ws_send_times_util
-
-    current_time = time.time()
-    last_send = g_last_ws_send_times_util.get(websocket_user_id, 0)
-
-    if current_time - last_send >= WS_SEND_INTERVAL_SECONDS:
-        if WS_CLIENT_ENABLED and g_ws_client_instance_util and g_ws_client_instance_util.check_if_actively_connected():
-            try:
-                g_ws_client_instance_util.send_joystick_command(userid=websocket_user_id, x=joy_x, y=joy_y)
-                g_last_ws_send_times_util[websocket_user_id] = current_time
+    submit_joystick_command_ws(websocket_user_id, joy_x, joy_y)
+    flush_joystick_commands_ws()
 
-            except Exception as e:
-                print_once_sb_util(f"ws_send_err_{websocket_user_id}", f"SANDBOX_UTIL_API: Error sending WS command for User {websocket_user_id}: {e}")
-
-        elif WS_CLIENT_ENABLED and g_ws_client_instance_util:
-            print_once_sb_util(f"ws_util_not_conn_send_{websocket_user_id}", f"SANDBOX_UTIL_API: WS client not connected. Cannot send for User {websocket_user_id}.")
-        elif not WS_CLIENT_ENABLED:
-            print_once_sb_util(f"ws_util_disabled_send_{websocket_user_id}", f"SANDBOX_UTIL_API: WS disabled. Faux send for User {websocket_user_id}: joy_x={joy_x:.2f}, joy_y={joy_y:.2f}")
-            g_last_ws_send_times_util[websocket_user_id] = current_time 
+def send_transformed_joystick_batch_ws(commands_by_user_id: dict, new_vision_frame: bool = True, capture_ts: float | None = None):
+    # commands_by_user_id: {websocket_user_id: (joy_x, joy_y)} for every robot this tick;
+    # capture_ts: perf_counter() capture time of the camera frame they were computed from
+    for websocket_user_id, (joy_x, joy_y) in commands_by_user_id.items():
+        submit_joystick_command_ws(websocket_user_id, joy_x, joy_y, capture_ts)
+    flush_joystick_commands_ws(new_vision_frame=new_vision_frame)
 
 def calculate_orientation_from_sim_corners(
         sim_corners_m: np.ndarray, 
@@ -188,6 +314,21 @@ def calculate_orientation_from_sim_corners(
     orientation_deg = (raw_deg + 180) % 360 - 180
     return orientation_deg
 
+def calculate_orientations_from_sim_corners(
+        sim_corners_m: np.ndarray,
+        front_indices=(0,1),
+        back_indices=(3,2)
+    ) -> np.ndarray:
+    # vectorised calculate_orientation_from_sim_corners: (N, 4, 2) corners -> (N,) degrees in [-180, 180),
+    # NaN where the front and back midpoints coincide
+    c_world = np.asarray(sim_corners_m, dtype=np.float64).reshape(-1, 4, 2)
+    p_back = (c_world[:, back_indices[0]] + c_world[:, back_indices[1]]) / 2.0
+    p_front = (c_world[:, front_indices[0]] + c_world[:, front_indices[1]]) / 2.0
+    vec = p_front - p_back
+    orientation_deg = (np.degrees(np.arctan2(vec[:, 1], vec[:, 0])) + 180) % 360 - 180
+    orientation_deg[(np.abs(vec[:, 0]) < 1e-6) & (np.abs(vec[:, 1]) < 1e-6)] = np.nan
+    return orientation_deg
+
 # If __name__ == '__main__':
 #    print("xform_sandbox.py is now primarily a utility module.")
 #    print("You must re-work the standalone GUI to use integrated orientation or mock data.")